@@ -1,91 +1,33 @@
 import streamlit as st
-import geopandas as gpd
-import numpy as np
-import osmnx as ox
-from shapely.geometry import box, Polygon
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-import requests
-from requests.adapters import HTTPAdapter, Retry
-from opencage.geocoder import OpenCageGeocode
-from folium.plugins import HeatMap
-import folium
-from sklearn.cluster import KMeans
-import stackstac
-import planetary_computer
-from pystac_client import Client
-from matplotlib.patches import Patch
 import time
-import warnings
-from dotenv import load_dotenv
-import os
-
-# .env-Datei laden
-load_dotenv()
-
-# API-Key aus Umgebungsvariable lesen
-OPENCAGE_API_KEY = os.getenv("OPENCAGE_API_KEY")
+from frigis.gazetteer import get_gazetteer
+from frigis.climate import STATISTICS
+from frigis.jobs import ACTIVE, STAGES, JOB_MODE, get_job_queue
+from frigis.bundles import get_bundle_store
+from frigis.memory import memory
+import geopandas as gpd
+from frigis.pipeline import prioritaet_analysieren_und_plotten, szenario_plotten, temperatur_karte
+from frigis.priority import WEIGHTS
+from frigis.scenario import GreenScenario
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
-warnings.filterwarnings("ignore", category=UserWarning)
+# Abfrageintervall für den Job-Fortschritt (Sekunden)
+POLL_INTERVAL = 1.0
 
-# Globale Session für effiziente Requests
-session = requests.Session()
-retries = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-session.mount('https://', HTTPAdapter(max_retries=retries))
+# Schichten des Hitze-Prioritätsindex und ihre Beschriftung in der App
+PRIORITY_LABELS = {
+    "building_ratio": "Building density",
+    "dist_to_green": "Distance to green",
+    "temperature_diff": "Temperature difference",
+    "darkness": "Surface darkness",
+}
+DEFAULT_SITES = 10
 
-def geocode_to_gdf_with_fallback(location_name):
-    """Geocodierung mit OpenCageData, Fallback auf OSMnx wenn nötig"""
-    # Versuch 1: OpenCageData
-    try:
-        geocoder = OpenCageGeocode(OPENCAGE_API_KEY)
-        results = geocoder.geocode(location_name, no_annotations=1)
-        if results:
-            result = results[0]
-            
-            if 'bounds' in result:
-                bounds = result['bounds']
-                minx, miny = bounds['southwest']['lng'], bounds['southwest']['lat']
-                maxx, maxy = bounds['northeast']['lng'], bounds['northeast']['lat']
-                # GRÖSSERER Radius für erste zwei Analysen
-                center_lon = (minx + maxx) / 2
-                center_lat = (miny + maxy) / 2
-                offset = 0.008  # Erhöht von 0.006 auf 0.008 = ca. 800m Radius
-                minx, miny, maxx, maxy = center_lon - offset, center_lat - offset, center_lon + offset, center_lat + offset
-            else:
-                lat, lon = result['geometry']['lat'], result['geometry']['lng']
-                offset = 0.008  # Erhöht von 0.006 auf 0.008 = ca. 800m Radius
-                minx, miny, maxx, maxy = lon - offset, lat - offset, lon + offset, lat + offset
-            
-            polygon = Polygon([(minx, miny), (maxx, miny), (maxx, maxy), (minx, maxy)])
-            gdf = gpd.GeoDataFrame(
-                {'geometry': [polygon], 'name': [location_name]}, 
-                crs='EPSG:4326'
-            )
-            st.info("OpenCageData verwendet")
-            return gdf
-    except Exception as e:
-        st.warning(f"OpenCageData failed: {e}")
-    
-    # Versuch 2: OSMnx Fallback
-    try:
-        st.info("Fallback auf OSMnx...")
-        gdf = ox.geocode_to_gdf(location_name)
-        # Auch hier kleineres Gebiet für erste zwei Analysen
-        bounds = gdf.total_bounds
-        center_lon = (bounds[0] + bounds[2]) / 2
-        center_lat = (bounds[1] + bounds[3]) / 2
-        offset = 0.008  # Gleicher Radius wie bei OpenCageData
-        polygon = Polygon([(center_lon - offset, center_lat - offset), 
-                         (center_lon + offset, center_lat - offset), 
-                         (center_lon + offset, center_lat + offset), 
-                         (center_lon - offset, center_lat + offset)])
-        gdf = gpd.GeoDataFrame({'geometry': [polygon], 'name': [location_name]}, crs='EPSG:4326')
-        st.info("OSMnx Fallback erfolgreich (800m Radius)")
-        return gdf
-    except Exception as e:
-        st.error(f"Beide Geocoding-Services fehlgeschlagen: {e}")
-        return None
+# Was-wäre-wenn: Art der neuen Grünfläche -> Radius in Metern um den gewählten Punkt
+SCENARIO_GREENS = {
+    "Single tree": 0,
+    "Tree group (15 m)": 15,
+    "Pocket park (30 m)": 30,
+}
 
 # Seitenleiste mit Navigation
 page = st.sidebar.radio("Select Analysis or Info Page", [
@@ -829,296 +771,140 @@ elif page == "Main App":
     with col2:
         st.markdown("<h1 style='margin-bottom: 0;'>friGIS</h1>", unsafe_allow_html=True)
     
-    def load_osm_data_with_retry(polygon, tags, max_retries=3):
-        """Load OSM data with retry logic"""
-        for attempt in range(max_retries):
-            try:
-                data = ox.features_from_polygon(polygon, tags=tags)
-                return data
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    st.warning(f"OSM attempt {attempt + 1} failed, retrying...")
-                    time.sleep(2 ** attempt)  # Exponential backoff
-                else:
-                    st.error(f"OSM data could not be loaded after {max_retries} attempts: {e}")
-                    return gpd.GeoDataFrame()  # Return empty GeoDataFrame
-    
-    def gebaeudedichte_analysieren_und_plotten(grid, buildings, gebiet):
-        if buildings.empty:
-            st.warning("No building data available - using default values")
-            grid["building_ratio"] = 0.1  # Standardwert
-        else:
-            progress = st.progress(0, text="Calculating building density...")
-            intersecting_geometries = buildings.sindex
-            total = len(grid)
-            for i, cell in enumerate(grid.geometry):
-                try:
-                    possible = list(intersecting_geometries.intersection(cell.bounds))
-                    intersecting = buildings.iloc[possible][buildings.iloc[possible].intersects(cell)]
-                    grid.at[i, "building_ratio"] = intersecting.intersection(cell).area.sum() / cell.area if not intersecting.empty else 0
-                except:
-                    grid.at[i, "building_ratio"] = 0
-                if i % max(1, total // 10) == 0:
-                    progress.progress(i / total, text="Calculating building density...")
-            progress.progress(1.0, text="Building density calculated.")
-            progress.empty()
-        
-        fig, ax = plt.subplots(figsize=(8, 8))
-        grid.plot(ax=ax, column="building_ratio", cmap="Reds", legend=True,
-                  edgecolor="grey", linewidth=0.2)
-        if not buildings.empty:
-            buildings.plot(ax=ax, color="lightgrey", edgecolor="black", alpha=0.5)
-        gebiet.boundary.plot(ax=ax, color="blue", linewidth=1.5)
-        ax.set_title("1 Building Density (Red = dense)")
-        
-        # SEHR ENGER Fokus - nur das tatsächlich analysierte Grid anzeigen
-        grid_bounds = grid.total_bounds
-        margin = 15  # Sehr kleiner Rand: nur 15m um das Grid
-        ax.set_xlim(grid_bounds[0] - margin, grid_bounds[2] + margin)
-        ax.set_ylim(grid_bounds[1] - margin, grid_bounds[3] + margin)
-        ax.axis("equal")
-        plt.tight_layout()
-        return fig
+    def render_messages(messages):
+        for msg in messages:
+            getattr(st, msg["level"])(msg["text"])
 
-    def distanz_zu_gruenflaechen_analysieren_und_plotten(grid, greens, gebiet, max_dist=500):
-        if greens.empty:
-            st.warning("No green space data available - using default values")
-            grid["dist_to_green"] = max_dist
-            grid["score_distance_norm"] = 1.0
-        else:
-            progress = st.progress(0, text="Calculating distance to green areas...")
-            try:
-                greens_union = greens.geometry.union_all()
-                total = len(grid)
-                for i, geom in enumerate(grid.geometry):
-                    try:
-                        dist = greens_union.distance(geom.centroid)
-                        grid.at[i, "dist_to_green"] = dist
-                    except:
-                        grid.at[i, "dist_to_green"] = max_dist
-                    if i % max(1, total // 10) == 0:
-                        progress.progress(i / total, text="Calculating distance to green areas...")
-                grid["score_distance_norm"] = np.clip(grid["dist_to_green"] / max_dist, 0, 1)
-                progress.progress(1.0, text="Distance to green calculated.")
-                progress.empty()
-            except Exception as e:
-                st.warning(f"Error in green space analysis: {e}")
-                grid["dist_to_green"] = max_dist
-                grid["score_distance_norm"] = 1.0
-        
-        cmap = plt.cm.Reds
-        norm = mcolors.Normalize(vmin=0, vmax=1)
-        fig, ax = plt.subplots(figsize=(8, 8))
-        grid.plot(ax=ax, column="score_distance_norm", cmap=cmap, norm=norm,
-                  edgecolor="grey", linewidth=0.2, legend=True,
-                  legend_kwds={"label": "Distance to green (Red = far)"})
-        if not greens.empty:
-            greens.plot(ax=ax, color="green", alpha=0.5, edgecolor="darkgreen")
-        gebiet.boundary.plot(ax=ax, color="blue", linewidth=1.5)
-        ax.set_title("2 Distance to Green Areas")
-        
-        # SEHR ENGER Fokus - nur das tatsächlich analysierte Grid anzeigen  
-        grid_bounds = grid.total_bounds
-        margin = 15  # Sehr kleiner Rand: nur 15m um das Grid
-        ax.set_xlim(grid_bounds[0] - margin, grid_bounds[2] + margin)
-        ax.set_ylim(grid_bounds[1] - margin, grid_bounds[3] + margin)
-        ax.axis("equal")
-        plt.tight_layout()
-        return fig
+    def render_priority(store, job, result):
+        with st.expander("Adjust weights and number of sites"):
+            weights = {layer: st.slider(label, 0.0, 1.0, float(WEIGHTS.get(layer, 0.0)), 0.05,
+                                        key=f"priority_{layer}")
+                       for layer, label in PRIORITY_LABELS.items()}
+            k = st.slider("Number of sites", 1, 50, DEFAULT_SITES, key="priority_k")
+        if weights == {layer: WEIGHTS.get(layer, 0.0) for layer in PRIORITY_LABELS} and k == DEFAULT_SITES:
+            st.image(result["figure_png"], use_container_width=True)
+            st.dataframe(result["sites"], hide_index=True)
+            return
+        # Neu gewichten liest nur den Grid-Speicher des Jobs, keine Stufe wird neu gerechnet
+        fig, standorte, _ = prioritaet_analysieren_und_plotten(store.load_grid(job["id"]), k=k, weights=weights)
+        if fig is None:
+            st.warning("No analysis layers available for the heat priority index.")
+            return
+        st.pyplot(fig)
+        st.dataframe(standorte.drop(columns="geometry"), hide_index=True)
 
-    def heatmap_mit_temperaturdifferenzen(ort_name, jahr=2022, radius_km=2.0, resolution_km=0.7):
-        """EXTENDED Temperature data - MORE points"""
-        geocoder = OpenCageGeocode(OPENCAGE_API_KEY)
-        try:
-            results = geocoder.geocode(ort_name, no_annotations=1)
-        except Exception as e:
-            st.error(f"Geocoding failed: {e}")
-            return None
+    def render_scenario(store, job):
+        grid_store = store.load_grid(job["id"])
+        if grid_store is None or "dist_to_green" not in grid_store:
+            return
+        with st.expander("What-if: add new trees or pocket parks"):
+            # Ein Szenario pro Job in der Session; jede Änderung aktualisiert nur die Zellen im Umkreis
+            szenarien = st.session_state.setdefault("scenarios", {})
+            if job["id"] not in szenarien:
+                szenarien[job["id"]] = GreenScenario.from_store(grid_store)
+            szenario = szenarien[job["id"]]
+
+            mitte = gpd.GeoSeries([szenario.points[len(szenario.points) // 2]],
+                                  crs=grid_store.crs).to_crs("EPSG:4326").iloc[0]
+            col_lat, col_lon, col_art = st.columns(3)
+            lat = col_lat.number_input("Latitude", value=round(mitte.y, 5), format="%.5f", key="scenario_lat")
+            lon = col_lon.number_input("Longitude", value=round(mitte.x, 5), format="%.5f", key="scenario_lon")
+            art = col_art.selectbox("Type", list(SCENARIO_GREENS), key="scenario_type")
+
+            col_add, col_sites, col_undo, col_reset = st.columns(4)
+            if col_add.button("Add", key="scenario_add"):
+                punkt = gpd.GeoSeries.from_xy([lon], [lat], crs="EPSG:4326").to_crs(grid_store.crs).iloc[0]
+                szenario.add(punkt.buffer(SCENARIO_GREENS[art]) if SCENARIO_GREENS[art] else punkt)
+            sites = store.load_result(job["id"], "priority") if store.has_result(job["id"], "priority") else None
+            if col_sites.button("Plant top sites", key="scenario_sites",
+                                disabled=sites is None or "sites" not in sites):
+                # Stapel: alle Standorte der Prioritätsanalyse als ein Schritt
+                standorte = gpd.GeoSeries.from_xy(sites["sites"]["lon"], sites["sites"]["lat"],
+                                                  crs="EPSG:4326").to_crs(grid_store.crs)
+                szenario.add(list(standorte.buffer(SCENARIO_GREENS[art]) if SCENARIO_GREENS[art] else standorte))
+            if col_undo.button("Undo", key="scenario_undo", disabled=not len(szenario)):
+                szenario.undo()
+            if col_reset.button("Reset", key="scenario_reset", disabled=not len(szenario)):
+                szenario.reset()
+
+            if len(szenario):
+                st.pyplot(szenario_plotten(szenario, grid_store, ui=st))
+
+    def render_stage(store, job, name, title, error_label):
+        st.subheader(title)
+        stage = job["stages"][name]
+        render_messages(stage["messages"])
+        if stage["status"] == "done":
+            result = store.load_result(job["id"], name)
+            if stage.get("partial"):
+                st.warning("Partial result: this step ran out of its time budget.")
+            if result is None:
+                return
+            if "sites" in result:
+                render_priority(store, job, result)
+                return
+            if result.get("grid_map") and job["status"] not in ("queued", "running"):
+                # Interaktiv im Browser: Ebenen, Hover-Werte und Zoom ohne Server-Rerender
+                st.components.v1.html(result["grid_map"], height=570)
+                if "figure_png" in result:
+                    with st.expander("Static figure"):
+                        st.image(result["figure_png"], use_container_width=True)
+            elif "figure_png" in result:
+                st.image(result["figure_png"], use_container_width=True)
+                if result.get("grid_map"):
+                    st.caption("The interactive map appears when the analysis has finished.")
+            if name == "distance_to_green":
+                render_scenario(store, job)
+            if result.get("table") is not None:
+                st.dataframe(result["table"], hide_index=True)
+            if "html" in result:
+                html = result["html"]
+                reihen = result.get("series")
+                if reihen is not None and reihen.years:
+                    # Jahr/Statistik wechseln: Karte lokal aus den Reihen, ohne Netzwerk
+                    col_jahr, col_stat = st.columns(2)
+                    jahre = reihen.years
+                    standard = reihen.meta["jahr"]
+                    jahr = col_jahr.selectbox("Summer", jahre, key=f"{name}_jahr",
+                                              index=jahre.index(standard) if standard in jahre else len(jahre) - 1)
+                    statistik = col_stat.selectbox("Statistic", list(STATISTICS), key=f"{name}_statistik",
+                                                   format_func=lambda k: STATISTICS[k][0])
+                    if (jahr, statistik) != (standard, "mean_max"):
+                        # Prozessweiter Cache mit Byte-Budget statt unbegrenzt in der Session
+                        cache_key = ("temperature_map", job["id"], jahr, statistik)
+                        html = memory.get(cache_key)
+                        if html is None:
+                            karte = temperatur_karte(reihen, jahr, statistik)
+                            html = karte._repr_html_() if karte else None
+                            if html:
+                                memory.put(cache_key, html, owner=job["id"])
+                if html:
+                    st.components.v1.html(html, height=600)
+                else:
+                    st.warning("No temperature data for this selection.")
+        elif stage["status"] == "running":
+            st.progress(min(stage["progress"], 1.0), text=stage["text"] or "Running...")
+        elif stage["status"] == "failed":
+            st.error(f"{error_label}: {stage['error']}")
+        elif job["status"] in ("queued", "running"):
+            st.caption("Waiting for worker...")
+
+    def render_bundle(bundle_id):
+        """Gespeichertes Bündel direkt anzeigen - keine Stufe wird ausgeführt."""
+        bundles = get_bundle_store()
+        bundle = bundles.load(bundle_id)
+        if bundle is None:
+            st.error("Shared analysis not found. It may have been removed or computed with an older version.")
+            return False
+        erstellt = time.strftime("%Y-%m-%d %H:%M", time.localtime(bundle["created"]))
+        st.info(f"Stored analysis for {bundle['params']['stadtteil']} from {erstellt}.")
+        render_messages(bundle["messages"])
+        for name, title, error_label in STAGES:
+            if name in bundle["stages"]:  # Bündel älterer Versionen kennen neue Stufen nicht
+                render_stage(bundles, bundle, name, title, error_label)
+        st.caption(f"Permalink: `?bundle={bundle_id}`")
+        return True
 
-        if not results:
-            st.warning("Location could not be found.")
-            return None
-    
-        lat0, lon0 = results[0]['geometry']['lat'], results[0]['geometry']['lng']
-        lats = np.arange(lat0 - radius_km / 111, lat0 + radius_km / 111 + 1e-6, resolution_km / 111)
-        lons = np.arange(lon0 - radius_km / 85, lon0 + radius_km / 85 + 1e-6, resolution_km / 85)
-    
-        punkt_daten = []
-        ref_temp = None
-        total_points = len(lats) * len(lons)
-        progress = st.progress(0, text=f"Loading temperature data... ({total_points} points)")
-        count = 0
-        
-        def fetch_temperature(lat, lon):
-            for _ in range(2):  # Reduziert auf 2 Versuche
-                try:
-                    url = (
-                        f"https://archive-api.open-meteo.com/v1/archive?"
-                        f"latitude={lat}&longitude={lon}"
-                        f"&start_date={jahr}-06-01&end_date={jahr}-08-31"
-                        f"&daily=temperature_2m_max&timezone=auto"
-                    )
-                    r = session.get(url, timeout=8)  # Reduziert auf 8s
-                    if r.status_code != 200:
-                        time.sleep(0.5)
-                        continue
-                    temps = r.json().get("daily", {}).get("temperature_2m_max", [])
-                    if not temps:
-                        break
-                    return lat, lon, round(np.mean(temps), 2)
-                except Exception:
-                    time.sleep(0.5)
-            return lat, lon, None
-        
-        # Optimized number of parallel temperature requests
-        coords = [(lat, lon) for lat in lats for lon in lons]
-        with ThreadPoolExecutor(max_workers=6) as executor:  # Reduziert von 8 auf 6
-            futures = [executor.submit(fetch_temperature, lat, lon) for lat, lon in coords]
-            
-            for future in as_completed(futures):
-                lat, lon, temp = future.result()
-                if temp is not None:
-                    punkt_daten.append([lat, lon, temp])
-                    
-                    if abs(lat - lat0) < resolution_km / 222 and abs(lon - lon0) < resolution_km / 170:
-                        ref_temp = temp
-                
-                count += 1
-                progress.progress(min(count / total_points, 1.0), 
-                               text=f"Loading temperature data... ({count}/{total_points})")
-    
-        progress.empty()
-    
-        if not punkt_daten:
-            st.warning("Not enough temperature data available.")
-            return None
-            
-        if ref_temp is None:
-            ref_temp = np.mean([temp for _, _, temp in punkt_daten])
-            st.info("Reference temperature estimated")
-    
-        differenzpunkte = [
-            [lat, lon, round(temp - ref_temp, 2)]
-            for lat, lon, temp in punkt_daten
-        ]
-    
-        # Enhanced Heatmap with MORE data points
-        m = folium.Map(location=[lat0, lon0], zoom_start=13, tiles="CartoDB positron")
-        HeatMap(
-            [[lat, lon, abs(diff)] for lat, lon, diff in differenzpunkte],
-            radius=22,  # Größerer Radius für bessere Sichtbarkeit
-            blur=20,    # Optimierter Blur
-            max_zoom=13,
-            gradient={0.0: "green", 0.3: "lightyellow", 0.6: "orange", 1.0: "red"}
-        ).add_to(m)
-    
-        for lat, lon, diff in differenzpunkte:
-            sign = "+" if diff > 0 else ("−" if diff < 0 else "±")
-            folium.Marker(
-                [lat, lon],
-                icon=folium.DivIcon(html=f"<div style='font-size:10pt; color:black'><b>{sign}{abs(diff):.2f}°C</b></div>")
-            ).add_to(m)
-    
-        st.success(f"{len(punkt_daten)} temperature points loaded (OPTIMIZED: {radius_km}km radius, {resolution_km}km resolution = ~{len(punkt_daten)} measurement points)!")
-        return m
-    
-    def analysiere_reflektivitaet_graustufen(stadtteil_name, n_clusters=5, year_range="2020-01-01/2024-12-31"):
-        try:
-            progress = st.progress(0, text="Satellitendaten werden gesucht...")
-            
-            gebiet = geocode_to_gdf_with_fallback(stadtteil_name)
-            if gebiet is None:
-                st.warning("Gebiet konnte nicht gefunden werden.")
-                progress.empty()
-                return None
-            
-            # VIEL größerer Radius für k-Means Satellitendaten
-            bounds = gebiet.total_bounds
-            center_lon = (bounds[0] + bounds[2]) / 2
-            center_lat = (bounds[1] + bounds[3]) / 2
-            large_offset = 0.015  # Viel größerer Radius: ca. 1.5km statt 350m
-            large_polygon = Polygon([
-                (center_lon - large_offset, center_lat - large_offset),
-                (center_lon + large_offset, center_lat - large_offset), 
-                (center_lon + large_offset, center_lat + large_offset),
-                (center_lon - large_offset, center_lat + large_offset)
-            ])
-            large_gebiet = gpd.GeoDataFrame({'geometry': [large_polygon]}, crs='EPSG:4326')
-            bbox = large_gebiet.total_bounds
-            progress.progress(0.1, text="Suche nach Sentinel-2 Daten...")
-        
-            catalog = Client.open("https://planetarycomputer.microsoft.com/api/stac/v1")
-            search = catalog.search(
-                collections=["sentinel-2-l2a"],
-                bbox=bbox.tolist(),
-                datetime=year_range,
-                query={"eo:cloud_cover": {"lt": 20}}
-            )
-            items = list(search.get_items())
-            if not items:
-                st.warning("Kein geeignetes Sentinel-2 Bild gefunden.")
-                progress.empty()
-                return None
-        
-            item = planetary_computer.sign(items[0])
-            utm_crs = gebiet.estimate_utm_crs().to_epsg()
-            progress.progress(0.4, text="Bilddaten werden geladen...")
-        
-            # VIEL bessere Auflösung für k-Means
-            stack = stackstac.stack(
-                [item],
-                assets=["B04", "B03", "B02"],
-                resolution=5,  # Deutlich verbessert von 10 auf 5
-                bounds_latlon=bbox.tolist(),
-                epsg=utm_crs
-            )
-            rgb = stack.isel(band=[0,1,2], time=0).transpose("y","x","band").values
-            rgb = np.nan_to_num(rgb)
-            rgb_scaled = np.clip((rgb / 3000) * 255, 0, 255).astype(np.uint8)
-        
-            h, w, _ = rgb_scaled.shape
-            pixels = rgb_scaled.reshape(-1, 3)
-            progress.progress(0.7, text="k-Means Clustering wird durchgeführt...")
-            kmeans = KMeans(n_clusters=n_clusters, random_state=42).fit(pixels)
-            labels = kmeans.labels_
-        
-            cluster_info = []
-            for i in range(n_clusters):
-                cluster_pixels = pixels[labels == i]
-                if len(cluster_pixels) == 0:
-                    cluster_info.append((i, 0, "Keine Daten"))
-                    continue
-                helligkeit = cluster_pixels.mean(axis=1).mean() / 255
-                beschreibung = (
-                    "Sehr hell (hohe Reflektivität)" if helligkeit > 0.75 else
-                    "Hell (moderat reflektierend)" if helligkeit > 0.5 else
-                    "Mittel (neutral)" if helligkeit > 0.35 else
-                    "Dunkel (hohes Aufheizungspotenzial)"
-                )
-                cluster_info.append((i, round(helligkeit, 2), beschreibung))
-        
-            gray_values = np.linspace(0, 255, n_clusters).astype(int)
-            gray_colors = np.stack([gray_values]*3, axis=1)
-            cluster_image = gray_colors[labels].reshape(h, w, 3).astype(np.uint8)
-        
-            fig, ax = plt.subplots(figsize=(6,6))
-            ax.imshow(cluster_image)
-            ax.axis("off")
-        
-            legend_elements = [
-                Patch(facecolor=gray_colors[i]/255, edgecolor='black',
-                      label=f"Cluster {i}: {cluster_info[i][2]} ({cluster_info[i][1]*100:.0f}%)")
-                for i in range(n_clusters)
-            ]
-            ax.legend(handles=legend_elements, loc="lower center", bbox_to_anchor=(0.5, -0.12),
-                      ncol=1, frameon=True, fontsize="small")
-            plt.tight_layout()
-            progress.empty()
-            return fig
-        except Exception as e:
-            st.error(f"Satellitendatenanalyse fehlgeschlagen: {e}")
-            return None
-    
     def main():
         st.markdown("""
             Take a look at our interactive prototype designed to demonstrate 
@@ -1135,6 +921,26 @@ elif page == "Main App":
             st.session_state.analysis_complete = False
 
         stadtteil = st.text_input("Enter district name", value="Maxvorstadt, München")
+        large_area = st.checkbox("Large-area mode (full district/city polygon, uses all CPU cores)",
+                                 disabled=st.session_state.analysis_started)
+
+        # Autocomplete aus dem lokalen Gazetteer
+        gazetteer = get_gazetteer()
+        if gazetteer is not None and stadtteil:
+            vorschlaege = gazetteer.autocomplete(stadtteil.split(",")[0])
+            if vorschlaege and stadtteil not in vorschlaege:
+                stadtteil = st.selectbox("Suggestions", [stadtteil] + vorschlaege)
+
+        # Laufenden Job nach Reload/Navigation über die URL wieder aufnehmen
+        if 'job_id' not in st.session_state:
+            st.session_state.job_id = st.query_params.get("job")
+            if st.session_state.job_id:
+                st.session_state.analysis_started = True
+        # Geteilter Permalink: gespeichertes Ergebnis-Bündel statt Job
+        if 'bundle_id' not in st.session_state:
+            st.session_state.bundle_id = st.query_params.get("bundle")
+            if st.session_state.bundle_id:
+                st.session_state.analysis_started = True
 
         # Button Logic mit Session State
         col1, col2 = st.columns([1, 1])
@@ -1142,6 +948,11 @@ elif page == "Main App":
         with col1:
             if st.button("Start Analysis", disabled=st.session_state.analysis_started):
                 if stadtteil:
+                    # Analyse als Hintergrund-Job einreichen; für dieselben Eingaben liefert
+                    # ``submit`` einen frischen fertigen Job samt Bündel-Permalink
+                    job_id = get_job_queue().submit({"stadtteil": stadtteil, "large_area": large_area})
+                    st.session_state.job_id = job_id
+                    st.query_params["job"] = job_id
                     st.session_state.analysis_started = True
                     st.session_state.analysis_complete = False
 
@@ -1150,100 +961,74 @@ elif page == "Main App":
                 if st.button("New Analysis"):
                     st.session_state.analysis_started = False
                     st.session_state.analysis_complete = False
+                    st.session_state.job_id = None
+                    st.session_state.bundle_id = None
+                    st.query_params.clear()
                     st.rerun()
 
-        # Analyse nur ausführen wenn gestartet
-        if not st.session_state.analysis_started or not stadtteil:
+        # Analyse nur anzeigen wenn gestartet
+        if not st.session_state.analysis_started:
             return
 
-        # Status anzeigen
-        if not st.session_state.analysis_complete:
-            st.info("Analysis running...")
-
-        try:
-            gebiet = geocode_to_gdf_with_fallback(stadtteil)
-            if gebiet is None:
-                st.error("Area could not be found.")
-                st.session_state.analysis_started = False
-                return
-                
-        except Exception as e:
-            st.error(f"Unexpected error: {e}")
-            st.session_state.analysis_started = False
+        if st.session_state.bundle_id:
+            gefunden = render_bundle(st.session_state.bundle_id)
+            if not st.session_state.analysis_complete:
+                st.session_state.analysis_complete = True
+                st.rerun()  # "New Analysis"-Button anzeigen
+            if gefunden:
+                st.success("Analysis completed! You can now start a new analysis.")
             return
 
-        polygon = gebiet.geometry.iloc[0]
-        utm_crs = gebiet.estimate_utm_crs()
-        gebiet = gebiet.to_crs(utm_crs)
-        area = gebiet.geometry.iloc[0].buffer(0)
-
-        # OSM data with retry logic
-        tags_buildings = {"building": True}
-        tags_green = {
-            "leisure": ["park", "garden"],
-            "landuse": ["grass", "meadow", "forest"],
-            "natural": ["wood", "tree_row", "scrub"]
-        }
-        
-        st.info("Loading OSM data...")
-        buildings = load_osm_data_with_retry(polygon, tags_buildings)
-        greens = load_osm_data_with_retry(polygon, tags_green)
-        
-        # Data cleaning
-        if not buildings.empty:
-            buildings = buildings.to_crs(utm_crs)
-            buildings = buildings[buildings.geometry.is_valid & ~buildings.geometry.is_empty]
-        if not greens.empty:
-            greens = greens.to_crs(utm_crs)
-            greens = greens[greens.geometry.is_valid & ~greens.geometry.is_empty]
+        if not st.session_state.job_id:
+            return
 
-        # Create grid - HIGHER resolution
-        cell_size = 40  # Reduced from 50 to 40 for higher resolution
-        minx, miny, maxx, maxy = area.bounds
-        grid_cells = [
-            box(x, y, x + cell_size, y + cell_size)
-            for x in np.arange(minx, maxx, cell_size)
-            for y in np.arange(miny, maxy, cell_size)
-            if box(x, y, x + cell_size, y + cell_size).intersects(area)
-        ]
-        grid = gpd.GeoDataFrame({'geometry': grid_cells}, crs=utm_crs)
+        queue = get_job_queue()
+        store = queue.store
+        job = store.load(st.session_state.job_id)
+        if job is None:
+            st.error("Analysis job not found.")
+            st.session_state.analysis_started = False
+            st.session_state.job_id = None
+            return
+        aktiv = job["status"] in ACTIVE
 
-        # Perform analyses (with error handling)
-        try:
-            st.subheader("Building Density")
-            fig1 = gebaeudedichte_analysieren_und_plotten(grid.copy(), buildings, gebiet)
-            st.pyplot(fig1)
-            plt.close(fig1)  # Memory-Management
-        except Exception as e:
-            st.error(f"Building density analysis failed: {e}")
+        # Nur dieser Teil pollt den Job-Zustand; der Script-Thread wird nicht blockiert
+        @st.fragment(run_every=POLL_INTERVAL if aktiv else None)
+        def job_view():
+            job = store.load(st.session_state.job_id)
+            if queue.resume(job["id"]):
+                job = store.load(job["id"])  # Worker abgestürzt: Job läuft ab letzter fertiger Stufe weiter
+            # Status anzeigen
+            if job["status"] == "queued":
+                st.info("Analysis queued..." if JOB_MODE != "external" else "Analysis queued, waiting for a worker...")
+            elif job["status"] == "running":
+                st.info("Analysis running...")
+            render_messages(job["messages"])
 
-        try:
-            st.subheader("Distance to Green Spaces")
-            fig2 = distanz_zu_gruenflaechen_analysieren_und_plotten(grid.copy(), greens, gebiet)
-            st.pyplot(fig2)
-            plt.close(fig2)  # Memory-Management
-        except Exception as e:
-            st.error(f"Green space analysis failed: {e}")
-
-        try:
-            st.subheader("Temperature Difference Heatmap")
-            heatmap = heatmap_mit_temperaturdifferenzen(ort_name=stadtteil)
-            if heatmap:
-                st.components.v1.html(heatmap._repr_html_(), height=600)
-        except Exception as e:
-            st.error(f"Temperature analysis failed: {e}")
+            if job["status"] == "failed":
+                st.error(job["error"] or "Analysis failed.")
+            else:
+                for name, title, error_label in STAGES:
+                    render_stage(store, job, name, title, error_label)
+            if aktiv and job["status"] not in ACTIVE:
+                st.rerun()  # ganze Seite: Abschluss, Permalink, "New Analysis"
 
-        try:
-            st.subheader("k-Means Cluster Analysis of Satellite Data")
-            fig3 = analysiere_reflektivitaet_graustufen(stadtteil, n_clusters=5)
-            if fig3:
-                st.pyplot(fig3)
-                plt.close(fig3)  # Memory-Management
-        except Exception as e:
-            st.error(f"Satellite data analysis failed: {e}")
+        job_view()
+        if aktiv:
+            return
 
         # At the end of analysis
-        st.session_state.analysis_complete = True
+        if not st.session_state.analysis_complete:
+            st.session_state.analysis_complete = True
+            if job.get("bundle"):
+                # Teilbarer Link auf das unveränderliche Ergebnis statt auf den Job
+                st.query_params.clear()
+                st.query_params["bundle"] = job["bundle"]
+            st.rerun()  # "New Analysis"-Button anzeigen
+        if job["status"] == "failed":
+            return
+        if job.get("bundle"):
+            st.caption(f"Permalink: `?bundle={job['bundle']}`")
         st.success("Analysis completed! You can now start a new analysis.")
         st.markdown("""by Philippa Kaltenbach, Samuel Wischermann, Julius Dickmann 
         \nfriGIS\nEnactus München e.V.""")
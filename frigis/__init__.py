@@ -0,0 +1 @@
+"""Hilfsmodule für die friGIS Streamlit-App (app.py)."""
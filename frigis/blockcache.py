@@ -0,0 +1,272 @@
+"""Persistenter Block-Cache unter den Range-Lesezugriffen auf entfernte COGs.
+
+GDAL liest ein COG per HTTP-Range: Header, dann genau die Kacheln, die das
+Zielfenster überdeckt. Ohne Cache wiederholt jede Analyse diese Anfragen, auch
+wenn sich die bbox mit der vorigen überschneidet. ``RemoteFile`` ist ein
+Datei-Objekt für ``rasterio.open(href, opener=...)``, das in festen Blöcken
+(``FRIGIS_BLOCK_SIZE_KB``) liest:
+
+- Schlüssel ist die Asset-URL ohne Query (SAS-Token von Planetary Computer
+  wechseln, die Datei nicht) plus Blocknummer, also der Byte-Bereich
+  ``[n * BLOCK_SIZE, (n + 1) * BLOCK_SIZE)``.
+- Die Blöcke liegen in ``blocks.dat`` unter ``FRIGIS_BLOCK_CACHE_DIR``, einer
+  Datei aus gleich großen Slots, die per ``mmap`` gelesen wird; ``index.sqlite``
+  ordnet Schlüssel -> Slot zu und merkt den letzten Zugriff.
+- Ist das Budget (``FRIGIS_BLOCK_CACHE_MB``) voll, wird der am längsten nicht
+  gelesene Block überschrieben (LRU). Eine CRC pro Block erkennt Slots, die ein
+  anderer Prozess zwischen Index-Abfrage und Lesen neu belegt hat.
+- Fehlende Blöcke werden zu zusammenhängenden Bereichen zusammengefasst und mit
+  einer Anfrage pro Bereich geholt; die Dateigröße wird ebenfalls gemerkt.
+
+Überlappende und wiederholte Satellitenanalysen lesen so fast nur von der
+lokalen Platte. Mehrere Worker-Prozesse teilen sich denselben Cache.
+"""
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlparse, urlunparse
+
+import requests
+
+BLOCK_CACHE_DIR = os.getenv("FRIGIS_BLOCK_CACHE_DIR", ".frigis_cache/blocks")
+MB = 1024 * 1024
+BLOCK_CACHE_BYTES = int(float(os.getenv("FRIGIS_BLOCK_CACHE_MB", "2048")) * MB)
+BLOCK_SIZE = int(float(os.getenv("FRIGIS_BLOCK_SIZE_KB", "256")) * 1024)
+
+
+def unsigned(href):
+    """URL ohne Query und Fragment (Signatur/Token gehören nicht zum Schlüssel)."""
+    return urlunparse(urlparse(href)._replace(query="", fragment=""))
+
+
+class BlockCache:
+    def __init__(self, root=BLOCK_CACHE_DIR, capacity=BLOCK_CACHE_BYTES, block_size=BLOCK_SIZE):
+        self.root = root
+        self.block_size = block_size
+        self.slots = max(1, capacity // block_size)
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, "index.sqlite")
+        self.data_path = os.path.join(root, "blocks.dat")
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "requests": 0, "bytes_fetched": 0}
+        with self._connect() as con:
+            con.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS blocks (
+                    key TEXT PRIMARY KEY,
+                    slot INTEGER UNIQUE,
+                    length INTEGER,
+                    crc INTEGER,
+                    used REAL
+                )""")
+            con.execute("CREATE INDEX IF NOT EXISTS blocks_used ON blocks (used)")
+            con.execute("CREATE TABLE IF NOT EXISTS files (href TEXT PRIMARY KEY, size INTEGER)")
+            layout = dict(con.execute("SELECT name, value FROM meta").fetchall())
+            if layout != {"block_size": block_size, "slots": self.slots}:
+                # Andere Blockgröße/Kapazität: Slots passen nicht mehr, Cache neu anlegen
+                con.execute("DELETE FROM blocks")
+                con.execute("DELETE FROM meta")
+                con.executemany("INSERT INTO meta VALUES (?, ?)",
+                                [("block_size", block_size), ("slots", self.slots)])
+                with open(self.data_path, "wb"):
+                    pass
+        with open(self.data_path, "r+b") as f:
+            if os.fstat(f.fileno()).st_size != self.slots * block_size:
+                f.truncate(self.slots * block_size)  # dünn besetzt: belegt nur geschriebene Blöcke
+        self._fd = os.open(self.data_path, os.O_RDWR)
+        self._map = mmap.mmap(self._fd, self.slots * block_size, access=mmap.ACCESS_READ)
+
+    def _connect(self):
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    def _count(self, **kwargs):
+        with self._lock:
+            for name, n in kwargs.items():
+                self.stats[name] += n
+
+    def file_size(self, href):
+        with self._connect() as con:
+            row = con.execute("SELECT size FROM files WHERE href = ?", (unsigned(href),)).fetchone()
+        return row[0] if row else None
+
+    def set_file_size(self, href, size):
+        with self._connect() as con:
+            con.execute("INSERT OR REPLACE INTO files VALUES (?, ?)", (unsigned(href), size))
+
+    def get(self, href, numbers):
+        """{Blocknummer: bytes} für alle gecachten Blöcke aus ``numbers``."""
+        keys = {f"{unsigned(href)}#{n}": n for n in numbers}
+        if not keys:
+            return {}
+        with self._connect() as con:
+            rows = con.execute(
+                f"SELECT key, slot, length, crc FROM blocks WHERE key IN ({','.join('?' * len(keys))})",
+                list(keys)).fetchall()
+            found = {}
+            for key, slot, length, crc in rows:
+                start = slot * self.block_size
+                data = self._map[start:start + length]
+                if zlib.crc32(data) == crc:
+                    found[keys[key]] = data
+            if found:
+                con.executemany("UPDATE blocks SET used = ? WHERE key = ?",
+                                [(time.time(), f"{unsigned(href)}#{n}") for n in found])
+        self._count(hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def put(self, href, number, data):
+        key = f"{unsigned(href)}#{number}"
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")  # Slot-Vergabe prozessübergreifend serialisiert
+            if con.execute("SELECT 1 FROM blocks WHERE key = ?", (key,)).fetchone():
+                con.rollback()
+                return
+            slot = con.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM blocks").fetchone()[0]
+            if slot >= self.slots:
+                alt, slot = con.execute("SELECT key, slot FROM blocks ORDER BY used LIMIT 1").fetchone()
+                con.execute("DELETE FROM blocks WHERE key = ?", (alt,))
+            os.pwrite(self._fd, data, slot * self.block_size)
+            con.execute("INSERT INTO blocks VALUES (?, ?, ?, ?, ?)",
+                        (key, slot, len(data), zlib.crc32(data), time.time()))
+            con.commit()
+        finally:
+            con.close()
+
+    def usage(self):
+        """Belegte Bytes im Cache."""
+        with self._connect() as con:
+            return con.execute("SELECT COALESCE(SUM(length), 0) FROM blocks").fetchone()[0]
+
+    def opener(self, session=None):
+        """Opener für ``rasterio.open(href, opener=...)``."""
+        session = session or requests.Session()
+
+        def _open(path, mode="rb"):
+            if urlparse(path).scheme not in ("http", "https"):
+                raise FileNotFoundError(path)  # rasterio prüft den Opener mit einem Dummy-Pfad
+            return RemoteFile(self, path, session)
+        return _open
+
+
+class RemoteFile:
+    """Lesbares, seekbares Datei-Objekt über HTTP-Range mit ``BlockCache`` darunter."""
+
+    def __init__(self, cache, href, session, timeout=60):
+        self.cache = cache
+        self.href = href
+        self.session = session
+        self.timeout = timeout
+        self._pos = 0
+        self._size = cache.file_size(href)
+        if self._size is None:
+            # Erster Block liefert Header und Dateigröße in einer Anfrage
+            self._fetch(0, 0)
+        self.closed = False
+
+    def _fetch(self, first, last):
+        """Blöcke ``first``..``last`` mit einer Range-Anfrage holen und ablegen."""
+        block = self.cache.block_size
+        response = self.session.get(self.href, timeout=self.timeout,
+                                    headers={"Range": f"bytes={first * block}-{(last + 1) * block - 1}"})
+        if response.status_code in (403, 404):
+            raise FileNotFoundError(unsigned(self.href))
+        response.raise_for_status()
+        data = response.content
+        self.cache._count(requests=1, bytes_fetched=len(data))
+        if response.status_code == 206:
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            offset = first * block
+        else:  # Server ignoriert Range: ganze Datei
+            total, offset = str(len(data)), 0
+        if self._size is None:
+            self._size = int(total) if total.isdigit() else None
+            if self._size is None:
+                raise OSError(f"Unknown size of {unsigned(self.href)}")
+            self.cache.set_file_size(self.href, self._size)
+        blocks = {}
+        for n in range(offset // block, -(-(offset + len(data)) // block)):
+            chunk = data[n * block - offset:(n + 1) * block - offset]
+            if n * block < self._size and (len(chunk) == block or (n + 1) * block >= self._size):
+                self.cache.put(self.href, n, chunk)
+                blocks[n] = chunk
+        return blocks
+
+    def _blocks(self, numbers):
+        numbers = sorted(set(numbers))
+        blocks = self.cache.get(self.href, numbers)
+        fehlend = [n for n in numbers if n not in blocks]
+        # zusammenhängende Lücken mit je einer Anfrage
+        while fehlend:
+            ende = 0
+            while ende + 1 < len(fehlend) and fehlend[ende + 1] == fehlend[ende] + 1:
+                ende += 1
+            geholt = self._fetch(fehlend[0], fehlend[ende])
+            if any(n not in geholt for n in fehlend[:ende + 1]):
+                raise OSError(f"Short range response from {unsigned(self.href)}")
+            blocks.update(geholt)
+            fehlend = fehlend[ende + 1:]
+        return blocks
+
+    def _read_range(self, blocks, start, stop):
+        block = self.cache.block_size
+        return b"".join(blocks[n][max(start - n * block, 0):stop - n * block]
+                        for n in range(start // block, -(-stop // block)))
+
+    def read(self, size=-1):
+        stop = self._size if size is None or size < 0 else min(self._pos + size, self._size)
+        if stop <= self._pos:
+            return b""
+        block = self.cache.block_size
+        data = self._read_range(self._blocks(range(self._pos // block, -(-stop // block))), self._pos, stop)
+        self._pos = stop
+        return data
+
+    def get_byte_ranges(self, offsets, sizes):
+        """Mehrere Bereiche auf einmal (GDAL ``ReadMultiRange``): Lücken gemeinsam holen."""
+        block = self.cache.block_size
+        bereiche = [(o, min(o + s, self._size)) for o, s in zip(offsets, sizes)]
+        blocks = self._blocks(n for start, stop in bereiche if stop > start
+                              for n in range(start // block, -(-stop // block)))
+        return [self._read_range(blocks, start, stop) if stop > start else b"" for start, stop in bereiche]
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self._size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_block_cache():
+    """Prozessweiter Block-Cache unter ``FRIGIS_BLOCK_CACHE_DIR`` oder None bei ``FRIGIS_BLOCK_CACHE_MB=0``."""
+    global _cache
+    if BLOCK_CACHE_BYTES <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = BlockCache(BLOCK_CACHE_DIR)
+    return _cache
@@ -0,0 +1,109 @@
+"""Gebäudemetriken pro Grid-Zelle aus einem einzigen Zell-Gebäude-Join.
+
+Alle Metriken teilen sich dieselbe Vorarbeit: ein STRtree-Join Zelle × Gebäude,
+die Schnittgeometrien und ihre Flächen. Jede Metrik ist danach nur noch ein
+``bincount`` (bzw. ``maximum.at``) über diese Paare; eine neue Metrik ist ein
+Eintrag in ``METRICS``.
+
+Höhen kommen aus den OSM-Tags ``height`` bzw. ``building:levels`` (× 3 m),
+fehlende werden pro Gebäudetyp mit dem Median, sonst global imputiert.
+"""
+import numpy as np
+import pandas as pd
+import shapely
+
+LEVEL_HEIGHT = 3.0  # m pro Geschoss
+DEFAULT_HEIGHT = 9.0  # m, wenn im ganzen Gebiet keine Höhe bekannt ist
+
+
+def _parse_number(values):
+    """Erste Zahl aus OSM-Tagwerten wie ``"12"``, ``"12.5 m"``, ``"4;5"`` (sonst NaN)."""
+    text = pd.Series(values, dtype="object").astype(str).str.replace(",", ".", regex=False)
+    return pd.to_numeric(text.str.extract(r"(\d+(?:\.\d+)?)", expand=False), errors="coerce").to_numpy()
+
+
+def building_heights(buildings):
+    """Höhe pro Gebäude in m -> ``(hoehen, imputiert)``."""
+    n = len(buildings)
+    height = _parse_number(buildings["height"]) if "height" in buildings else np.full(n, np.nan)
+    if "building:levels" in buildings:
+        levels = _parse_number(buildings["building:levels"]) * LEVEL_HEIGHT
+        height = np.where(np.isfinite(height), height, levels)
+    imputed = ~np.isfinite(height)
+    if imputed.any():
+        known = height[~imputed]
+        fallback = float(np.median(known)) if len(known) else DEFAULT_HEIGHT
+        if "building" in buildings:
+            by_type = pd.Series(height).groupby(buildings["building"].astype(str).to_numpy()).transform("median")
+            height = np.where(imputed, by_type.to_numpy(), height)
+        height = np.where(np.isfinite(height), height, fallback)
+    return height, imputed
+
+
+class _Join:
+    """Gemeinsame Vorarbeit aller Metriken: Zell-Gebäude-Paare und ihre Schnittflächen."""
+
+    def __init__(self, cells, geoms, heights):
+        self.n = len(cells)
+        self.cell_area = shapely.area(cells)
+        if len(geoms):
+            self.ci, self.bi = shapely.STRtree(geoms).query(cells, predicate="intersects")
+            self.inter = shapely.intersection(cells[self.ci], geoms[self.bi])
+        else:
+            self.ci = self.bi = np.array([], dtype=np.int64)
+            self.inter = np.array([], dtype=object)
+        self.inter_area = shapely.area(self.inter)
+        self.height = np.asarray(heights, dtype=float)[self.bi]
+
+    def sum(self, weights=None):
+        return np.bincount(self.ci, weights=weights, minlength=self.n)
+
+
+def _ratio(j):
+    return j.sum(j.inter_area) / j.cell_area
+
+
+def _count(j):
+    # Nur Gebäude mit Grundfläche in der Zelle (keine Berührung an der Kante)
+    return j.sum((j.inter_area > 0).astype(float))
+
+
+def _height_mean(j):
+    flaeche = j.sum(j.inter_area)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(flaeche > 0, j.sum(j.inter_area * j.height) / flaeche, 0.0)
+
+
+def _height_max(j):
+    result = np.zeros(j.n)
+    traegt = j.inter_area > 0
+    np.maximum.at(result, j.ci[traegt], j.height[traegt])
+    return result
+
+
+def _volume_density(j):
+    return j.sum(j.inter_area * j.height) / j.cell_area
+
+
+def _frontal_area_index(j):
+    # Über die Windrichtung gemittelt: mittlere Ausdehnung der Teilfläche × Höhe
+    minx, miny, maxx, maxy = shapely.bounds(j.inter).reshape(-1, 4).T
+    breite = 0.5 * ((maxx - minx) + (maxy - miny))
+    return j.sum(np.nan_to_num(breite) * j.height * (j.inter_area > 0)) / j.cell_area
+
+
+# Spaltenname -> (Funktion auf dem Join, Titel, Colormap)
+METRICS = {
+    "building_ratio": (_ratio, "Footprint ratio", "Reds"),
+    "building_count": (_count, "Buildings per cell", "Purples"),
+    "height_mean": (_height_mean, "Mean height (m)", "viridis"),
+    "height_max": (_height_max, "Max height (m)", "viridis"),
+    "volume_density": (_volume_density, "Built volume (m³/m²)", "magma_r"),
+    "frontal_area_index": (_frontal_area_index, "Frontal area index", "cividis_r"),
+}
+
+
+def building_metrics(cells, geoms, heights, names=None):
+    """Alle (oder die genannten) Metriken für ``cells`` aus einem Join -> ``{name: array}``."""
+    join = _Join(np.asarray(cells), np.asarray(geoms), heights)
+    return {name: METRICS[name][0](join) for name in (names or METRICS)}
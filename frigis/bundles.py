@@ -0,0 +1,173 @@
+"""Unveränderliche Ergebnis-Bündel mit teilbarem Permalink.
+
+Ist ein Job vollständig fertig, wird sein Ergebnis als Bündel unter
+``FRIGIS_BUNDLE_DIR/<id>/`` abgelegt. Die ``id`` ist ein Hash über die
+normalisierten Parameter, die Code-Version (Hash der ``frigis``-Quellen bzw.
+``FRIGIS_CODE_VERSION``) und den Inhalt der Ergebnisdateien. Ein Permalink
+zeigt deshalb immer genau das Ergebnis, für das er erzeugt wurde; eine spätere
+Neuberechnung mit anderen Daten bekommt ein neues Bündel, ein vorhandenes wird
+nie überschrieben. Ein Bündel enthält:
+
+- ``manifest.json``  Parameter, Code-Version, Zeitpunkt, Stufen-Status und Meldungen
+- ``grid.arrow``     alle Grid-Metriken (``GridStore``)
+- ``<stufe>.pkl``    Stufen-Ergebnisse wie im Job-Verzeichnis
+- ``<stufe>.png`` / ``<stufe>.html`` / ``<stufe>_map.html``  gerenderte Abbildungen
+  bzw. Karten zum direkten Abruf
+
+``BundleStore`` hat dieselbe Leseschnittstelle wie ``JobStore`` (``load``,
+``load_result``, ``has_result``, ``load_grid``), damit die App ein Bündel
+genauso rendert wie einen Job - ohne eine Stufe auszuführen.
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+
+from frigis.gazetteer import normalize
+from frigis.gridstore import GridStore
+
+BUNDLE_DIR = os.getenv("FRIGIS_BUNDLE_DIR", ".frigis_cache/bundles")
+_SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def normalized_params(params):
+    """Parameter mit normalisiertem Stadtteil (Schreibweisen fallen zusammen)."""
+    return {**params, "stadtteil": normalize(params.get("stadtteil", ""))}
+
+
+_code_version = None
+
+
+def code_version():
+    """``FRIGIS_CODE_VERSION`` oder Hash über alle Quelldateien von ``frigis``."""
+    global _code_version
+    if _code_version is None:
+        _code_version = os.getenv("FRIGIS_CODE_VERSION")
+        if not _code_version:
+            digest = hashlib.sha1()
+            for name in sorted(os.listdir(_SOURCE_DIR)):
+                if name.endswith(".py"):
+                    with open(os.path.join(_SOURCE_DIR, name), "rb") as f:
+                        digest.update(name.encode() + b"\0" + f.read())
+            _code_version = digest.hexdigest()[:12]
+    return _code_version
+
+
+def bundle_key(params, directory):
+    """Hash über Parameter, Code-Version und alle Dateien in ``directory``."""
+    key = json.dumps(normalized_params(params), sort_keys=True, ensure_ascii=False)
+    digest = hashlib.sha1(f"{key}\0{code_version()}".encode())
+    for name in sorted(os.listdir(directory)):
+        digest.update(b"\0" + name.encode() + b"\0")
+        with open(os.path.join(directory, name), "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:20]
+
+
+def _link(src, dst):
+    try:
+        os.link(src, dst)  # Job-Dateien werden nicht mehr geändert: Hardlink statt Kopie
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class BundleStore:
+    def __init__(self, root=BUNDLE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, bundle_id, name="manifest.json"):
+        return os.path.join(self.root, bundle_id, name)
+
+    def publish(self, job_store, job):
+        """Legt das Ergebnis eines fertigen Jobs als Bündel ab und gibt dessen ``id`` zurück."""
+        tmp = os.path.join(self.root, f".tmp.{uuid.uuid4().hex[:8]}")
+        os.makedirs(tmp)
+        for name in list(job["stages"]) + ["area"]:
+            if not job_store.has_result(job["id"], name):
+                continue
+            _link(job_store._path(job["id"], f"{name}.pkl"), os.path.join(tmp, f"{name}.pkl"))
+            if name == "area":
+                continue
+            result = job_store.load_result(job["id"], name) or {}
+            if result.get("figure_png"):
+                with open(os.path.join(tmp, f"{name}.png"), "wb") as f:
+                    f.write(result["figure_png"])
+            for key, suffix in (("html", ""), ("grid_map", "_map")):
+                if result.get(key):
+                    with open(os.path.join(tmp, f"{name}{suffix}.html"), "w", encoding="utf-8") as f:
+                        f.write(result[key])
+        grid = job_store._path(job["id"], "grid.arrow")
+        if os.path.exists(grid):
+            _link(grid, os.path.join(tmp, "grid.arrow"))
+        bundle_id = bundle_key(job["params"], tmp)
+        final = os.path.join(self.root, bundle_id)
+        if os.path.exists(final):
+            shutil.rmtree(tmp, ignore_errors=True)  # gleicher Inhalt liegt schon vor
+            return bundle_id
+        manifest = {
+            "id": bundle_id,
+            "job": job["id"],
+            "params": job["params"],
+            "code_version": code_version(),
+            "created": time.time(),
+            "status": "done",
+            "error": None,
+            "messages": job["messages"],
+            "stages": job["stages"],
+        }
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        # Einmaliges rename: Leser sehen immer ein vollständiges Bündel. Ein
+        # nicht leeres Ziel lässt rename scheitern - dann hat ein paralleler
+        # Aufruf dasselbe Bündel schon abgelegt, es bleibt unverändert.
+        try:
+            os.rename(tmp, final)
+        except OSError:
+            if not os.path.exists(final):
+                raise
+            shutil.rmtree(tmp, ignore_errors=True)
+        return bundle_id
+
+    def load(self, bundle_id):
+        """Manifest eines Bündels (job-artig) oder None."""
+        if not bundle_id or os.sep in bundle_id or bundle_id.startswith("."):
+            return None
+        try:
+            with open(self._path(bundle_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def load_result(self, bundle_id, name):
+        try:
+            with open(self._path(bundle_id, f"{name}.pkl"), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def has_result(self, bundle_id, name):
+        return os.path.exists(self._path(bundle_id, f"{name}.pkl"))
+
+    def load_grid(self, bundle_id):
+        path = self._path(bundle_id, "grid.arrow")
+        return GridStore.load(path) if os.path.exists(path) else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bundle_store():
+    """Prozessweiter Bündel-Speicher unter ``FRIGIS_BUNDLE_DIR``."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BundleStore(BUNDLE_DIR)
+    return _store
@@ -0,0 +1,103 @@
+"""Mehrjährige Temperatur-Tagesreihen pro Punkt, lokal aggregiert.
+
+Pro Messpunkt wird die komplette Tagesreihe (``temperature_2m_max``) einmal
+geladen und spaltenweise als ``float32``-Matrix (Punkte × Tage) gehalten.
+Sommermittel, Hitzetage oder Trend für beliebige Jahre werden daraus
+vektorisiert berechnet - ein Jahreswechsel in der App braucht keinen Request.
+"""
+import warnings
+
+import numpy as np
+
+SUMMER = (6, 7, 8)
+HOT_DAY = 30.0  # °C Tagesmaximum
+
+# Name -> (Beschriftung, Einheit)
+STATISTICS = {
+    "mean_max": ("Mean daily maximum", "°C"),
+    "hot_days": (f"Hot days (≥ {HOT_DAY:g} °C)", " d"),
+    "trend": ("Summer trend", "°C/10a"),
+}
+
+
+class TemperatureSeries:
+    """Tagesmaxima mehrerer Punkte auf gemeinsamer Datumsachse (fehlende Tage = NaN)."""
+
+    def __init__(self, lats, lons, dates, values, meta=None):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+        self.values = np.asarray(values, dtype=np.float32)
+        self.meta = dict(meta or {})
+        self._year = self.dates.astype("datetime64[Y]").astype(int) + 1970
+        self._month = self.dates.astype("datetime64[M]").astype(int) % 12 + 1
+
+    @classmethod
+    def from_points(cls, punkte, meta=None):
+        """``punkte``: [(lat, lon, (zeiten, werte)), ...] wie von Open-Meteo geliefert."""
+        zeiten = [np.asarray(z, dtype="datetime64[D]") for _, _, (z, _) in punkte]
+        dates = np.arange(min(z.min() for z in zeiten), max(z.max() for z in zeiten) + 1)
+        values = np.full((len(punkte), len(dates)), np.nan, dtype=np.float32)
+        for i, (z, (_, _, (_, werte))) in enumerate(zip(zeiten, punkte)):
+            values[i, (z - dates[0]).astype(int)] = np.asarray(werte, dtype=float)
+        return cls([p[0] for p in punkte], [p[1] for p in punkte], dates, values, meta)
+
+    def __len__(self):
+        return len(self.lats)
+
+    @property
+    def years(self):
+        """Jahre, deren Sommer zu mindestens 80 % Daten hat."""
+        out = []
+        for year in np.unique(self._year):
+            mask = self._mask(year)
+            if mask.sum() >= 0.8 * 92 and np.isfinite(self.values[:, mask]).mean() >= 0.8:
+                out.append(int(year))
+        return out
+
+    def _mask(self, years, months=SUMMER):
+        return np.isin(self._year, np.atleast_1d(years)) & np.isin(self._month, months)
+
+    def mean_max(self, year, months=SUMMER):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)  # Punkte ohne Daten -> NaN
+            return np.nanmean(self.values[:, self._mask(year, months)], axis=1)
+
+    def hot_days(self, year, threshold=HOT_DAY, months=SUMMER):
+        block = self.values[:, self._mask(year, months)]
+        days = (block >= threshold).sum(axis=1).astype(float)
+        days[~np.isfinite(block).any(axis=1)] = np.nan
+        return days
+
+    def trend(self, years=None, months=SUMMER):
+        """Lineare Steigung der Sommermittel pro Punkt in °C pro Jahrzehnt."""
+        years = np.asarray(years if years is not None else self.years, dtype=float)
+        if len(years) < 2:
+            return np.full(len(self), np.nan)
+        y = np.column_stack([self.mean_max(int(year), months) for year in years])  # Punkte × Jahre
+        ok = np.isfinite(y)
+        n = ok.sum(axis=1)
+        with np.errstate(all="ignore"):
+            x_mean = np.where(ok, years, 0.0).sum(axis=1) / n
+            y_mean = np.where(ok, y, 0.0).sum(axis=1) / n
+            cov = (np.where(ok, (years - x_mean[:, None]) * (y - y_mean[:, None]), 0.0)).sum(axis=1)
+            var = (np.where(ok, (years - x_mean[:, None]) ** 2, 0.0)).sum(axis=1)
+            slope = cov / var * 10
+        slope[n < 2] = np.nan
+        return slope
+
+    def statistic(self, name, year=None):
+        if name == "mean_max":
+            return self.mean_max(year)
+        if name == "hot_days":
+            return self.hot_days(year)
+        if name == "trend":
+            return self.trend()
+        raise ValueError(f"Unknown statistic: {name}")
+
+    def points(self, name, year=None):
+        """[[lat, lon, wert], ...] für alle Punkte mit gültigem Wert."""
+        werte = self.statistic(name, year)
+        return [[lat, lon, round(float(v), 2)]
+                for lat, lon, v in zip(self.lats, self.lons, werte) if np.isfinite(v)]
+
@@ -0,0 +1,296 @@
+"""Lokales Sentinel-2 COG-Archiv mit SQLite-Footprint-Index.
+
+Die Satellitenanalyse kann damit komplett ohne Netzwerk laufen: Szenen werden
+über einen R-Tree-Index auf den Footprints ausgewählt und nur die benötigten
+Blöcke der lokalen COGs per Fensterlesen (WarpedVRT) geladen. Planetary
+Computer dient nur noch zum Befüllen des Archivs.
+
+Das Archiv hält nur bbox-Ausschnitte der Szenen. ``covering`` liefert deshalb
+nur Szenen, deren Ausschnitt die angefragte bbox ganz abdeckt, und befüllt das
+Archiv bei Bedarf nach; teilweise abdeckende Ausschnitte würden Löcher (NaN)
+in die Analyse reißen.
+
+Befüllen:
+    python -m frigis.cog_archive fill --bbox 11.55 48.13 11.60 48.17
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import dask
+import dask.array as da
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.shutil import copy as rio_copy
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, from_bounds
+
+from frigis.endpoints import STAC_URL
+
+ARCHIVE_DIR = os.getenv("FRIGIS_COG_ARCHIVE")
+# Bei fehlender Szene aus Planetary Computer nachladen (nur wenn Netzwerk erlaubt)
+ARCHIVE_FILL = os.getenv("FRIGIS_COG_ARCHIVE_FILL", "0") == "1"
+
+DEFAULT_ASSETS = ["B04", "B03", "B02"]
+# Beim Befüllen werden zusätzlich die Bänder für NDVI/NDBI/Albedo und die Szenenklassifikation abgelegt
+FILL_ASSETS = ["B02", "B03", "B04", "B08", "B11", "B12", "SCL"]
+
+
+class CogArchive:
+    """Verzeichnis mit COGs plus ``index.sqlite`` (Szenen + R-Tree auf bbox)."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, "index.sqlite")
+        self._lock = threading.Lock()
+        with self._connect() as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS scenes (
+                    rid INTEGER PRIMARY KEY,
+                    id TEXT UNIQUE,
+                    datetime TEXT,
+                    cloud_cover REAL,
+                    assets TEXT
+                )""")
+            con.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS footprints "
+                "USING rtree(rid, minx, maxx, miny, maxy)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    def add_scene(self, scene_id, datetime, cloud_cover, bbox, assets):
+        """Registriert eine Szene; ``assets`` = {Band: relativer Pfad}, bbox in EPSG:4326."""
+        minx, miny, maxx, maxy = bbox
+        with self._lock, self._connect() as con:
+            row = con.execute("SELECT rid FROM scenes WHERE id = ?", (scene_id,)).fetchone()
+            if row:
+                con.execute("DELETE FROM footprints WHERE rid = ?", (row[0],))
+                con.execute("DELETE FROM scenes WHERE rid = ?", (row[0],))
+            cur = con.execute(
+                "INSERT INTO scenes (id, datetime, cloud_cover, assets) VALUES (?, ?, ?, ?)",
+                (scene_id, datetime, cloud_cover, json.dumps(assets)),
+            )
+            con.execute(
+                "INSERT INTO footprints VALUES (?, ?, ?, ?, ?)",
+                (cur.lastrowid, minx, maxx, miny, maxy),
+            )
+
+    def search(self, bbox, year_range=None, max_cloud=20, assets=DEFAULT_ASSETS):
+        """Szenen, die die bbox schneiden; vollständig abdeckende und neueste zuerst."""
+        minx, miny, maxx, maxy = bbox
+        sql = """
+            SELECT s.id, s.datetime, s.cloud_cover, s.assets,
+                   f.minx, f.miny, f.maxx, f.maxy,
+                   (f.minx <= ? AND f.miny <= ? AND f.maxx >= ? AND f.maxy >= ?) AS covers
+            FROM footprints f JOIN scenes s ON s.rid = f.rid
+            WHERE f.minx <= ? AND f.maxx >= ? AND f.miny <= ? AND f.maxy >= ?
+              AND s.cloud_cover < ?
+        """
+        params = [minx, miny, maxx, maxy, maxx, minx, maxy, miny, max_cloud]
+        if year_range:
+            start, end = year_range.split("/")
+            sql += " AND substr(s.datetime, 1, 10) BETWEEN ? AND ?"
+            params += [start[:10], end[:10]]
+        sql += " ORDER BY covers DESC, s.datetime DESC"
+        with self._connect() as con:
+            rows = con.execute(sql, params).fetchall()
+
+        scenes = []
+        for sid, dt, cc, asset_json, fminx, fminy, fmaxx, fmaxy, covers in rows:
+            scene_assets = json.loads(asset_json)
+            if not all(a in scene_assets for a in assets):
+                continue
+            scenes.append({
+                "id": sid,
+                "datetime": dt,
+                "cloud_cover": cc,
+                "bbox": [fminx, fminy, fmaxx, fmaxy],
+                "covers": bool(covers),
+                "assets": {a: os.path.join(self.root, p) for a, p in scene_assets.items()},
+            })
+        return scenes
+
+    def covering(self, bbox, year_range=None, max_cloud=20, assets=DEFAULT_ASSETS, fill=ARCHIVE_FILL):
+        """Nur Szenen, die die bbox vollständig abdecken; fehlt eine, wird (mit ``fill``) nachgeladen."""
+        scenes = [sc for sc in self.search(bbox, year_range, max_cloud, assets) if sc["covers"]]
+        if not scenes and fill:
+            self.fill_from_planetary_computer(bbox, year_range or "2020-01-01/2024-12-31", max_cloud)
+            scenes = [sc for sc in self.search(bbox, year_range, max_cloud, assets) if sc["covers"]]
+        return scenes
+
+    def read_bands(self, scene, assets, bounds_latlon, epsg, resolution):
+        """Fensterlesen der Bänder, reprojiziert auf das Zielraster -> (band, y, x) float32.
+
+        Entspricht dem Raster von ``stackstac.stack(..., bounds_latlon, epsg, resolution)``;
+        gelesen werden nur die COG-Blöcke, die das Zielfenster tatsächlich überdeckt.
+        """
+        bands, _, _ = self.lazy_bands(scene, assets, bounds_latlon, epsg, resolution)
+        return bands.compute()
+
+    def lazy_bands(self, scene, assets, bounds_latlon, epsg, resolution, chunksize=512):
+        """Wie ``read_bands``, aber als Dask-Array mit einem Fensterlesen pro Chunk.
+
+        Gibt ``(bands, x, y)`` zurück, ``x``/``y`` sind die Pixelmitten im Zielraster.
+        """
+        return lazy_read([scene["assets"][asset] for asset in assets], bounds_latlon, epsg, resolution,
+                         chunksize)
+
+    def fill_from_planetary_computer(self, bbox, year_range="2020-01-01/2024-12-31",
+                                     max_cloud=20, assets=FILL_ASSETS, limit=1):
+        """Lädt die besten ``limit`` Szenen für die bbox aus Planetary Computer ins Archiv.
+
+        Es wird nur der bbox-Ausschnitt im nativen Raster der Szene gespeichert
+        (ohne Resampling), als COG mit Overviews. Jeder Ausschnitt ist ein eigener
+        Archiveintrag (``<Szene>-<bbox-Hash>``), frühere Ausschnitte derselben
+        Szene bleiben erhalten.
+        """
+        import planetary_computer
+        from pystac_client import Client
+
+        catalog = Client.open(STAC_URL)
+        search = catalog.search(
+            collections=["sentinel-2-l2a"],
+            bbox=list(bbox),
+            datetime=year_range,
+            query={"eo:cloud_cover": {"lt": max_cloud}},
+        )
+        added = []
+        ausschnitt = hashlib.sha1(json.dumps([round(v, 5) for v in bbox]).encode()).hexdigest()[:8]
+        for item in list(search.items())[:limit]:
+            item = planetary_computer.sign(item)
+            clip_id = f"{item.id}-{ausschnitt}"
+            os.makedirs(os.path.join(self.root, item.id, ausschnitt), exist_ok=True)
+            rel_paths = {}
+            footprint = None
+            for asset in assets:
+                rel = os.path.join(item.id, ausschnitt, f"{asset}.tif")
+                footprint = _clip_to_cog(item.assets[asset].href, bbox,
+                                         os.path.join(self.root, rel))
+                rel_paths[asset] = rel
+            self.add_scene(clip_id, item.properties.get("datetime"),
+                           item.properties.get("eo:cloud_cover", 0), footprint, rel_paths)
+            added.append(clip_id)
+        return added
+
+
+def _target_grid(bounds_latlon, epsg, resolution):
+    """Zielraster (wie stackstac): an ``resolution`` ausgerichtet, Nord oben."""
+    minx, miny, maxx, maxy = transform_bounds("EPSG:4326", f"EPSG:{epsg}", *bounds_latlon)
+    minx = np.floor(minx / resolution) * resolution
+    maxy = np.ceil(maxy / resolution) * resolution
+    width = int(np.ceil((maxx - minx) / resolution))
+    height = int(np.ceil((maxy - miny) / resolution))
+    return from_origin(minx, maxy, resolution, resolution), width, height
+
+
+def lazy_read(paths, bounds_latlon, epsg, resolution, chunksize=512, opener=None):
+    """Ein Band pro Pfad/URL als Dask-Array ``(band, y, x)`` im Zielraster, plus Pixelmitten ``x``/``y``.
+
+    Jeder Chunk ist ein eigenes Fensterlesen; mit ``opener`` (z.B.
+    ``BlockCache.opener``) laufen die Byte-Zugriffe über diesen statt über GDAL.
+    """
+    transform, width, height = _target_grid(bounds_latlon, epsg, resolution)
+    bands = []
+    for path in paths:
+        rows = []
+        for row in range(0, height, chunksize):
+            h = min(chunksize, height - row)
+            rows.append([
+                da.from_delayed(
+                    dask.delayed(_read_window)(path, epsg, transform, width, height,
+                                               Window(col, row, min(chunksize, width - col), h), opener),
+                    shape=(h, min(chunksize, width - col)), dtype="float32")
+                for col in range(0, width, chunksize)
+            ])
+        bands.append(da.block(rows))
+    x = transform.c + (np.arange(width) + 0.5) * resolution
+    y = transform.f - (np.arange(height) + 0.5) * resolution
+    return da.stack(bands), x, y
+
+
+def _read_window(path, epsg, transform, width, height, window, opener=None):
+    # Über einen Opener keine Beifiles (.aux.xml, .msk, ...) suchen - jede Probe wäre eine Anfrage
+    with rasterio.Env(GDAL_DISABLE_READDIR_ON_OPEN="EMPTY_DIR" if opener else "FALSE"), \
+            rasterio.open(path, opener=opener) as src:
+        with WarpedVRT(src, crs=f"EPSG:{epsg}", transform=transform,
+                       width=width, height=height,
+                       resampling=Resampling.nearest) as vrt:
+            band = vrt.read(1, window=window, masked=True)
+    return band.astype("float32").filled(np.nan)
+
+
+def _clip_to_cog(href, bbox, dst_path):
+    """Schneidet den bbox-Ausschnitt aus einem (entfernten) COG aus und schreibt ein lokales COG."""
+    with rasterio.open(href) as src:
+        # kleiner Rand, damit der Footprint die bbox nach Reprojektion sicher abdeckt
+        margin = 0.002
+        padded = (bbox[0] - margin, bbox[1] - margin, bbox[2] + margin, bbox[3] + margin)
+        native = transform_bounds("EPSG:4326", src.crs, *padded)
+        window = from_bounds(*native, transform=src.transform).round_offsets().round_lengths()
+        window = window.intersection(rasterio.windows.Window(0, 0, src.width, src.height))
+        data = src.read(1, window=window)
+        profile = src.profile.copy()
+        profile.update(
+            driver="GTiff",
+            width=window.width,
+            height=window.height,
+            transform=src.window_transform(window),
+        )
+        footprint = transform_bounds(src.crs, "EPSG:4326",
+                                     *rasterio.windows.bounds(window, src.transform))
+
+    tmp_path = dst_path + ".tmp.tif"
+    with rasterio.open(tmp_path, "w", **profile) as dst:
+        dst.write(data, 1)
+    rio_copy(tmp_path, dst_path, driver="COG", compress="DEFLATE", overview_resampling="average")
+    os.remove(tmp_path)
+    return list(footprint)
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_cog_archive():
+    """Prozessweites Archiv aus ``FRIGIS_COG_ARCHIVE`` oder None, wenn nicht konfiguriert."""
+    global _archive
+    if not ARCHIVE_DIR:
+        return None
+    with _archive_lock:
+        if _archive is None:
+            _archive = CogArchive(ARCHIVE_DIR)
+    return _archive
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Lokales Sentinel-2 COG-Archiv verwalten")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    fill = sub.add_parser("fill", help="Szenen aus Planetary Computer ins Archiv laden")
+    fill.add_argument("--bbox", nargs=4, type=float, required=True,
+                      metavar=("MINX", "MINY", "MAXX", "MAXY"))
+    fill.add_argument("--datetime", default="2020-01-01/2024-12-31")
+    fill.add_argument("--max-cloud", type=float, default=20)
+    fill.add_argument("--limit", type=int, default=1)
+    fill.add_argument("--assets", nargs="+", default=FILL_ASSETS)
+    fill.add_argument("--root", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if not args.root:
+        parser.error("--root oder FRIGIS_COG_ARCHIVE angeben")
+    archive = CogArchive(args.root)
+    added = archive.fill_from_planetary_computer(
+        args.bbox, args.datetime, args.max_cloud, args.assets, args.limit)
+    print(f"{len(added)} Szene(n) hinzugefügt: {', '.join(added)}")
+
+
+if __name__ == "__main__":
+    _main()
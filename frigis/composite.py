@@ -0,0 +1,123 @@
+"""Wolkenmaskiertes Median-Komposit aus mehreren Sentinel-2-Szenen, lokal gecacht.
+
+Statt ``items[0]`` werden bis zu ``FRIGIS_COMPOSITE_SCENES`` wolkenarme Szenen
+der Saison gestapelt, Pixel mit Wolke/Schatten/Zirrus laut L2A-``SCL`` maskiert
+und pro Pixel der Median gebildet. Die Reduktion läuft chunkweise mit Dask: pro
+Chunk liegen nur Szenen × Chunkfläche im Speicher, nie Szenen × Gesamtfläche.
+
+Das fertige Komposit wird pro bbox/Saison/Zeitraum als GeoTIFF (COG) unter
+``FRIGIS_COMPOSITE_DIR`` abgelegt; weitere Analysen lesen nur diese Datei.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import dask.array as da
+import numpy as np
+import rasterio
+from rasterio.shutil import copy as rio_copy
+from rasterio.transform import from_origin
+
+COMPOSITE_DIR = os.getenv("FRIGIS_COMPOSITE_DIR", ".frigis_cache/composites")
+COMPOSITE_SCENES = int(os.getenv("FRIGIS_COMPOSITE_SCENES", "8"))
+
+SEASONS = {
+    "summer": (6, 7, 8),
+    "year": tuple(range(1, 13)),
+}
+# SCL-Klassen ohne brauchbare Bodenbeobachtung: Nodata, saturiert, Wolkenschatten,
+# Wolken (mittlere/hohe Wahrscheinlichkeit), Zirrus
+SCL_MASKED = (0, 1, 3, 8, 9, 10)
+
+
+def in_season(datetime, season):
+    """True, wenn das Aufnahmedatum (ISO-String) in den Monaten der Saison liegt."""
+    return bool(datetime) and int(str(datetime)[5:7]) in SEASONS[season]
+
+
+def median_composite(bands, scl, offsets=None):
+    """Lazy Median über die Zeit: ``(time, band, y, x)`` + SCL ``(time, y, x)`` -> ``(band, y, x)``.
+
+    ``offsets`` (pro Szene) gleicht den L2A-Offset neuerer Processing Baselines an,
+    damit alle Szenen vergleichbare DN liefern.
+    """
+    bands = bands.astype("float32")
+    if offsets is not None:
+        bands = bands + np.asarray(offsets, dtype="float32")[:, None, None, None]
+    clear = ~da.isin(scl, SCL_MASKED)
+    masked = da.where(clear[:, None], bands, np.nan)
+    # Zeitachse muss für den Median in einem Chunk liegen, räumlich bleibt es gekachelt
+    masked = masked.rechunk({0: -1, 1: 1})
+    return da.nanmedian(masked, axis=0)
+
+
+class CompositeCache:
+    """Ein GeoTIFF pro Komposit, Schlüssel = Hash über bbox, Saison, Zeitraum, CRS, Auflösung, Bänder."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()[:20]
+        return os.path.join(self.root, f"{digest}.tif")
+
+    def load(self, key):
+        """-> (bands als Dask-Array, x, y) oder None, wenn nicht im Cache."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        with rasterio.open(path) as src:
+            data = src.read(masked=True).astype("float32").filled(np.nan)
+            t = src.transform
+            x = t.c + (np.arange(src.width) + 0.5) * t.a
+            y = t.f + (np.arange(src.height) + 0.5) * t.e
+        return da.from_array(data, chunks=(1, 512, 512)), x, y
+
+    def store(self, key, data, x, y, epsg):
+        """Schreibt ``data`` (band, y, x) atomar als COG und gibt den Pfad zurück."""
+        path = self.path(key)
+        res = float(x[1] - x[0]) if len(x) > 1 else float(y[0] - y[1])
+        profile = {
+            "driver": "GTiff", "width": data.shape[2], "height": data.shape[1],
+            "count": data.shape[0], "dtype": "float32", "nodata": np.nan,
+            "crs": f"EPSG:{epsg}",
+            "transform": from_origin(x[0] - res / 2, y[0] + res / 2, res, res),
+        }
+        tmp_path = f"{path}.{threading.get_ident()}.tmp.tif"
+        with rasterio.open(tmp_path, "w", **profile) as dst:
+            dst.write(data.astype("float32"))
+        rio_copy(tmp_path, f"{path}.{threading.get_ident()}.cog", driver="COG", compress="DEFLATE")
+        os.replace(f"{path}.{threading.get_ident()}.cog", path)
+        os.remove(tmp_path)
+        return path
+
+    def get_or_build(self, key, build, epsg):
+        """Komposit aus dem Cache oder über ``build() -> (lazy bands, x, y)`` erzeugen und ablegen.
+
+        ``build`` darf None liefern (keine geeigneten Szenen); dann wird nichts gespeichert.
+        """
+        cached = self.load(key)
+        if cached is not None:
+            return cached
+        built = build()
+        if built is None:
+            return None
+        bands, x, y = built
+        data = bands.compute()
+        self.store(key, data, x, y, epsg)
+        return da.from_array(data, chunks=(1, 512, 512)), x, y
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_composite_cache():
+    """Prozessweiter Komposit-Cache unter ``FRIGIS_COMPOSITE_DIR``."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CompositeCache(COMPOSITE_DIR)
+    return _cache
@@ -0,0 +1,224 @@
+"""Zeitbudgets pro Analyse und Stufe, Abbruch laufender Arbeit und Hedged Requests.
+
+Der Job setzt für jede Stufe eine ``Deadline`` (``current_deadline``), die
+Pipeline fragt sie an den Stellen ab, an denen sie warten würde. Läuft das
+Budget ab, rendert die Stufe mit den bis dahin vorhandenen Daten und meldet
+das selbst (``report_partial``) - nur dann gilt sie als partiell, nicht schon,
+weil ein vollständiges Ergebnis knapp nach Ablauf fertig wurde. Nicht
+abbrechbare Aufrufe (OSMnx, Raster-Laden) laufen in einem Hintergrund-Pool
+weiter und landen über Single-Flight im Cache, statt die Analyse aufzuhalten.
+
+Die Budgets der Stufen mit Upstream-Zugriffen (``STAGE_BUDGETS``) teilen sich
+das Analysebudget und werden bei Bedarf anteilig gekürzt, damit ihre Summe
+hineinpasst. Rein lokale Stufen (``LOCAL_BUDGETS``) haben ein eigenes Budget
+und zählen nicht gegen das Analysebudget. Stufen ohne Eintrag bekommen
+``DEFAULT_STAGE_BUDGET`` vom Analysebudget. Das Gebietsbudget wächst mit der
+Fläche (``scale_budget_to_area``), damit stadtweite OSM-Abfragen nicht
+regelmäßig am Budget für einen Stadtteil scheitern.
+
+Hedged Requests laufen in einem eigenen, begrenzten Pool; abgekoppelte Aufrufe
+aus ``call_with_deadline`` können ihn so nicht aushungern.
+"""
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+
+ANALYSIS_BUDGET = float(os.getenv("FRIGIS_ANALYSIS_BUDGET", "75"))
+# Stufen mit Upstream-Zugriffen: Anteile am Analysebudget
+STAGE_BUDGETS = {
+    "area": float(os.getenv("FRIGIS_BUDGET_AREA", "15")),
+    "temperature": float(os.getenv("FRIGIS_BUDGET_TEMPERATURE", "15")),
+    "satellite": float(os.getenv("FRIGIS_BUDGET_SATELLITE", "30")),
+    "species": float(os.getenv("FRIGIS_BUDGET_SPECIES", "5")),
+    "street_trees": float(os.getenv("FRIGIS_BUDGET_STREET_TREES", "10")),
+}
+# Stufen ohne eigenen Eintrag: Anteil am Analysebudget
+DEFAULT_STAGE_BUDGET = float(os.getenv("FRIGIS_BUDGET_DEFAULT", "10"))
+# Gebietsbudget gilt für Flächen bis AREA_REFERENCE_KM2, darüber wächst es linear bis AREA_BUDGET_MAX
+AREA_REFERENCE_KM2 = float(os.getenv("FRIGIS_AREA_REFERENCE_KM2", "4"))
+AREA_BUDGET_MAX = float(os.getenv("FRIGIS_AREA_BUDGET_MAX", "600"))
+# Rein lokale Rechenstufen: eigenes Budget, außerhalb des Analysebudgets
+LOCAL_BUDGETS = {
+    "building_density": float(os.getenv("FRIGIS_BUDGET_BUILDINGS", "20")),
+    "distance_to_green": float(os.getenv("FRIGIS_BUDGET_GREEN", "20")),
+    "priority": float(os.getenv("FRIGIS_BUDGET_PRIORITY", "10")),
+    "shade": float(os.getenv("FRIGIS_BUDGET_SHADE", "60")),
+}
+# Nach so vielen Sekunden ohne Antwort wird eine zweite, identische Anfrage gestartet
+HEDGE_AFTER = float(os.getenv("FRIGIS_HEDGE_AFTER", "2.0"))
+# Threads für Hedged Requests; höchstens die Hälfte davon für Duplikate
+HEDGE_WORKERS = int(os.getenv("FRIGIS_HEDGE_WORKERS", "32"))
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def _fit(budgets, total):
+    """Kürzt die Budgets anteilig, wenn ihre Summe ``total`` übersteigt."""
+    summe = sum(budgets.values())
+    if summe <= total:
+        return budgets
+    return {name: seconds * total / summe for name, seconds in budgets.items()}
+
+
+class Deadline:
+    def __init__(self, seconds, parent=None):
+        self.expires_at = time.monotonic() + seconds
+        self.parent = parent
+        self.partial = False  # von der Stufe gemeldet: Arbeit wegen des Budgets ausgelassen
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def child(self, seconds):
+        """Unterbudget, das nie länger als das übergeordnete läuft."""
+        d = Deadline(0, parent=self)
+        d.expires_at = min(self.expires_at, time.monotonic() + seconds)
+        return d
+
+    def extend(self, seconds):
+        """Verlängert diese Deadline und alle übergeordneten um ``seconds``."""
+        self.expires_at += seconds
+        if self.parent is not None:
+            self.parent.extend(seconds)
+
+    def timeout(self, cap):
+        """Timeout für einen einzelnen Request: höchstens ``cap``, nie über die Deadline hinaus."""
+        return max(0.1, min(cap, self.remaining()))
+
+    @contextlib.contextmanager
+    def paused(self):
+        """Zeit in diesem Block (Warten auf Zulassung, lokale Stufen) zählt nicht gegen die Deadline."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.expires_at += time.monotonic() - start
+
+
+current_deadline = contextvars.ContextVar("frigis_deadline", default=None)
+
+
+def scale_budget_to_area(area_m2, stage="area"):
+    """Verlängert die laufende Stufen-Deadline für Gebiete über ``AREA_REFERENCE_KM2``.
+
+    Das Budget wächst proportional zur Fläche (höchstens ``AREA_BUDGET_MAX``);
+    das Analysebudget wächst mit, die übrigen Stufen behalten ihren Anteil.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return
+    basis = _STAGE_SHARES.get(stage, DEFAULT_STAGE_BUDGET)
+    ziel = min(AREA_BUDGET_MAX, basis * area_m2 / 1e6 / AREA_REFERENCE_KM2)
+    if ziel > basis:
+        deadline.extend(ziel - basis)
+
+
+def report_partial():
+    """Meldet, dass die laufende Stufe wegen ihres Budgets Arbeit ausgelassen hat."""
+    deadline = current_deadline.get()
+    if deadline is not None:
+        deadline.partial = True
+
+
+# Pool für abgekoppelte, nicht abbrechbare Aufrufe
+_background = ThreadPoolExecutor(max_workers=32, thread_name_prefix="frigis-deadline")
+# Eigener Pool für Hedged Requests; Duplikate nur, solange Plätze frei sind
+_hedges = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="frigis-hedge")
+_hedge_slots = threading.BoundedSemaphore(max(1, HEDGE_WORKERS // 2))
+
+
+def call_with_deadline(fn, *args, **kwargs):
+    """Führt ``fn`` aus, wartet aber höchstens bis zur aktuellen Deadline.
+
+    Ohne Deadline wird direkt aufgerufen. Bei Ablauf wird ``DeadlineExceeded``
+    geworfen; der Aufruf selbst läuft im Hintergrund zu Ende.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return fn(*args, **kwargs)
+    future = _background.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    try:
+        return future.result(timeout=deadline.remaining())
+    except FutureTimeout:
+        raise DeadlineExceeded(f"{getattr(fn, '__name__', 'call')} exceeded the time budget") from None
+
+
+def hedged(fn, *args, hedge_after=HEDGE_AFTER, **kwargs):
+    """Startet ``fn``; antwortet es nicht binnen ``hedge_after`` s, läuft ein Duplikat parallel.
+
+    Das erste erfolgreiche Ergebnis (keine Exception, nicht None) gewinnt; sonst None.
+    Sind alle Plätze für Duplikate belegt, wird ohne Duplikat weiter gewartet.
+    """
+    ctx = contextvars.copy_context()
+    futures = {_hedges.submit(ctx.copy().run, fn, *args, **kwargs)}
+    hedge_started = False
+    deadline = current_deadline.get()
+    result = None
+    while futures:
+        timeout = hedge_after if not hedge_started else 0.25
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+        done, futures = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+        for f in done:
+            try:
+                result = f.result()
+            except Exception:
+                result = None
+            if result is not None:
+                for other in futures:
+                    other.cancel()
+                return result
+        if not done and not hedge_started:
+            if deadline is not None and deadline.expired():
+                break
+            hedge_started = True
+            if _hedge_slots.acquire(blocking=False):
+                duplikat = _hedges.submit(ctx.copy().run, fn, *args, **kwargs)
+                duplikat.add_done_callback(lambda _: _hedge_slots.release())
+                futures.add(duplikat)
+        elif not done and deadline is not None and deadline.expired():
+            break
+    return result
+
+
+class StageBudget:
+    """Setzt die Deadline einer Stufe.
+
+    Upstream-Stufen bekommen das Minimum aus ihrem Anteil (ohne Eintrag
+    ``DEFAULT_STAGE_BUDGET``) und dem Restbudget der Analyse; lokale Stufen ihr
+    eigenes Budget, währenddessen ruht das Analysebudget.
+    """
+
+    def __init__(self, analysis_deadline, stage):
+        self._paused = None
+        if stage in LOCAL_BUDGETS:
+            self.deadline = Deadline(LOCAL_BUDGETS[stage])
+            self._paused = analysis_deadline.paused()
+        else:
+            self.deadline = analysis_deadline.child(_STAGE_SHARES.get(stage, DEFAULT_STAGE_BUDGET))
+        self._token = None
+
+    def __enter__(self):
+        if self._paused is not None:
+            self._paused.__enter__()
+        self._token = current_deadline.set(self.deadline)
+        return self.deadline
+
+    def __exit__(self, *exc):
+        current_deadline.reset(self._token)
+        if self._paused is not None:
+            self._paused.__exit__(*exc)
+        return False
+
+
+_STAGE_SHARES = _fit(STAGE_BUDGETS, ANALYSIS_BUDGET)
+
@@ -0,0 +1,26 @@
+"""Basis-URLs der Upstreams, per Umgebungsvariable umlenkbar.
+
+Standard sind die öffentlichen Dienste; für Lasttests und Offline-Entwicklung
+zeigen ``FRIGIS_*_URL`` auf lokale Stand-ins (``frigis.standins``). Umgelenkte
+Hosts behalten die Ratenlimits des Originals (``LIMITER_HOSTS``).
+"""
+import os
+from urllib.parse import urlparse
+
+OPENCAGE_URL = os.getenv("FRIGIS_OPENCAGE_URL", "https://api.opencagedata.com")
+OVERPASS_URL = os.getenv("FRIGIS_OVERPASS_URL", "https://overpass-api.de/api")
+NOMINATIM_URL = os.getenv("FRIGIS_NOMINATIM_URL", "https://nominatim.openstreetmap.org/")
+OPEN_METEO_URL = os.getenv("FRIGIS_OPEN_METEO_URL", "https://archive-api.open-meteo.com/v1/archive")
+STAC_URL = os.getenv("FRIGIS_STAC_URL", "https://planetarycomputer.microsoft.com/api/stac/v1")
+
+# Tatsächlicher Host (mit Port) -> Bucket im Ratenlimiter
+LIMITER_HOSTS = {
+    urlparse(url).netloc: host
+    for url, host in [
+        (OPENCAGE_URL, "api.opencagedata.com"),
+        (OVERPASS_URL, "overpass-api.de"),
+        (NOMINATIM_URL, "nominatim.openstreetmap.org"),
+        (OPEN_METEO_URL, "archive-api.open-meteo.com"),
+        (STAC_URL, "planetarycomputer.microsoft.com"),
+    ]
+}
@@ -0,0 +1,185 @@
+"""GIS-Export eines Jobs oder Bündels als COG, GeoParquet und Parquet.
+
+Geschrieben wird in ein Verzeichnis:
+
+- ``<metrik>.tif``       jede Grid-Metrik als gekacheltes, DEFLATE-komprimiertes
+  Cloud-Optimized GeoTIFF mit Übersichten (eine Rasterzelle = eine Grid-Zelle,
+  NaN = nodata)
+- ``kmeans_labels.tif``  k-Means-Labelbild der Satellitenstufe (uint8, 255 = nodata)
+- ``grid.parquet``       Vektor-Grid mit allen Metriken (GeoParquet)
+- ``sites.parquet`` / ``street_trees.parquet``  Pflanzstandorte bzw.
+  Straßenbaum-Kandidaten als Punkte (GeoParquet, EPSG:4326)
+- ``temperature.parquet`` Temperatur-Stichproben im Langformat
+  (``lat``, ``lon``, ``date``, ``temperature_2m_max``)
+
+Raster werden Kachel für Kachel (``TILE`` Pixel) in ein temporäres, gekacheltes
+GeoTIFF geschrieben; Übersichten und COG-Layout erzeugt danach GDAL, das
+ebenfalls blockweise liest. Auch stadtweite Exporte halten so nie das ganze
+Raster im Speicher - nur die Zellwerte, die ohnehin im ``GridStore`` liegen::
+
+    python -m frigis.export <job_oder_bündel_id> --out export/
+"""
+import argparse
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import rasterio
+from affine import Affine
+from rasterio.shutil import copy as rio_copy
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from frigis.bundles import get_bundle_store
+from frigis.gridmap import grid_indices
+from frigis.jobs import JOB_DIR, JobStore
+from frigis.pipeline import LABEL_NODATA
+
+TILE = 256
+# Temperatur-Stichproben: Punkte pro Row Group
+TEMPERATURE_CHUNK = 256
+
+
+def _write_cog(tmp_path, path, resampling):
+    """Gekacheltes GeoTIFF -> COG mit Übersichten; das Zwischenergebnis wird entfernt."""
+    try:
+        rio_copy(tmp_path, path, driver="COG", compress="DEFLATE", predictor="YES",
+                 blocksize=TILE, overview_resampling=resampling)
+    finally:
+        os.remove(tmp_path)
+
+
+def _profile(width, height, transform, crs, dtype, nodata):
+    return {"driver": "GTiff", "width": width, "height": height, "count": 1, "dtype": dtype,
+            "crs": crs, "transform": transform, "nodata": nodata, "tiled": True,
+            "blockxsize": TILE, "blockysize": TILE, "sparse_ok": True}
+
+
+def _tile_layout(ix, iy, width, height):
+    """Zellen nach Kachel sortiert: ``(reihenfolge, kachel -> (start, ende), zeile, spalte)``."""
+    zeile = height - 1 - iy  # Grid-Index wächst nach Norden, Rasterzeilen nach Süden
+    spalte = ix
+    kacheln_x = -(-width // TILE)
+    kachel = (zeile // TILE) * kacheln_x + spalte // TILE
+    reihenfolge = np.argsort(kachel, kind="stable")
+    sortiert = kachel[reihenfolge]
+    belegt, start = np.unique(sortiert, return_index=True)
+    ende = np.append(start[1:], len(sortiert))
+    grenzen = {int(k): (int(a), int(b)) for k, a, b in zip(belegt, start, ende)}
+    return reihenfolge, grenzen, zeile, spalte, kacheln_x
+
+
+def export_grid_rasters(grid_store, out_dir, columns=None):
+    """Jede Metrik als COG; gibt die geschriebenen Pfade zurück."""
+    if grid_store is None or not len(grid_store):
+        return []
+    ix, iy, size, (minx, miny) = grid_indices(grid_store.geometry.values)
+    width, height = int(ix.max()) + 1, int(iy.max()) + 1
+    transform = from_origin(minx, miny + height * size, size, size)
+    reihenfolge, grenzen, zeile, spalte, kacheln_x = _tile_layout(ix, iy, width, height)
+
+    pfade = []
+    for name in columns or grid_store.columns:
+        werte = grid_store.column(name)
+        path = os.path.join(out_dir, f"{name}.tif")
+        tmp_path = f"{path}.tmp.tif"
+        with rasterio.open(tmp_path, "w", **_profile(width, height, transform, grid_store.crs,
+                                                     "float32", np.nan)) as dst:
+            # Leere Kacheln werden nicht geschrieben (sparse) und lesen sich als nodata
+            for k, (a, b) in grenzen.items():
+                row0, col0 = (k // kacheln_x) * TILE, (k % kacheln_x) * TILE
+                fenster = Window(col0, row0, min(TILE, width - col0), min(TILE, height - row0))
+                block = np.full((fenster.height, fenster.width), np.nan, dtype=np.float32)
+                idx = reihenfolge[a:b]
+                block[zeile[idx] - row0, spalte[idx] - col0] = werte[idx]
+                dst.write(block, 1, window=fenster)
+        _write_cog(tmp_path, path, "average")
+        pfade.append(path)
+    return pfade
+
+
+def export_label_raster(raster, path):
+    """k-Means-Labelbild (``labels``/``transform``/``crs`` aus der Satellitenstufe) als COG."""
+    labels = raster["labels"]
+    height, width = labels.shape
+    tmp_path = f"{path}.tmp.tif"
+    with rasterio.open(tmp_path, "w", **_profile(width, height, Affine.from_gdal(*raster["transform"]),
+                                                 raster["crs"], "uint8", LABEL_NODATA)) as dst:
+        for row0 in range(0, height, TILE):
+            for col0 in range(0, width, TILE):
+                fenster = Window(col0, row0, min(TILE, width - col0), min(TILE, height - row0))
+                dst.write(labels[row0:row0 + fenster.height, col0:col0 + fenster.width], 1, window=fenster)
+    # Klassen dürfen nicht gemittelt werden
+    _write_cog(tmp_path, path, "mode")
+    return path
+
+
+def export_points(table, path):
+    """Tabelle mit ``lat``/``lon`` als GeoParquet-Punktlayer (EPSG:4326)."""
+    punkte = gpd.GeoDataFrame(table, geometry=gpd.points_from_xy(table["lon"], table["lat"]), crs="EPSG:4326")
+    punkte.to_parquet(path, compression="zstd")
+    return path
+
+
+def export_temperature(reihen, path):
+    """Temperaturreihen im Langformat; je ``TEMPERATURE_CHUNK`` Punkte eine Row Group."""
+    schema = pa.schema([("lat", pa.float64()), ("lon", pa.float64()), ("date", pa.date32()),
+                        ("temperature_2m_max", pa.float32())])
+    schema = schema.with_metadata({"frigis": json.dumps(reihen.meta, default=str, ensure_ascii=False)})
+    tage = len(reihen.dates)
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for start in range(0, len(reihen), TEMPERATURE_CHUNK):
+            teil = slice(start, start + TEMPERATURE_CHUNK)
+            n = len(reihen.lats[teil])
+            writer.write_table(pa.table({
+                "lat": np.repeat(reihen.lats[teil], tage),
+                "lon": np.repeat(reihen.lons[teil], tage),
+                "date": np.tile(reihen.dates, n),
+                "temperature_2m_max": reihen.values[teil].ravel(),
+            }, schema=schema))
+    return path
+
+
+def export_analysis(store, analysis_id, out_dir):
+    """Exportiert alles Vorhandene eines Jobs bzw. Bündels nach ``out_dir``; gibt die Pfade zurück."""
+    os.makedirs(out_dir, exist_ok=True)
+    grid_store = store.load_grid(analysis_id)
+    pfade = export_grid_rasters(grid_store, out_dir)
+    if grid_store is not None and len(grid_store):
+        path = os.path.join(out_dir, "grid.parquet")
+        grid_store.to_geoparquet(path)
+        pfade.append(path)
+
+    satellit = store.load_result(analysis_id, "satellite") or {}
+    if satellit.get("labels"):
+        pfade.append(export_label_raster(satellit["labels"], os.path.join(out_dir, "kmeans_labels.tif")))
+    for stufe, key, name in (("priority", "sites", "sites"), ("street_trees", "table", "street_trees")):
+        tabelle = (store.load_result(analysis_id, stufe) or {}).get(key)
+        if tabelle is not None and len(tabelle):
+            pfade.append(export_points(tabelle, os.path.join(out_dir, f"{name}.parquet")))
+    reihen = (store.load_result(analysis_id, "temperature") or {}).get("series")
+    if reihen is not None and len(reihen):
+        pfade.append(export_temperature(reihen, os.path.join(out_dir, "temperature.parquet")))
+    return pfade
+
+
+def _main():
+    parser = argparse.ArgumentParser(prog="python -m frigis.export",
+                                     description="Job oder Bündel als COG/GeoParquet exportieren")
+    parser.add_argument("id", help="Job- oder Bündel-ID")
+    parser.add_argument("--out", required=True, help="Zielverzeichnis")
+    parser.add_argument("--root", default=JOB_DIR, help="Job-Verzeichnis")
+    args = parser.parse_args()
+    bundles = get_bundle_store()
+    store = bundles if bundles.load(args.id) is not None else JobStore(args.root)
+    if store.load(args.id) is None:
+        raise SystemExit(f"Unknown job or bundle: {args.id}")
+    for path in export_analysis(store, args.id, args.out):
+        print(path)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,168 @@
+"""Lokaler Gazetteer mit Präfix-Index für Stadtteil-Geocoding und Autocomplete.
+
+Quelle ist ein Ortsnamen-Dump, der einmal pro Prozess in den Speicher geladen wird:
+
+- GeoNames-Dump (``*.txt``, tab-getrennt, z.B. ``DE.txt``), Featureklassen A und P
+- eigene CSV (``*.csv``, Semikolon wie die Baumliste) mit den Spalten
+  ``name;parent;lat;lon`` und optional ``minx;miny;maxx;maxy;population``
+
+Alle normalisierten Namen liegen in einer sortierten Liste; ein Präfix entspricht
+einem zusammenhängenden Bereich, der per ``bisect`` in O(log n) gefunden wird.
+Remote-Geocoder werden nur noch bei einem Fehltreffer gefragt.
+"""
+import bisect
+import csv
+import os
+import re
+import threading
+import unicodedata
+
+GAZETTEER_PATH = os.getenv("FRIGIS_GAZETTEER")
+
+# GeoNames-Spalten (siehe readme.txt im Dump)
+_GN_NAME, _GN_ASCII, _GN_ALT, _GN_LAT, _GN_LON, _GN_CLASS, _GN_CODE = 1, 2, 3, 4, 5, 6, 7
+_GN_COUNTRY, _GN_ADMIN, _GN_POP = 8, slice(10, 14), 14
+
+
+def normalize(text):
+    """Kleinschreibung, Umlaute als ae/oe/ue, ohne Akzente, einheitliche Trenner."""
+    text = text.casefold()
+    for src, dst in (("ä", "ae"), ("ö", "oe"), ("ü", "ue"), ("ß", "ss")):
+        text = text.replace(src, dst)
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"\s*,\s*", ", ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class Gazetteer:
+    def __init__(self, entries):
+        # entries: Liste von dicts mit name, parent, lat, lon, bbox, population, context
+        self.entries = entries
+        pairs = []
+        for idx, e in enumerate(entries):
+            keys = {normalize(e["name"])}
+            if e["parent"]:
+                keys.add(normalize(f"{e['name']}, {e['parent']}"))
+            for alt in e.get("alt_names", ()):
+                keys.add(normalize(alt))
+            pairs.extend((k, idx) for k in keys if k)
+        pairs.sort()
+        self._keys = [k for k, _ in pairs]
+        self._ids = [i for _, i in pairs]
+
+    @classmethod
+    def from_file(cls, path):
+        if path.lower().endswith(".csv"):
+            return cls(_read_csv(path))
+        return cls(_read_geonames(path))
+
+    def _range(self, prefix):
+        lo = bisect.bisect_left(self._keys, prefix)
+        hi = bisect.bisect_left(self._keys, prefix + "\uffff", lo)
+        return lo, hi
+
+    def _exact(self, key):
+        lo, hi = bisect.bisect_left(self._keys, key), bisect.bisect_right(self._keys, key)
+        return [self.entries[i] for i in dict.fromkeys(self._ids[lo:hi])]
+
+    def lookup(self, query):
+        """Bester Eintrag für z.B. "Maxvorstadt, München" oder None bei Fehltreffer."""
+        key = normalize(query)
+        if not key:
+            return None
+        hits = self._exact(key)
+        if not hits and ", " in key:
+            head, rest = key.split(", ", 1)
+            # Übergeordneter Ort muss im Kontext (Parent/Admin-Namen) vorkommen
+            hits = [e for e in self._exact(head) if rest in e["context"]]
+        if not hits:
+            return None
+        return max(hits, key=lambda e: e["population"])
+
+    def autocomplete(self, prefix, limit=8):
+        """Anzeigenamen aller Einträge, deren Name mit ``prefix`` beginnt (nach Einwohnern)."""
+        key = normalize(prefix)
+        if len(key) < 2:
+            return []
+        lo, hi = self._range(key)
+        seen = dict.fromkeys(self._ids[lo:hi])
+        ranked = sorted((self.entries[i] for i in seen), key=lambda e: -e["population"])
+        labels = []
+        for e in ranked:
+            label = f"{e['name']}, {e['parent']}" if e["parent"] else e["name"]
+            if label not in labels:
+                labels.append(label)
+            if len(labels) >= limit:
+                break
+        return labels
+
+
+def _read_csv(path):
+    entries = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f, delimiter=";"):
+            bbox = None
+            if row.get("minx"):
+                bbox = tuple(float(row[k]) for k in ("minx", "miny", "maxx", "maxy"))
+            parent = (row.get("parent") or "").strip()
+            entries.append({
+                "name": row["name"].strip(),
+                "parent": parent,
+                "lat": float(row["lat"]),
+                "lon": float(row["lon"]),
+                "bbox": bbox,
+                "population": int(row.get("population") or 0),
+                "context": normalize(parent),
+            })
+    return entries
+
+
+def _read_geonames(path):
+    rows = []
+    admin_names = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15 or cols[_GN_CLASS] not in ("A", "P"):
+                continue
+            rows.append(cols)
+            code = tuple([cols[_GN_COUNTRY]] + cols[_GN_ADMIN])
+            # Verwaltungseinheiten und Hauptorte liefern die Kontextnamen ("München")
+            if cols[_GN_CLASS] == "A" or cols[_GN_CODE] in ("PPLA", "PPLA2", "PPLA3", "PPLC"):
+                depth = len([c for c in code[1:] if c])
+                admin_names.setdefault(code[:depth + 1], []).append(cols[_GN_NAME])
+
+    entries = []
+    for cols in rows:
+        code = tuple([cols[_GN_COUNTRY]] + cols[_GN_ADMIN])
+        context = []
+        for depth in range(len(code), 0, -1):
+            context.extend(n for n in admin_names.get(code[:depth], []) if n != cols[_GN_NAME])
+        alt = [cols[_GN_ASCII]] + [a for a in cols[_GN_ALT].split(",") if a]
+        entries.append({
+            "name": cols[_GN_NAME],
+            "parent": context[0] if context else "",
+            "lat": float(cols[_GN_LAT]),
+            "lon": float(cols[_GN_LON]),
+            "bbox": None,
+            "population": int(cols[_GN_POP] or 0),
+            "context": normalize(" | ".join(context)),
+            "alt_names": alt,
+        })
+    return entries
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Prozessweiter Gazetteer aus ``FRIGIS_GAZETTEER`` oder None, wenn nicht konfiguriert."""
+    global _gazetteer
+    if not GAZETTEER_PATH or not os.path.exists(GAZETTEER_PATH):
+        return None
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            _gazetteer = Gazetteer.from_file(GAZETTEER_PATH)
+    return _gazetteer
@@ -0,0 +1,251 @@
+"""Interaktive Grid-Karte (deck.gl) mit binär übertragenen Metriken.
+
+Statt GeoJSON pro Zelle gehen nur kompakte Spalten an den Browser, jeweils
+zlib-komprimiert und base64-kodiert:
+
+- Zellindex ``ix``/``iy`` (uint16) im regulären Grid; die Eckpunkte rechnet der
+  Browser über ein quadratisches Polynom (ix, iy) -> (lon, lat) aus, das hier
+  an die exakt projizierten Zellmitten angepasst wird (Restfehler < 1 m).
+- pro Metrik die Werte als uint16 quantisiert zwischen Minimum und Maximum
+  (65535 = NaN) plus eine 256-Farben-Tabelle der Colormap.
+
+Ebenenwahl, Deckkraft, Einfärbung und Hover-Werte laufen komplett im Browser
+(``SolidPolygonLayer`` mit Binär-Attributen); pro Interaktion gibt es keine
+Server-Arbeit. Die Seite ist eigenständiges HTML für ``st.components.v1.html``
+und lädt deck.gl von ``FRIGIS_DECK_JS``.
+"""
+import base64
+import json
+import os
+import zlib
+
+import numpy as np
+import shapely
+from matplotlib import colormaps
+from pyproj import Transformer
+
+DECK_JS = os.getenv("FRIGIS_DECK_JS", "https://unpkg.com/deck.gl@9.1/dist.min.js")
+BASEMAP_TILES = "https://basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png"
+NAN_CODE = 65535
+
+
+def _b64(array, compress=True):
+    data = np.ascontiguousarray(array).tobytes()
+    return base64.b64encode(zlib.compress(data, 6) if compress else data).decode("ascii")
+
+
+def _quadratic_terms(ix, iy):
+    ix, iy = np.asarray(ix, dtype=float), np.asarray(iy, dtype=float)
+    return np.column_stack([np.ones_like(ix), ix, iy, ix * ix, ix * iy, iy * iy])
+
+
+def grid_indices(cells):
+    """``(ix, iy, size, (minx, miny))`` regulärer quadratischer Zellen."""
+    bounds = shapely.bounds(np.asarray(cells))
+    size = float(bounds[0, 2] - bounds[0, 0])
+    minx, miny = bounds[:, 0].min(), bounds[:, 1].min()
+    ix = np.rint((bounds[:, 0] - minx) / size).astype(np.int64)
+    iy = np.rint((bounds[:, 1] - miny) / size).astype(np.int64)
+    return ix, iy, size, (minx, miny)
+
+
+def fit_lonlat(ix, iy, size, origin, crs):
+    """Polynomkoeffizienten (ix, iy) -> lon bzw. lat an Zellmitten, plus max. Restfehler in m."""
+    x = origin[0] + (ix + 0.5) * size
+    y = origin[1] + (iy + 0.5) * size
+    lon, lat = Transformer.from_crs(crs, 4326, always_xy=True).transform(x, y)
+    # Teilmenge reicht für 6 Koeffizienten; Restfehler auf allen Zellen
+    step = max(1, len(ix) // 20_000)
+    terms = _quadratic_terms(ix, iy)
+    c_lon = np.linalg.lstsq(terms[::step], lon[::step], rcond=None)[0]
+    c_lat = np.linalg.lstsq(terms[::step], lat[::step], rcond=None)[0]
+    lat0 = np.radians(np.mean(lat))
+    fehler = np.hypot((terms @ c_lon - lon) * 111_320 * np.cos(lat0), (terms @ c_lat - lat) * 110_574)
+    return c_lon, c_lat, float(fehler.max()) if len(fehler) else 0.0
+
+
+def encode_layer(values, title, cmap, digits=2):
+    """Eine Metrik als uint16-Codes plus Farbtabelle und Farbskala (2.-98. Perzentil)."""
+    values = np.asarray(values, dtype=float)
+    finite = np.isfinite(values)
+    lo, hi = (float(values[finite].min()), float(values[finite].max())) if finite.any() else (0.0, 1.0)
+    span = hi - lo if hi > lo else 1.0
+    codes = np.full(len(values), NAN_CODE, dtype="<u2")
+    codes[finite] = np.rint((values[finite] - lo) / span * (NAN_CODE - 1)).astype("<u2")
+    cmin, cmax = (np.percentile(values[finite], [2, 98]) if finite.any() else (lo, hi))
+    lut = (colormaps[cmap](np.linspace(0, 1, 256)) * 255).astype(np.uint8)
+    return {"title": title, "min": lo, "max": lo + span, "cmin": float(cmin),
+            "cmax": float(cmax) if cmax > cmin else float(cmin) + 1e-9,
+            "digits": digits, "codes": _b64(codes), "lut": _b64(lut, compress=False)}
+
+
+def grid_payload(cells, crs, layers):
+    """Kodierte Grid-Karte: ``layers`` ist eine Liste ``(werte, titel, cmap[, stellen])``."""
+    ix, iy, size, origin = grid_indices(cells)
+    c_lon, c_lat, fehler = fit_lonlat(ix, iy, size, origin, crs)
+    return {
+        "n": int(len(ix)),
+        "lon": c_lon.tolist(), "lat": c_lat.tolist(), "fit_error_m": round(fehler, 3),
+        "ix": _b64(ix.astype("<u2")), "iy": _b64(iy.astype("<u2")),
+        "layers": [encode_layer(*layer) for layer in layers],
+    }
+
+
+def grid_map_html(cells, crs, layers, height=560):
+    """Eigenständige HTML-Seite mit der interaktiven Grid-Karte."""
+    payload = json.dumps(grid_payload(cells, crs, layers), separators=(",", ":"))
+    return (_TEMPLATE.replace("__DECK_JS__", DECK_JS).replace("__TILES__", BASEMAP_TILES)
+            .replace("__HEIGHT__", str(height)).replace("__PAYLOAD__", payload))
+
+
+_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8">
+<script src="__DECK_JS__"></script>
+<style>
+  body { margin: 0; font: 13px sans-serif; }
+  #map { position: relative; width: 100%; height: __HEIGHT__px; }
+  #panel { position: absolute; top: 8px; left: 8px; z-index: 1; background: rgba(255,255,255,.92);
+           padding: 6px 8px; border-radius: 4px; box-shadow: 0 1px 4px rgba(0,0,0,.3); }
+  #legend { height: 10px; width: 180px; margin-top: 4px; }
+  #range { display: flex; justify-content: space-between; width: 180px; }
+</style></head>
+<body><div id="map"><div id="panel">
+  <select id="layer"></select>
+  <label>Opacity <input id="opacity" type="range" min="0" max="1" step="0.05" value="0.75"></label>
+  <div id="legend"></div><div id="range"><span id="cmin"></span><span id="cmax"></span></div>
+</div></div>
+<script>
+const DATA = __PAYLOAD__;
+const NAN_CODE = 65535;
+
+async function inflate(b64, Type) {
+  const bytes = Uint8Array.from(atob(b64), c => c.charCodeAt(0));
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("deflate"));
+  return new Type(await new Response(stream).arrayBuffer());
+}
+
+function raw(b64) {
+  return Uint8Array.from(atob(b64), c => c.charCodeAt(0));
+}
+
+function poly(c, x, y) {
+  return c[0] + c[1] * x + c[2] * y + c[3] * x * x + c[4] * x * y + c[5] * y * y;
+}
+
+// Geschlossene Zellringe (5 Ecken, im Uhrzeigersinn) als Offsets zu (lon, lat) der Ecke ix=iy=0
+function cellRings(ix, iy) {
+  const n = ix.length, pos = new Float32Array(n * 10);
+  const ox = poly(DATA.lon, -0.5, -0.5), oy = poly(DATA.lat, -0.5, -0.5);
+  const corners = [[-0.5, -0.5], [-0.5, 0.5], [0.5, 0.5], [0.5, -0.5], [-0.5, -0.5]];
+  for (let i = 0; i < n; i++) {
+    for (let k = 0; k < 5; k++) {
+      const x = ix[i] + corners[k][0], y = iy[i] + corners[k][1];
+      pos[i * 10 + k * 2] = poly(DATA.lon, x, y) - ox;
+      pos[i * 10 + k * 2 + 1] = poly(DATA.lat, x, y) - oy;
+    }
+  }
+  return {pos, origin: [ox, oy, 0]};
+}
+
+function decode(layer, code) {
+  return code === NAN_CODE ? NaN : layer.min + code / (NAN_CODE - 1) * (layer.max - layer.min);
+}
+
+function cellColors(layer) {
+  const n = layer.values.length, colors = new Uint8Array(n * 20), lut = layer.lutBytes;
+  const scale = 255 / (layer.cmax - layer.cmin);
+  for (let i = 0; i < n; i++) {
+    const code = layer.values[i];
+    if (code === NAN_CODE) continue;  // transparent
+    const t = Math.min(255, Math.max(0, Math.round((decode(layer, code) - layer.cmin) * scale)));
+    for (let k = 0; k < 5; k++) {
+      const o = i * 20 + k * 4;
+      colors[o] = lut[t * 4]; colors[o + 1] = lut[t * 4 + 1]; colors[o + 2] = lut[t * 4 + 2]; colors[o + 3] = 255;
+    }
+  }
+  return colors;
+}
+
+function format(layer, value) {
+  return Number.isNaN(value) ? "n/a" : value.toFixed(layer.digits);
+}
+
+function tooltip(index) {
+  return DATA.layers.map(l => `${l.title}: ${format(l, decode(l, l.values[index]))}`).join("\\n");
+}
+
+function legend(layer) {
+  const lut = layer.lutBytes, stops = [];
+  for (let s = 0; s <= 10; s++) {
+    const t = Math.round(s * 25.5) * 4;
+    stops.push(`rgb(${lut[t]},${lut[t + 1]},${lut[t + 2]}) ${s * 10}%`);
+  }
+  document.getElementById("legend").style.background = `linear-gradient(to right, ${stops.join(",")})`;
+  document.getElementById("cmin").textContent = format(layer, layer.cmin);
+  document.getElementById("cmax").textContent = format(layer, layer.cmax);
+}
+
+async function main() {
+  const [ix, iy] = await Promise.all([inflate(DATA.ix, Uint16Array), inflate(DATA.iy, Uint16Array)]);
+  for (const layer of DATA.layers) {
+    layer.values = await inflate(layer.codes, Uint16Array);
+    layer.lutBytes = raw(layer.lut);
+  }
+  const rings = cellRings(ix, iy);
+  const startIndices = new Uint32Array(DATA.n).map((_, i) => i * 5);
+  const select = document.getElementById("layer"), opacity = document.getElementById("opacity");
+  DATA.layers.forEach((l, i) => select.add(new Option(l.title, i)));
+
+  let lonMin = Infinity, lonMax = -Infinity, latMin = Infinity, latMax = -Infinity;
+  for (let i = 0; i < rings.pos.length; i += 2) {
+    lonMin = Math.min(lonMin, rings.pos[i]); lonMax = Math.max(lonMax, rings.pos[i]);
+    latMin = Math.min(latMin, rings.pos[i + 1]); latMax = Math.max(latMax, rings.pos[i + 1]);
+  }
+  const container = document.getElementById("map");
+  const view = new deck.WebMercatorViewport({width: container.clientWidth || 800, height: __HEIGHT__})
+    .fitBounds([[rings.origin[0] + lonMin, rings.origin[1] + latMin],
+                [rings.origin[0] + lonMax, rings.origin[1] + latMax]], {padding: 20});
+
+  const basemap = new deck.TileLayer({
+    id: "basemap", data: "__TILES__", minZoom: 0, maxZoom: 19, tileSize: 256,
+    renderSubLayers: props => {
+      const [[west, south], [east, north]] = props.tile.boundingBox;
+      return new deck.BitmapLayer(props, {data: null, image: props.data, bounds: [west, south, east, north]});
+    },
+  });
+  const colorCache = {};
+  function gridLayer() {
+    const i = Number(select.value);
+    colorCache[i] = colorCache[i] || cellColors(DATA.layers[i]);
+    return new deck.SolidPolygonLayer({
+      id: "grid",
+      data: {length: DATA.n, startIndices,
+             attributes: {getPolygon: {value: rings.pos, size: 2}, getFillColor: {value: colorCache[i], size: 4}}},
+      _normalize: false,
+      coordinateSystem: deck.COORDINATE_SYSTEM.LNGLAT_OFFSETS,
+      coordinateOrigin: rings.origin,
+      opacity: Number(opacity.value),
+      pickable: true,
+      autoHighlight: true,
+      highlightColor: [0, 0, 0, 90],
+    });
+  }
+  const map = new deck.Deck({
+    parent: container,
+    initialViewState: {longitude: view.longitude, latitude: view.latitude, zoom: view.zoom},
+    controller: true,
+    layers: [basemap, gridLayer()],
+    getTooltip: ({index, layer}) => layer && layer.id === "grid" && index >= 0 ? tooltip(index) : null,
+  });
+  function update() {
+    legend(DATA.layers[Number(select.value)]);
+    map.setProps({layers: [basemap, gridLayer()]});
+  }
+  select.onchange = update;
+  opacity.oninput = update;
+  legend(DATA.layers[0]);
+}
+
+main();
+</script></body></html>
+"""
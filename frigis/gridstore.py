@@ -0,0 +1,120 @@
+"""Gemeinsamer, spaltenweiser Speicher für das Analyse-Grid eines Jobs.
+
+Die Zellgeometrien liegen einmal als WKB-Spalte vor, jede Stufe hängt nur
+ihre Metrik-Arrays an (``building_ratio``, ``dist_to_green``,
+``temperature_diff``, ``brightness``, ``ndvi``, ...). Persistiert wird als
+unkomprimierte Arrow-IPC-Datei, die per ``memory_map`` ohne Kopie
+zurückgelesen wird; für den Austausch gibt es GeoParquet. Geometrien werden
+erst dekodiert, wenn jemand sie tatsächlich braucht.
+"""
+import json
+import os
+import threading
+
+import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from pyproj import CRS
+
+GEOMETRY = "geometry"
+
+
+class GridStore:
+    def __init__(self, wkb, crs, columns=None):
+        self._wkb = wkb  # pa.BinaryArray, eine Zeile pro Zelle
+        self.crs = CRS.from_user_input(crs)
+        self._columns = {}
+        self._geometry = None
+        for name, values in (columns or {}).items():
+            self.put(name, values)
+
+    @classmethod
+    def from_grid(cls, grid):
+        """Übernimmt Geometrie und alle numerischen Spalten eines GeoDataFrames."""
+        wkb = pa.array(shapely.to_wkb(grid.geometry.values), type=pa.binary())
+        columns = {c: grid[c].to_numpy(dtype="float64") for c in grid.columns
+                   if c != grid.geometry.name and np.issubdtype(grid[c].dtype, np.number)}
+        return cls(wkb, grid.crs, columns)
+
+    def __len__(self):
+        return len(self._wkb)
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    @property
+    def geometry(self):
+        """Zellgeometrien als GeoSeries (einmal dekodiert, dann gemerkt)."""
+        if self._geometry is None:
+            self._geometry = gpd.GeoSeries(shapely.from_wkb(self._wkb.to_numpy(zero_copy_only=False)),
+                                           crs=self.crs)
+        return self._geometry
+
+    def put(self, name, values):
+        """Setzt/ersetzt eine Metrik-Spalte (Länge = Anzahl Zellen)."""
+        values = np.asarray(values, dtype="float64")
+        if values.shape != (len(self),):
+            raise ValueError(f"Column {name!r} has shape {values.shape}, expected ({len(self)},)")
+        self._columns[name] = values
+
+    def update(self, columns):
+        for name, values in columns.items():
+            self.put(name, values)
+
+    def column(self, name):
+        return self._columns[name]
+
+    def to_geodataframe(self, columns=None):
+        names = self.columns if columns is None else [c for c in columns if c in self._columns]
+        return gpd.GeoDataFrame({name: self._columns[name] for name in names},
+                                geometry=self.geometry.values, crs=self.crs)
+
+    def to_table(self):
+        """Arrow-Tabelle mit WKB-Geometrie und GeoParquet-Metadaten (``geo``)."""
+        arrays = [pa.array(values) for values in self._columns.values()] + [self._wkb]
+        names = self.columns + [GEOMETRY]
+        geo = {
+            "version": "1.0.0",
+            "primary_column": GEOMETRY,
+            "columns": {GEOMETRY: {
+                "encoding": "WKB",
+                "geometry_types": ["Polygon"],
+                "crs": json.loads(self.crs.to_json()),
+            }},
+        }
+        return pa.Table.from_arrays(arrays, names=names).replace_schema_metadata({"geo": json.dumps(geo)})
+
+    def save(self, path):
+        """Schreibt atomar als unkomprimiertes Arrow IPC (memory-map-fähig)."""
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        table = self.to_table()
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Liest eine mit ``save`` geschriebene Datei per memory_map; Spalten sind Sichten auf die Datei."""
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        return cls._from_table(table)
+
+    def to_geoparquet(self, path, compression="zstd"):
+        pq.write_table(self.to_table(), path, compression=compression)
+
+    @classmethod
+    def read_geoparquet(cls, path):
+        return cls._from_table(pq.read_table(path))
+
+    @classmethod
+    def _from_table(cls, table):
+        geo = json.loads(table.schema.metadata[b"geo"])
+        crs = CRS.from_json_dict(geo["columns"][GEOMETRY]["crs"])
+        wkb = table[GEOMETRY].combine_chunks()
+        columns = {name: table[name].to_numpy() for name in table.column_names if name != GEOMETRY}
+        return cls(wkb, crs, columns)
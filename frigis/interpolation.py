@@ -0,0 +1,122 @@
+"""Dünne Temperatur-Stichprobe plus räumliche Interpolation auf eine dichte Fläche.
+
+Statt für jeden Punkt des ``resolution_km``-Gitters Open-Meteo zu fragen,
+wird zuerst ein grobes Gitter abgefragt und dann gezielt nachverdichtet:
+dort, wo der nächste Messpunkt weit weg ist und die benachbarten Werte stark
+streuen. Aus den Messpunkten wird vektorisiert per IDW bzw. Gauß-Prozess
+(Kriging) auf die Zielpunkte interpoliert; das Verfahren mit dem kleineren
+Leave-one-out-Fehler gewinnt, der Fehler wird mit ausgegeben.
+
+Koordinaten werden lokal in km umgerechnet (111 km/° Breite, 85 km/° Länge,
+wie im Rest der Temperaturstufe).
+"""
+import numpy as np
+
+KM_PER_DEG_LAT = 111.0
+KM_PER_DEG_LON = 85.0
+
+
+def to_km(lat, lon, lat0, lon0):
+    """Lat/Lon-Arrays -> (n, 2) lokale km-Koordinaten um (lat0, lon0)."""
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    return np.column_stack([(lon - lon0) * KM_PER_DEG_LON, (lat - lat0) * KM_PER_DEG_LAT])
+
+
+def initial_samples(lat0, lon0, radius_km):
+    """Grobes 3×3-Gitter (Ecken, Kantenmitten, Zentrum) über das Analysegebiet."""
+    lats = lat0 + np.array([-1.0, 0.0, 1.0]) * radius_km / KM_PER_DEG_LAT
+    lons = lon0 + np.array([-1.0, 0.0, 1.0]) * radius_km / KM_PER_DEG_LON
+    return [(lat, lon) for lat in lats for lon in lons]
+
+
+def refinement_samples(samples, candidates, n, lat0, lon0, k=3):
+    """Wählt ``n`` zusätzliche Punkte aus ``candidates`` (Liste von (lat, lon)).
+
+    ``samples`` sind die bisherigen Messungen als (lat, lon, temp).
+
+    Bewertung: Abstand zum nächsten Messpunkt × (Spannweite der ``k`` nächsten
+    Messwerte + 0.1 °C). Gierig, nach jeder Wahl werden die Abstände aktualisiert,
+    damit sich die neuen Punkte nicht an einer Stelle ballen.
+    """
+    if n <= 0 or not samples or not candidates:
+        return []
+    known = np.asarray(samples, dtype=float)
+    xy = to_km(known[:, 0], known[:, 1], lat0, lon0)
+    cand = np.asarray(candidates, dtype=float)
+    cxy = to_km(cand[:, 0], cand[:, 1], lat0, lon0)
+
+    d = np.linalg.norm(cxy[:, None, :] - xy[None, :, :], axis=2)
+    nearest = np.argsort(d, axis=1)[:, :min(k, len(xy))]
+    spread = np.ptp(known[:, 2][nearest], axis=1) + 0.1
+    d_min = d.min(axis=1)
+
+    chosen = []
+    for _ in range(min(n, len(cand))):
+        score = d_min * spread
+        i = int(np.argmax(score))
+        if score[i] <= 1e-9:
+            break  # alle Kandidaten bereits gemessen
+        chosen.append((float(cand[i, 0]), float(cand[i, 1])))
+        d_min = np.minimum(d_min, np.linalg.norm(cxy - cxy[i], axis=1))
+    return chosen
+
+
+def idw(xy, values, targets, power=2.0):
+    """Inverse-Distance-Weighting, vektorisiert über alle Zielpunkte."""
+    d = np.linalg.norm(targets[:, None, :] - xy[None, :, :], axis=2)
+    exact = d < 1e-9
+    w = 1.0 / np.maximum(d, 1e-9) ** power
+    out = (w @ values) / w.sum(axis=1)
+    hit = exact.any(axis=1)
+    out[hit] = values[exact[hit].argmax(axis=1)]
+    return out
+
+
+def _idw_loo(xy, values, power):
+    """Leave-one-out-Vorhersagen für IDW ohne Schleife (Diagonale ausgeblendet)."""
+    d = np.linalg.norm(xy[:, None, :] - xy[None, :, :], axis=2)
+    np.fill_diagonal(d, np.inf)
+    w = 1.0 / np.maximum(d, 1e-9) ** power
+    return (w @ values) / w.sum(axis=1)
+
+
+def _gp(xy, values):
+    from sklearn.gaussian_process import GaussianProcessRegressor
+    from sklearn.gaussian_process.kernels import ConstantKernel, RBF, WhiteKernel
+
+    kernel = ConstantKernel(1.0) * RBF(length_scale=1.0, length_scale_bounds=(0.1, 20.0)) \
+        + WhiteKernel(noise_level=0.05, noise_level_bounds=(1e-4, 1.0))
+    return GaussianProcessRegressor(kernel=kernel, normalize_y=True, random_state=0).fit(xy, values)
+
+
+def _gp_loo(xy, values):
+    pred = np.empty(len(values))
+    for i in range(len(values)):
+        mask = np.arange(len(values)) != i
+        pred[i] = _gp(xy[mask], values[mask]).predict(xy[i:i + 1])[0]
+    return pred
+
+
+def interpolate(xy, values, targets, powers=(1.0, 2.0, 3.0), gaussian_process=True):
+    """Interpoliert ``values`` an ``xy`` auf ``targets``.
+
+    Gibt ``(vorhersage, verfahren, loo_rmse)`` zurück; verglichen werden IDW mit
+    mehreren Exponenten und (ab 5 Punkten) ein Gauß-Prozess.
+    """
+    xy, values, targets = np.asarray(xy, float), np.asarray(values, float), np.asarray(targets, float)
+    if len(values) < 3:
+        return idw(xy, values, targets), "IDW (p=2)", float("nan")
+
+    scores = {}
+    for p in powers:
+        scores[("idw", p)] = np.sqrt(np.mean((_idw_loo(xy, values, p) - values) ** 2))
+    if gaussian_process and len(values) >= 5:
+        try:
+            scores[("gp", None)] = np.sqrt(np.mean((_gp_loo(xy, values) - values) ** 2))
+        except Exception:
+            pass  # GP nicht konvergiert - IDW reicht
+
+    (method, p), rmse = min(scores.items(), key=lambda kv: kv[1])
+    if method == "gp":
+        return _gp(xy, values).predict(targets), "Gaussian process (kriging)", float(rmse)
+    return idw(xy, values, targets, p), f"IDW (p={p:g})", float(rmse)
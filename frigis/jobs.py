@@ -0,0 +1,742 @@
+"""Hintergrund-Jobs für die Analysestufen, entkoppelt vom Streamlit-Script-Thread.
+
+Eine Analyse wird als Job mit ID eingereicht und von einem Worker-Pool
+ausgeführt. Status, Fortschritt, Meldungen und die Zwischenergebnisse jeder
+Stufe liegen unter ``FRIGIS_JOB_DIR/<job_id>/``; die App pollt nur diesen
+Zustand und rendert fertige Stufen. Ein abgebrochener Job setzt bei fertigen
+Stufen wieder auf, statt sie neu zu rechnen: Der Worker erneuert seinen Claim
+regelmäßig (Heartbeat); bleibt er ``FRIGIS_CLAIM_TIMEOUT`` Sekunden aus, gilt
+der Worker als abgestürzt und der Job wird wieder eingereiht. Die Metriken aller Stufen landen
+zusätzlich spaltenweise in ``grid.arrow`` (``frigis.gridstore``).
+
+Jede Analyse hat ein Zeitbudget (``frigis.deadlines``); eine Stufe, die wegen
+ihres Budgets Daten auslässt, meldet das und liefert ein partielles Ergebnis
+(``"partial": True``). Wartezeit auf Zulassung und Speicher zählt nicht mit.
+Vor jeder Stufe wird ihr geschätzter Speicherbedarf reserviert (``frigis.memory``);
+passt er nicht in den Anteil des Jobs, schlägt die Stufe mit Meldung fehl.
+
+Fertige, vollständige Jobs dienen als Ergebnis-Cache: eine neue Anfrage mit
+denselben Parametern (Stadtteil normalisiert) bekommt für ``FRIGIS_RESULT_TTL_HOURS``
+den vorhandenen Job statt einer Neuberechnung. ``prewarm`` rechnet die
+beliebtesten Stadtteile vorab, z.B. nachts per Cron:
+``python -m frigis.jobs prewarm --workers 2``
+
+Vollständige Jobs werden zusätzlich als unveränderliches Bündel abgelegt
+(``frigis.bundles``); ``?bundle=<id>`` in der App zeigt es ohne Neuberechnung.
+
+Worker-Modi (``FRIGIS_JOB_MODE``):
+
+- ``thread``   Thread-Pool im Web-Prozess (Standard)
+- ``process``  Prozess-Pool (spawn) im Web-Prozess
+- ``external`` Web-Prozess reiht nur ein; Worker laufen separat:
+               ``python -m frigis.jobs worker --workers 4``
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import pickle
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from frigis.pipeline import (prepare_area, gebaeudedichte_analysieren_und_plotten,
+                             distanz_zu_gruenflaechen_analysieren_und_plotten,
+                             lade_temperaturreihen, temperatur_karte, temperatur_pro_zelle,
+                             analysiere_reflektivitaet_graustufen, prioritaet_analysieren_und_plotten,
+                             lade_hauptstrassen, baumarten_empfehlen,
+                             strassenbaeume_analysieren_und_plotten,
+                             schatten_analysieren_und_plotten, shade_resolution)
+from frigis.buildings import METRICS as BUILDING_METRICS
+from frigis.deadlines import ANALYSIS_BUDGET, Deadline, StageBudget
+from frigis.bundles import get_bundle_store, normalized_params
+from frigis.gridmap import grid_map_html
+from frigis.gridstore import GridStore
+from frigis.memory import memory, stage_estimate
+from frigis.ratelimit import STAGE_COST, admission, current_client
+
+JOB_DIR = os.getenv("FRIGIS_JOB_DIR", ".frigis_jobs")
+JOB_WORKERS = int(os.getenv("FRIGIS_JOB_WORKERS", "2"))
+JOB_MODE = os.getenv("FRIGIS_JOB_MODE", "thread")
+RESULT_TTL = float(os.getenv("FRIGIS_RESULT_TTL_HOURS", "24")) * 3600
+# Ohne Heartbeat so viele Sekunden -> Claim verwaist, Job wird neu eingereiht
+CLAIM_TIMEOUT = float(os.getenv("FRIGIS_CLAIM_TIMEOUT", "120"))
+HEARTBEAT_INTERVAL = CLAIM_TIMEOUT / 4
+# Stadtteile für ``prewarm`` (Semikolon-getrennt, Namen enthalten Kommas)
+PREWARM_DISTRICTS = [d.strip() for d in os.getenv("FRIGIS_PREWARM_DISTRICTS", ";".join([
+    "Maxvorstadt, München", "Schwabing, München", "Altstadt-Lehel, München",
+    "Ludwigsvorstadt-Isarvorstadt, München", "Au-Haidhausen, München", "Sendling, München",
+    "Neuhausen-Nymphenburg, München", "Bogenhausen, München", "Schwanthalerhöhe, München",
+    "Giesing, München",
+])).split(";") if d.strip()]
+
+# (Name, Titel in der App, Fehlertext-Präfix)
+STAGES = [
+    ("building_density", "Building Density", "Building density analysis failed"),
+    ("distance_to_green", "Distance to Green Spaces", "Green space analysis failed"),
+    ("temperature", "Temperature Difference Heatmap", "Temperature analysis failed"),
+    ("satellite", "k-Means Cluster Analysis of Satellite Data", "Satellite data analysis failed"),
+    ("shade", "Shade and Sky View Factor", "Shade analysis failed"),
+    # Liest nur den Grid-Speicher, muss nach den übrigen Stufen laufen
+    ("priority", "Heat Priority and Planting Sites", "Priority analysis failed"),
+    # Empfiehlt Arten für die Standorte der Prioritätsstufe
+    ("species", "Tree Species Recommendation", "Species recommendation failed"),
+    ("street_trees", "Street-Tree Candidates", "Street-tree siting failed"),
+]
+
+ACTIVE = ("queued", "running")
+
+
+def params_key(params):
+    return json.dumps(params, sort_keys=True, ensure_ascii=False)
+
+
+def cache_key(params):
+    """Wie ``params_key``, aber Schreibweisen desselben Stadtteils fallen zusammen."""
+    return params_key(normalized_params(params))
+
+
+def is_complete(job):
+    return job["status"] == "done" and not job.get("partial") and all(
+        stufe["status"] == "done" and not stufe.get("partial") for stufe in job["stages"].values())
+
+
+class JobStore:
+    """Job-Zustand als JSON plus Stufen-Ergebnisse als Pickle, ein Verzeichnis pro Job."""
+
+    def __init__(self, root=JOB_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, job_id, name="job.json"):
+        return os.path.join(self.root, job_id, name)
+
+    def create(self, params):
+        job_id = uuid.uuid4().hex[:12]
+        os.makedirs(os.path.join(self.root, job_id))
+        now = time.time()
+        job = {
+            "id": job_id,
+            "params": params,
+            "key": params_key(params),
+            "status": "queued",
+            "error": None,
+            "messages": [],
+            "partial": False,  # Gebiet nur teilweise geladen (OSM-Daten fehlen)
+            "created": now,
+            "updated": now,
+            "stages": {
+                name: {"status": "queued", "progress": 0.0, "text": "", "messages": [], "error": None,
+                       "partial": False}
+                for name, _, _ in STAGES
+            },
+        }
+        self._write(job)
+        return job
+
+    def load(self, job_id):
+        try:
+            with open(self._path(job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write(self, job):
+        job["updated"] = time.time()
+        tmp = self._path(job["id"], f"job.json.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp, self._path(job["id"]))
+
+    def update(self, job_id, fn):
+        """Read-modify-write des Job-Zustands (ein Job wird nur von einem Worker geschrieben)."""
+        with self._lock:
+            job = self.load(job_id)
+            fn(job)
+            self._write(job)
+        return job
+
+    def save_result(self, job_id, name, obj):
+        tmp = self._path(job_id, f"{name}.pkl.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(job_id, f"{name}.pkl"))
+
+    def load_result(self, job_id, name):
+        try:
+            with open(self._path(job_id, f"{name}.pkl"), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save_grid(self, job_id, grid_store):
+        grid_store.save(self._path(job_id, "grid.arrow"))
+
+    def load_grid(self, job_id):
+        """Grid-Tabelle des Jobs (memory-mapped) oder None, wenn noch nicht angelegt."""
+        path = self._path(job_id, "grid.arrow")
+        return GridStore.load(path) if os.path.exists(path) else None
+
+    def _latest_path(self, params):
+        digest = hashlib.sha1(cache_key(params).encode()).hexdigest()[:20]
+        return os.path.join(self.root, "_latest", digest)
+
+    def mark_latest(self, job):
+        """Merkt den Job als jüngstes Ergebnis für seine Parameter."""
+        path = self._latest_path(job["params"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(job["id"])
+        os.replace(tmp, path)
+
+    def fresh(self, params, max_age=RESULT_TTL):
+        """Jüngster vollständige Job für ``params``, wenn nicht älter als ``max_age`` Sekunden."""
+        try:
+            with open(self._latest_path(params), encoding="utf-8") as f:
+                job = self.load(f.read().strip())
+        except FileNotFoundError:
+            return None
+        if job and is_complete(job) and time.time() - job["updated"] <= max_age:
+            return job
+        return None
+
+    def has_result(self, job_id, name):
+        return os.path.exists(self._path(job_id, f"{name}.pkl"))
+
+    def claim(self, job_id):
+        """Atomar: genau ein Worker bekommt den Job."""
+        try:
+            os.close(os.open(self._path(job_id, "claimed"), os.O_CREAT | os.O_EXCL))
+            return True
+        except FileExistsError:
+            return False
+
+    def heartbeat(self, job_id):
+        """Lebenszeichen des Workers: mtime der Claim-Datei."""
+        try:
+            os.utime(self._path(job_id, "claimed"))
+        except FileNotFoundError:
+            pass
+
+    def stale(self, job, timeout=CLAIM_TIMEOUT):
+        """Aktiver, beanspruchter Job, dessen Worker seit ``timeout`` s kein Lebenszeichen gab."""
+        if job is None or job["status"] not in ACTIVE:
+            return False
+        try:
+            return time.time() - os.path.getmtime(self._path(job["id"], "claimed")) > timeout
+        except FileNotFoundError:
+            return False
+
+    def requeue(self, job_id, timeout=CLAIM_TIMEOUT):
+        """Gibt einen verwaisten Claim frei und reiht den Job wieder ein; genau ein Aufrufer gewinnt."""
+        claim = self._path(job_id, "claimed")
+        verwaist = f"{claim}.{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(claim, verwaist)
+        except FileNotFoundError:
+            return False  # schon freigegeben
+        if time.time() - os.path.getmtime(verwaist) <= timeout:
+            os.rename(verwaist, claim)  # inzwischen neu beansprucht
+            return False
+        os.remove(verwaist)
+        self.update(job_id, lambda job: job.update(status="queued"))
+        return True
+
+    def requeue_stale(self, timeout=CLAIM_TIMEOUT):
+        """Reiht alle Jobs abgestürzter Worker wieder ein und gibt ihre IDs zurück."""
+        return [job_id for job_id in sorted(os.listdir(self.root))
+                if self.stale(self.load(job_id), timeout) and self.requeue(job_id, timeout)]
+
+    def queued(self):
+        ids = []
+        for job_id in sorted(os.listdir(self.root)):
+            if not os.path.exists(self._path(job_id, "claimed")):
+                job = self.load(job_id)
+                if job and job["status"] == "queued":
+                    ids.append((job["created"], job_id))
+        return [job_id for _, job_id in sorted(ids)]
+
+    def active(self, exclude=()):
+        """IDs eingereihter und laufender (auch beanspruchter) Jobs ohne verwaiste Claims."""
+        ids = []
+        for job_id in sorted(os.listdir(self.root)):
+            if job_id in exclude:
+                continue
+            job = self.load(job_id)
+            if job and job["status"] in ACTIVE and not self.stale(job):
+                ids.append(job_id)
+        return ids
+
+
+class _JobProgress:
+    def __init__(self, ui):
+        self._ui = ui
+
+    def progress(self, value, text=None):
+        self._ui._set_progress(value, text)
+
+    def empty(self):
+        self._ui._set_progress(None, "")
+
+
+class JobUI:
+    """``ui``-Objekt für die Pipeline: schreibt Meldungen/Fortschritt in den Job-Zustand."""
+
+    def __init__(self, store, job_id, stage=None, min_interval=0.25):
+        self.store = store
+        self.job_id = job_id
+        self.stage = stage
+        self.min_interval = min_interval
+        self._last = 0.0
+
+    def _target(self, job):
+        return job["stages"][self.stage] if self.stage else job
+
+    def _message(self, level, body):
+        self.store.update(self.job_id,
+                          lambda job: self._target(job)["messages"].append({"level": level, "text": str(body)}))
+
+    def info(self, body):
+        self._message("info", body)
+
+    def warning(self, body):
+        self._message("warning", body)
+
+    def error(self, body):
+        self._message("error", body)
+
+    def success(self, body):
+        self._message("success", body)
+
+    def progress(self, value, text=None):
+        self._set_progress(value, text, force=True)
+        return _JobProgress(self)
+
+    def _set_progress(self, value, text, force=False):
+        now = time.monotonic()
+        if not force and value not in (None, 1.0) and now - self._last < self.min_interval:
+            return
+        self._last = now
+
+        def apply(job):
+            target = self._target(job)
+            if value is not None:
+                target["progress"] = float(value)
+            target["text"] = text or ""
+        self.store.update(self.job_id, apply)
+
+
+def _figure_png(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=150, bbox_inches="tight")
+    return buf.getvalue()
+
+
+def _grid_view(area):
+    # Flache Kopie: Stufen ergänzen Spalten, die Geometrien werden nicht kopiert
+    return area["grid"].copy(deep=False)
+
+
+def _columns(grid, names):
+    """Metrik-Spalten einer Stufe für den gemeinsamen Grid-Speicher."""
+    return {c: grid[c].to_numpy(dtype="float64") for c in names if c in grid}
+
+
+def _grid_map(grid, layers):
+    """Interaktive Karte der vorhandenen ``(spalte, titel, cmap, stellen)``-Ebenen."""
+    layers = [(grid[c].to_numpy(dtype="float64"), *rest) for c, *rest in layers if c in grid]
+    return grid_map_html(grid.geometry.values, grid.crs, layers) if layers else None
+
+
+def _stage_building_density(area, params, ui, grid_store):
+    grid = _grid_view(area)
+    fig = gebaeudedichte_analysieren_und_plotten(grid, area["buildings"], area["gebiet"], ui=ui)
+    layers = [(name, title, cmap, 0 if name == "building_count" else 2)
+              for name, (_, title, cmap) in BUILDING_METRICS.items()]
+    return {"figure_png": _figure_png(fig), "grid_map": _grid_map(grid, layers),
+            "columns": _columns(grid, BUILDING_METRICS)}
+
+
+def _stage_distance_to_green(area, params, ui, grid_store):
+    grid = _grid_view(area)
+    fig = distanz_zu_gruenflaechen_analysieren_und_plotten(grid, area["greens"], area["gebiet"], ui=ui)
+    layers = [("dist_to_green", "Distance to green (m)", "Reds", 0),
+              ("score_distance_norm", "Distance score", "Reds", 2)]
+    return {"figure_png": _figure_png(fig), "grid_map": _grid_map(grid, layers),
+            "columns": _columns(grid, ["dist_to_green", "score_distance_norm"])}
+
+
+def _stage_temperature(area, params, ui, grid_store):
+    # Reihen werden mitgespeichert: andere Jahre/Statistiken rendert die App lokal
+    reihen = lade_temperaturreihen(ort_name=params["stadtteil"], grid=area["grid"], ui=ui)
+    heatmap = temperatur_karte(reihen, ui=ui) if reihen is not None else None
+    if not heatmap:
+        return None
+    return {"html": heatmap._repr_html_(), "series": reihen,
+            "columns": {"temperature_diff": temperatur_pro_zelle(reihen, area["grid"])}}
+
+
+def _stage_satellite(area, params, ui, grid_store):
+    grid = _grid_view(area)
+    raster = {}
+    fig = analysiere_reflektivitaet_graustufen(params["stadtteil"], n_clusters=5, grid=grid, raster=raster, ui=ui)
+    if not fig:
+        return None
+    return {"figure_png": _figure_png(fig), "labels": raster or None,
+            "columns": _columns(grid, ["brightness", "ndvi", "ndbi", "albedo"])}
+
+
+def _stage_shade(area, params, ui, grid_store):
+    grid = _grid_view(area)
+    fig = schatten_analysieren_und_plotten(grid, area["buildings"], area["gebiet"],
+                                           resolution=shade_resolution(len(grid)), ui=ui)
+    if fig is None:
+        return None
+    return {"figure_png": _figure_png(fig), "columns": _columns(grid, ["shade_fraction", "sky_view_factor"])}
+
+
+def _stage_priority(area, params, ui, grid_store):
+    fig, standorte, prioritaet = prioritaet_analysieren_und_plotten(grid_store, ui=ui)
+    if fig is None:
+        return None
+    return {"figure_png": _figure_png(fig),
+            "sites": standorte.drop(columns="geometry").reset_index(drop=True),
+            "columns": {"heat_priority": prioritaet}}
+
+
+def _stage_species(area, params, ui, grid_store):
+    strassen = lade_hauptstrassen(area["gebiet"], ui=ui)
+    fig, tabelle, spalten = baumarten_empfehlen(grid_store, strassen, ui=ui)
+    if fig is None:
+        return None
+    return {"figure_png": _figure_png(fig), "table": tabelle, "columns": spalten}
+
+
+def _stage_street_trees(area, params, ui, grid_store):
+    fig, kandidaten, spalten = strassenbaeume_analysieren_und_plotten(
+        area["gebiet"], area["buildings"], grid_store, ui=ui)
+    if fig is None:
+        return None
+    return {"figure_png": _figure_png(fig), "table": kandidaten.drop(columns="geometry").reset_index(drop=True),
+            "columns": spalten}
+
+
+def _stage_estimate(name, n_cells):
+    """Speicherbedarf einer Stufe; die Schattenstufe mit der Auflösung, in der sie rechnet."""
+    if name == "shade":
+        return stage_estimate(name, n_cells, resolution=shade_resolution(n_cells))
+    return stage_estimate(name, n_cells)
+
+
+STAGE_FUNCS = {
+    "building_density": _stage_building_density,
+    "distance_to_green": _stage_distance_to_green,
+    "temperature": _stage_temperature,
+    "satellite": _stage_satellite,
+    "shade": _stage_shade,
+    "priority": _stage_priority,
+    "species": _stage_species,
+    "street_trees": _stage_street_trees,
+}
+
+
+def publish_bundle(store, job):
+    """Legt einen vollständigen Job als teilbares Bündel ab; Fehler kosten nur den Permalink."""
+    try:
+        bundle_id = get_bundle_store().publish(store, job)
+    except OSError:
+        traceback.print_exc()
+        return None
+    store.update(job["id"], lambda job: job.update(bundle=bundle_id))
+    return bundle_id
+
+
+def run_analysis_job(job_id, root=JOB_DIR):
+    """Führt alle Stufen eines Jobs aus; fertige Stufen (Pickle vorhanden) werden übersprungen."""
+    store = JobStore(root)
+    halt = threading.Event()
+
+    def heartbeat():
+        while not halt.wait(HEARTBEAT_INTERVAL):
+            store.heartbeat(job_id)
+
+    threading.Thread(target=heartbeat, daemon=True, name=f"frigis-heartbeat-{job_id}").start()
+    try:
+        _run_stages(store, job_id)
+    finally:
+        halt.set()
+
+
+def _run_stages(store, job_id):
+    def set_status(status, error=None):
+        def apply(job):
+            job["status"] = status
+            job["error"] = error
+            job["started" if status == "running" else "finished"] = time.time()
+        store.update(job_id, apply)
+
+    job = store.load(job_id)
+    params = job["params"]
+    # Upstream-Anfragen dieses Jobs werden fair gegen andere Jobs eingereiht
+    current_client.set(job_id)
+    set_status("running")
+    analysis_deadline = Deadline(ANALYSIS_BUDGET)
+    try:
+        area = store.load_result(job_id, "area")
+        if area is None:
+            with StageBudget(analysis_deadline, "area") as deadline:
+                area = prepare_area(params["stadtteil"], large_area=params.get("large_area", False),
+                                    ui=JobUI(store, job_id))
+            if area is None:
+                set_status("failed", "Area could not be found.")
+                return
+            if deadline.partial:
+                store.update(job_id, lambda job: job.update(partial=True))
+            store.save_result(job_id, "area", area)
+
+        # Gemeinsame Grid-Tabelle: Geometrie einmal, jede Stufe hängt ihre Spalten an
+        grid_store = store.load_grid(job_id)
+        if grid_store is None:
+            grid_store = GridStore.from_grid(area["grid"])
+            store.save_grid(job_id, grid_store)
+
+        for name, _, _ in STAGES:
+            if store.has_result(job_id, name):
+                continue
+
+            def mark(status, error=None, partial=False, name=name):
+                def apply(job):
+                    job["stages"][name]["status"] = status
+                    job["stages"][name]["error"] = error
+                    job["stages"][name]["partial"] = partial
+                    # Zeitstempel für Laufzeitauswertungen (z.B. frigis.loadtest)
+                    job["stages"][name]["started" if status == "running" else "finished"] = time.time()
+                    if status == "done":
+                        job["stages"][name]["progress"] = 1.0
+                store.update(job_id, apply)
+
+            mark("running")
+            ui = JobUI(store, job_id, name)
+            try:
+                with contextlib.ExitStack() as zulassung:
+                    # Warten auf Zulassung/Speicher verbraucht kein Analysebudget
+                    with analysis_deadline.paused():
+                        zulassung.enter_context(admission.admit(
+                            STAGE_COST.get(name, 0),
+                            on_wait=lambda: ui.progress(0, text="Waiting for free capacity...")))
+                        zulassung.enter_context(memory.reserve(
+                            job_id, _stage_estimate(name, len(grid_store)),
+                            on_wait=lambda: ui.progress(0, text="Waiting for free memory...")))
+                    # Budget läuft erst ab Zulassung, das Analysebudget begrenzt es nach oben
+                    with StageBudget(analysis_deadline, name) as deadline:
+                        result = STAGE_FUNCS[name](area, params, ui, grid_store)
+                # Partiell nur, wenn die Stufe selbst Daten wegen des Budgets ausgelassen hat
+                partial = deadline.partial
+                if result is not None and partial:
+                    result["partial"] = True
+                if result is not None and result.get("columns"):
+                    grid_store.update(result.pop("columns"))
+                    store.save_grid(job_id, grid_store)
+                store.save_result(job_id, name, result)
+                mark("done", partial=partial)
+            except Exception as e:
+                mark("failed", str(e))
+        # Bündel vor "done" ablegen: wer den fertigen Job sieht, sieht auch den Permalink
+        job = store.load(job_id)
+        job["status"] = "done"
+        if is_complete(job):
+            publish_bundle(store, job)
+        set_status("done")
+        store.mark_latest(store.load(job_id))
+    except Exception as e:
+        traceback.print_exc()
+        set_status("failed", str(e))
+
+
+class JobQueue:
+    """Reiht Jobs ein; identische aktive Aufträge bekommen dieselbe Job-ID."""
+
+    def __init__(self, store, workers=JOB_WORKERS, mode=JOB_MODE):
+        self.store = store
+        self.mode = mode
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._active = {}
+        if mode == "process":
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+        elif mode == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frigis-job")
+        else:
+            self._executor = None
+
+    def submit(self, params):
+        key = params_key(params)
+        fertig = self.store.fresh(params)
+        if fertig is not None:
+            return fertig["id"]  # vorgewärmt oder kürzlich gerechnet
+        with self._lock:
+            job_id = self._active.get(key)
+            if job_id:
+                job = self.store.load(job_id)
+                if job and job["status"] in ACTIVE:
+                    self.resume(job_id)
+                    return job_id
+            job_id = self.store.create(params)["id"]
+            self._active[key] = job_id
+        self._start(job_id)
+        return job_id
+
+    def _start(self, job_id):
+        if self._executor is None or not self.store.claim(job_id):
+            return
+        try:
+            self._executor.submit(run_analysis_job, job_id, self.store.root)
+        except BrokenProcessPool:
+            # Ein Worker-Prozess ist abgestürzt: Pool neu starten
+            self._executor = ProcessPoolExecutor(max_workers=self._workers, mp_context=get_context("spawn"))
+            self._executor.submit(run_analysis_job, job_id, self.store.root)
+
+    def resume(self, job_id):
+        """Setzt einen Job fort, dessen Worker abgestürzt ist; True, wenn neu eingereiht."""
+        if not (self.store.stale(self.store.load(job_id)) and self.store.requeue(job_id)):
+            return False
+        self._start(job_id)
+        return True
+
+    def recover(self):
+        """Alle verwaisten Jobs (z.B. nach Neustart des Web-Prozesses) wieder einreihen."""
+        for job_id in self.store.requeue_stale():
+            self._start(job_id)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Prozessweite Job-Queue (Worker-Pool wird einmal pro Web-Prozess gestartet)."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(JobStore(JOB_DIR))
+            _queue.recover()
+    return _queue
+
+
+def _worker(args):
+    store = JobStore(args.root)
+    if args.mode == "process":
+        executor = ProcessPoolExecutor(max_workers=args.workers, mp_context=get_context("spawn"))
+    else:
+        executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="frigis-job")
+    running = set()
+    print(f"friGIS worker: {args.workers} {args.mode} worker(s) on {args.root}")
+    while True:
+        running = {f for f in running if not f.done()}
+        store.requeue_stale()
+        for job_id in store.queued():
+            if len(running) >= args.workers:
+                break
+            if store.claim(job_id):
+                running.add(executor.submit(run_analysis_job, job_id, args.root))
+        time.sleep(args.poll)
+
+
+def _stage_summary(job):
+    stati = [("partial" if stufe.get("partial") and stufe["status"] == "done" else stufe["status"])
+             for stufe in job["stages"].values()]
+    teile = [f"{stati.count(s)} {s}" for s in ("done", "partial", "failed") if stati.count(s)]
+    return ", ".join(teile) or "-"
+
+
+def prewarm(districts, root=JOB_DIR, workers=2, mode="thread", large_area=False,
+            max_age=RESULT_TTL, force=False, check=False, wait_idle=True, poll=5.0, log=print):
+    """Rechnet die Analyse für ``districts`` vorab und berichtet, was frisch ist.
+
+    Frische Ergebnisse (jünger als ``max_age``, alle Stufen fertig) werden
+    übersprungen, außer bei ``force``. Mit ``wait_idle`` startet ein Stadtteil
+    erst, wenn keine Jobs von Nutzern eingereiht sind oder laufen (im Thread-Modus
+    beansprucht ``submit`` sofort, daher zählen auch laufende Jobs). Die Läufe füllen
+    nebenbei die Datei-Caches (Komposite, COG-Archiv) und die Ergebnis-Zeiger,
+    über die ``JobQueue.submit`` interaktive Anfragen direkt bedient.
+    Gibt ``[(stadtteil, job oder None, zustand)]`` zurück.
+    """
+    store = JobStore(root)
+    executor = (ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+                if mode == "process" else ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frigis-warm"))
+    laeufe, bericht = [], []
+    try:
+        for stadtteil in districts:
+            params = {"stadtteil": stadtteil, "large_area": large_area}
+            job = None if force else store.fresh(params, max_age)
+            if job is not None or check:
+                bericht.append((stadtteil, job, "fresh" if job else "missing"))
+                continue
+            while wait_idle and store.active(exclude={job_id for _, job_id, _, _ in laeufe}):
+                time.sleep(poll)  # Nutzer zuerst
+            job = store.create(params)
+            if store.claim(job["id"]):
+                laeufe.append((stadtteil, job["id"], time.monotonic(),
+                               executor.submit(run_analysis_job, job["id"], root)))
+                log(f"warming {stadtteil} ({job['id']})")
+        for stadtteil, job_id, start, future in laeufe:
+            future.result()
+            job = store.load(job_id)
+            zustand = "warmed" if is_complete(job) else f"incomplete ({_stage_summary(job)})"
+            bericht.append((stadtteil, job, zustand))
+            log(f"{stadtteil}: {zustand} in {time.monotonic() - start:.0f} s")
+    finally:
+        executor.shutdown(wait=True)
+
+    breite = max((len(d) for d, _, _ in bericht), default=10)
+    for stadtteil, job, zustand in bericht:
+        alter = f"{(time.time() - job['updated']) / 3600:5.1f} h" if job else "      -"
+        stufen = _stage_summary(job) if job else "-"
+        log(f"{stadtteil:<{breite}}  {zustand:<10}  {alter}  {job['id'] if job else '-':<12}  {stufen}")
+    return bericht
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="friGIS Hintergrund-Worker")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    worker = sub.add_parser("worker", help="Eingereihte Jobs abarbeiten")
+    worker.add_argument("--workers", type=int, default=JOB_WORKERS)
+    worker.add_argument("--mode", choices=["thread", "process"], default="process")
+    worker.add_argument("--root", default=JOB_DIR)
+    worker.add_argument("--poll", type=float, default=1.0)
+    warm = sub.add_parser("prewarm", help="Beliebte Stadtteile vorab rechnen (z.B. nachts per Cron)")
+    warm.add_argument("districts", nargs="*", help="Stadtteile (Standard: FRIGIS_PREWARM_DISTRICTS)")
+    warm.add_argument("--file", help="Datei mit einem Stadtteil pro Zeile")
+    warm.add_argument("--workers", type=int, default=2)
+    warm.add_argument("--mode", choices=["thread", "process"], default="thread")
+    warm.add_argument("--root", default=JOB_DIR)
+    warm.add_argument("--large-area", action="store_true")
+    warm.add_argument("--max-age-hours", type=float, default=RESULT_TTL / 3600)
+    warm.add_argument("--force", action="store_true", help="Auch frische Ergebnisse neu rechnen")
+    warm.add_argument("--check", action="store_true", help="Nur berichten, was frisch ist")
+    warm.add_argument("--no-wait-idle", action="store_true", help="Nicht auf wartende Nutzer-Jobs warten")
+    args = parser.parse_args()
+    if args.cmd == "worker":
+        _worker(args)
+        return
+    districts = list(args.districts)
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            districts += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    bericht = prewarm(districts or PREWARM_DISTRICTS, root=args.root, workers=args.workers, mode=args.mode,
+                      large_area=args.large_area, max_age=args.max_age_hours * 3600, force=args.force,
+                      check=args.check, wait_idle=not args.no_wait_idle)
+    if any(zustand not in ("fresh", "warmed") for _, _, zustand in bericht):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    _main()
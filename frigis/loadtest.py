@@ -0,0 +1,282 @@
+"""Lasttest: N simulierte Nutzer laufen gleichzeitig durch den Ablauf der App.
+
+Jeder Nutzer macht, was die Hauptseite macht: Stadtteil eingeben, "Start
+Analysis" (Job einreichen über ``get_job_queue().submit``) und den Job im
+Takt der Seite pollen, bis alle Stufen fertig sind. Die Upstreams sind lokale
+Stand-ins (``frigis.standins``) mit einstellbarer Latenz und Fehlerquote; Job-,
+Bündel- und Komposit-Verzeichnisse liegen in einem Temp-Verzeichnis, damit
+kein vorhandener Cache das Ergebnis verfälscht.
+
+Berichtet werden Durchsatz, Perzentile der Gesamtdauer und jeder Stufe
+(aus den Zeitstempeln in ``job.json``), Fehler/Teilergebnisse sowie der
+Speicher (RSS des Prozesses und von ``frigis.memory`` verbuchte Bytes; mit
+``--mode process`` nur der einreichende Prozess, nicht die Worker)::
+
+    python -m frigis.loadtest --users 8 --ramp 10 --latency 0.2 --error-rate 0.02
+    python -m frigis.loadtest --users 16 --workers 4 --upstream overpass=1.5:0.1 --json report.json
+
+Die Umlenkung wirkt über Umgebungsvariablen beim Import von ``frigis``; der
+Lasttest muss daher in einem frischen Prozess laufen.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from frigis.standins import SERVICES, StandIns, Upstream
+
+PERCENTILES = (50, 90, 99)
+
+
+class MemorySampler(threading.Thread):
+    """Misst periodisch RSS des Prozesses und die in ``frigis.memory`` verbuchten Bytes."""
+
+    def __init__(self, interval=0.5):
+        super().__init__(name="loadtest-memory", daemon=True)
+        self.interval = interval
+        self.samples = []  # (t, rss, verbucht)
+        self._halt = threading.Event()
+
+    @staticmethod
+    def rss():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            # Ohne /proc nur der bisherige Spitzenwert (Linux: KiB)
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def run(self):
+        from frigis.memory import memory
+
+        while not self._halt.is_set():
+            self.samples.append((time.time(), self.rss(), memory.usage()))
+            self._halt.wait(self.interval)
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    werte = np.asarray(values, dtype=float)
+    summary = {f"p{p}": round(float(np.percentile(werte, p)), 2) for p in PERCENTILES}
+    summary.update(n=len(werte), mean=round(float(werte.mean()), 2), max=round(float(werte.max()), 2))
+    return summary
+
+
+def simulate_user(queue, stadtteil, large_area, start_delay, poll, timeout, results, index):
+    """Ein Nutzer: warten (Ramp-up), Analyse starten, pollen bis fertig."""
+    time.sleep(start_delay)
+    eintrag = {"user": index, "stadtteil": stadtteil, "submitted": time.time()}
+    try:
+        job_id = queue.submit({"stadtteil": stadtteil, "large_area": large_area})
+        eintrag["job"] = job_id
+        ende = eintrag["submitted"] + timeout
+        while True:
+            job = queue.store.load(job_id)
+            if job["status"] not in ("queued", "running") or time.time() > ende:
+                break
+            time.sleep(poll)
+        eintrag.update(seen=time.time(), status=job["status"], error=job.get("error"), snapshot=job)
+        if job["status"] in ("queued", "running"):
+            eintrag["status"] = "timeout"
+    except Exception as e:
+        eintrag.update(seen=time.time(), status="error", error=str(e))
+    results[index] = eintrag
+
+
+def summarize(results, upstream_stats, samples, wall):
+    """Bericht als Dict: Durchsatz, Latenzen, Fehler, Speicher, Upstream-Zähler."""
+    fertig = [r for r in results if r.get("status") == "done"]
+    stufen, fehler, teilweise = {}, {}, {}
+    warte, flaeche = [], []
+    for r in fertig + [r for r in results if r.get("status") == "failed"]:
+        job = r["snapshot"]
+        if job.get("started"):
+            warte.append(job["started"] - job["created"])
+        anfaenge = [s["started"] for s in job["stages"].values() if s.get("started")]
+        if job.get("started") and anfaenge:
+            flaeche.append(min(anfaenge) - job["started"])
+        for name, stufe in job["stages"].items():
+            if stufe["status"] == "done" and stufe.get("started") and stufe.get("finished"):
+                stufen.setdefault(name, []).append(stufe["finished"] - stufe["started"])
+            if stufe["status"] == "failed":
+                fehler[name] = fehler.get(name, 0) + 1
+            if stufe.get("partial"):
+                teilweise[name] = teilweise.get(name, 0) + 1
+    status = {}
+    for r in results:
+        status[r.get("status", "missing")] = status.get(r.get("status", "missing"), 0) + 1
+    rss = [s[1] for s in samples]
+    verbucht = [s[2] for s in samples]
+    return {
+        "users": len(results),
+        "wall_s": round(wall, 2),
+        "completed": len(fertig),
+        # ohne fehlgeschlagene oder durch das Zeitbudget abgeschnittene Stufe
+        "complete_results": sum(all(st["status"] == "done" and not st.get("partial")
+                                    for st in r["snapshot"]["stages"].values()) for r in fertig),
+        "status": status,
+        "throughput_per_min": round(60 * len(fertig) / wall, 2) if wall > 0 else None,
+        "end_to_end_s": _percentiles([r["seen"] - r["submitted"] for r in fertig]),
+        "queue_wait_s": _percentiles(warte),
+        "area_s": _percentiles(flaeche),
+        "stages_s": {name: _percentiles(werte) for name, werte in stufen.items()},
+        "failed_stages": fehler,
+        "partial_stages": teilweise,
+        "errors": sorted({r["error"] for r in results if r.get("error")}),
+        "memory_mb": {
+            "rss_start": round(rss[0] / 2**20, 1) if rss else None,
+            "rss_peak": round(max(rss) / 2**20, 1) if rss else None,
+            "accounted_peak": round(max(verbucht) / 2**20, 1) if verbucht else None,
+        },
+        "upstreams": upstream_stats,
+    }
+
+
+def run(users=4, ramp=0.0, districts=None, large_area=False, workers=None, mode="thread",
+        upstreams=None, poll=0.5, timeout=900.0, root=None, log=print):
+    """Startet Stand-ins und ``users`` Nutzer, wartet auf alle und gibt ``summarize(...)`` zurück.
+
+    ``districts``: Anzahl verschiedener Stadtteile, auf die die Nutzer verteilt
+    werden (Standard: jeder Nutzer einen eigenen, also ohne geteilte Caches).
+    ``upstreams``: ``{dienst: Upstream}`` für Latenz/Fehler der Stand-ins.
+    """
+    if "frigis.pipeline" in sys.modules:
+        raise RuntimeError("frigis.pipeline is already imported; run the load test in a fresh process")
+    root = root or tempfile.mkdtemp(prefix="frigis-loadtest-")
+    standins = StandIns(upstreams, cog_dir=os.path.join(root, "cogs")).start()
+    os.environ.update(standins.env())
+    os.environ.setdefault("OPENCAGE_API_KEY", "loadtest")
+    os.environ.update({
+        "FRIGIS_JOB_DIR": os.path.join(root, "jobs"),
+        "FRIGIS_BUNDLE_DIR": os.path.join(root, "bundles"),
+        "FRIGIS_COMPOSITE_DIR": os.path.join(root, "composites"),
+        "FRIGIS_BLOCK_CACHE_DIR": os.path.join(root, "blocks"),
+        "FRIGIS_JOB_MODE": mode,
+    })
+    os.environ.pop("FRIGIS_COG_ARCHIVE", None)
+    os.environ.pop("FRIGIS_GAZETTEER", None)  # Stadtteile sollen über OpenCage laufen
+    if workers:
+        os.environ["FRIGIS_JOB_WORKERS"] = str(workers)
+
+    import osmnx as ox
+    from frigis.jobs import JOB_WORKERS, get_job_queue
+
+    ox.settings.cache_folder = os.path.join(root, "osmnx")
+    queue = get_job_queue()
+    namen = [f"Loadtest {i % (districts or users) + 1}" for i in range(users)]
+    log(f"{users} users, {len(set(namen))} districts, {JOB_WORKERS} workers ({mode}), root {root}")
+
+    sampler = MemorySampler()
+    sampler.start()
+    results = [None] * users
+    start = time.time()
+    threads = [threading.Thread(target=simulate_user, name=f"loadtest-user-{i}",
+                                args=(queue, name, large_area, ramp * i / max(users, 1), poll, timeout,
+                                      results, i))
+               for i, name in enumerate(namen)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sampler.stop()
+        standins.stop()
+    wall = max((r["seen"] for r in results if r and "seen" in r), default=time.time()) - start
+    return summarize([r or {} for r in results], standins.stats(), sampler.samples, wall)
+
+
+def format_report(report):
+    zeilen = [
+        f"users {report['users']}, completed {report['completed']} "
+        f"({report['complete_results']} without failed/partial stages), status {report['status']}",
+        f"wall {report['wall_s']} s, throughput {report['throughput_per_min']} analyses/min",
+        "",
+        f"{'latency (s)':<20}" + "".join(f"{k:>8}" for k in ("n", "p50", "p90", "p99", "max")),
+    ]
+
+    def zeile(name, werte):
+        if werte:
+            zeilen.append(f"{name:<20}" + "".join(f"{werte[k]:>8}" for k in ("n", "p50", "p90", "p99", "max")))
+
+    zeile("end to end", report["end_to_end_s"])
+    zeile("queue wait", report["queue_wait_s"])
+    zeile("area", report["area_s"])
+    for name, werte in report["stages_s"].items():
+        zeile(f"  {name}", werte)
+    if report["failed_stages"]:
+        zeilen.append(f"failed stages: {report['failed_stages']}")
+    if report["partial_stages"]:
+        zeilen.append(f"partial stages: {report['partial_stages']}")
+    for fehler in report["errors"][:5]:
+        zeilen.append(f"error: {fehler}")
+    m = report["memory_mb"]
+    zeilen += ["", f"memory: RSS {m['rss_start']} -> peak {m['rss_peak']} MB, "
+                   f"accounted peak {m['accounted_peak']} MB", "",
+               f"{'upstream':<12}{'requests':>10}{'errors':>8}{'MB':>8}"]
+    for name, s in report["upstreams"].items():
+        zeilen.append(f"{name:<12}{s['requests']:>10}{s['errors']:>8}{s['bytes'] / 2**20:>8.1f}")
+    return "\n".join(zeilen)
+
+
+def _upstream_spec(text):
+    """``dienst=latenz[:fehlerquote]`` -> (dienst, latenz, fehlerquote)."""
+    name, _, value = text.partition("=")
+    latency, _, error_rate = value.partition(":")
+    if name not in SERVICES:
+        raise argparse.ArgumentTypeError(f"unknown upstream {name!r}, expected one of {', '.join(SERVICES)}")
+    return name, float(latency), float(error_rate) if error_rate else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m frigis.loadtest",
+                                     description="Concurrent-session load test against local upstream stand-ins")
+    parser.add_argument("--users", type=int, default=4, help="simulated concurrent users")
+    parser.add_argument("--ramp", type=float, default=0.0, help="spread user starts over this many seconds")
+    parser.add_argument("--districts", type=int, help="distinct districts (default: one per user)")
+    parser.add_argument("--large-area", action="store_true")
+    parser.add_argument("--workers", type=int, help="job workers (default: FRIGIS_JOB_WORKERS)")
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="share of the latency that is random")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of upstream requests that fail")
+    parser.add_argument("--upstream", type=_upstream_spec, action="append", default=[],
+                        metavar="NAME=LATENCY[:ERROR_RATE]",
+                        help=f"per-upstream override, NAME one of {', '.join(SERVICES)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--poll", type=float, default=0.5, help="page poll interval in seconds")
+    parser.add_argument("--timeout", type=float, default=900.0, help="per-user timeout in seconds")
+    parser.add_argument("--root", help="working directory (default: new temp directory)")
+    parser.add_argument("--json", help="also write the report as JSON to this path")
+    args = parser.parse_args(argv)
+
+    upstreams = {name: Upstream(args.latency, args.error_rate, args.jitter, seed=args.seed + k)
+                 for k, name in enumerate(SERVICES)}
+    for name, latency, error_rate in args.upstream:
+        upstreams[name].latency = latency
+        if error_rate is not None:
+            upstreams[name].error_rate = error_rate
+
+    report = run(users=args.users, ramp=args.ramp, districts=args.districts, large_area=args.large_area,
+                 workers=args.workers, mode=args.mode, upstreams=upstreams, poll=args.poll,
+                 timeout=args.timeout, root=args.root, log=lambda msg: print(msg, file=sys.stderr))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["completed"] == report["users"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""Speicherbudget für prozessinterne Caches und schwere Stufen.
+
+Alle Threads (Streamlit-Sessions, Job-Worker) teilen sich einen Prozess. Damit
+gecachte GeoDataFrames, Raster und Karten den Server nicht in den OOM-Killer
+treiben, führt ``memory`` Buch über die geschätzte Größe aller Einträge:
+
+- ``put``/``get``: LRU-Cache mit Byte-Budget (``FRIGIS_MEMORY_BUDGET_MB``);
+  beim Überschreiten fliegen die am längsten ungenutzten Einträge raus.
+- ``reserve``: schwere Stufen melden ihren geschätzten Bedarf an. Passt er
+  nicht ins Budget, werden Cache-Einträge verdrängt, sonst wird gewartet
+  (FIFO wie ``admission``) und nach ``timeout`` abgelehnt. Pro Client
+  (Job/Session) gilt zusätzlich ``FRIGIS_SESSION_MEMORY_MB``.
+
+Größen sind Schätzungen (``nbytes``), keine exakte Messung. ``stage_estimate``
+rechnet partitionierte Stufen pro gleichzeitig laufender Partition; Raster-Stufen
+wählen mit ``fitting_resolution`` eine Auflösung, die in den Anteil passt.
+"""
+import contextlib
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+import shapely
+from matplotlib.figure import Figure
+
+MB = 1024 * 1024
+MEMORY_BUDGET = int(float(os.getenv("FRIGIS_MEMORY_BUDGET_MB", "2048")) * MB)
+SESSION_MEMORY = int(float(os.getenv("FRIGIS_SESSION_MEMORY_MB", "768")) * MB)
+RESERVE_TIMEOUT = float(os.getenv("FRIGIS_MEMORY_WAIT", "120"))
+
+# Geschätzter Spitzenbedarf pro Grid-Zelle und Stufe (Bytes), Rest: DEFAULT_STAGE_BYTES
+STAGE_BYTES_PER_CELL = {
+    "large_area": 4_000,  # pro Zelle einer laufenden Partition
+    "building_density": 2_000,
+    "temperature": 500,
+    "satellite": 300,  # Zonalstatistik aufs Grid; Raster siehe STAGE_FIXED_BYTES
+    "shade": 16_000,  # ~8 float32-Arrays bei STAGE_RESOLUTION
+}
+DEFAULT_STAGE_BYTES = 1_000
+# Vom Grid unabhängiger Bedarf: Satellitenstufe liest ein festes Fenster (±0.015°, 7 Bänder, Komposit)
+STAGE_FIXED_BYTES = {"satellite": 64 * MB}
+# Ergebnis, das für alle Zellen zugleich im Speicher liegt (zusammengeführtes Grid)
+RESULT_BYTES_PER_CELL = {"large_area": 500}
+# Auflösung (m), für die STAGE_BYTES_PER_CELL gilt; der Bedarf wächst mit der Pixelzahl
+STAGE_RESOLUTION = {"shade": 2.0}
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    pass
+
+
+def nbytes(obj, _seen=None):
+    """Geschätzte Größe eines Cache-Werts in Bytes (NumPy, (Geo)DataFrames, Figuren, Container)."""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return obj.nbytes + sum(nbytes(v, seen) for v in obj.ravel()[:10_000])
+        return obj.nbytes
+    if isinstance(obj, shapely.Geometry):
+        return 100 + 16 * shapely.get_num_coordinates(obj)
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        size = int(np.sum(obj.memory_usage(deep=True)))
+        geometrie = obj.select_dtypes("geometry") if isinstance(obj, pd.DataFrame) else (
+            obj if str(obj.dtype) == "geometry" else None)
+        if geometrie is not None:
+            for spalte in ([geometrie] if isinstance(geometrie, pd.Series) else geometrie.values.T):
+                coords = shapely.get_num_coordinates(np.asarray(spalte))
+                size += int(100 * len(coords) + 16 * coords.sum())
+        return size
+    if isinstance(obj, Figure):
+        w, h = obj.get_size_inches() * obj.dpi
+        return int(w * h * 4) + 1000 * len(obj.axes)  # RGBA-Canvas + Artists grob
+    if isinstance(obj, (bytes, bytearray, memoryview, str)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(nbytes(k, seen) + nbytes(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(nbytes(v, seen) for v in obj)
+    if hasattr(obj, "__dict__"):
+        return sys.getsizeof(obj) + nbytes(vars(obj), seen)
+    return sys.getsizeof(obj)
+
+
+def stage_estimate(name, n_cells, resolution=None, partitions=1, workers=1):
+    """Geschätzter Spitzenbedarf einer Stufe für ``n_cells`` Grid-Zellen (Bytes).
+
+    Bei partitionierten Stufen liegen nur die Partitionen der ``workers`` laufenden
+    Worker gleichzeitig im Speicher, dazu das Ergebnis für alle Zellen.
+    """
+    pro_zelle = STAGE_BYTES_PER_CELL.get(name, DEFAULT_STAGE_BYTES)
+    if resolution is not None and name in STAGE_RESOLUTION:
+        pro_zelle *= (STAGE_RESOLUTION[name] / resolution) ** 2
+    partitions = max(1, partitions)
+    gleichzeitig = -(-n_cells // partitions) * min(max(1, workers), partitions)
+    return int(gleichzeitig * pro_zelle + n_cells * RESULT_BYTES_PER_CELL.get(name, 0)
+               + STAGE_FIXED_BYTES.get(name, 0))
+
+
+def fitting_resolution(name, n_cells, resolution, allowance=SESSION_MEMORY):
+    """Feinste Auflösung ab ``resolution`` (m, auf 0.1 aufgerundet), bei der die Stufe in ``allowance`` passt."""
+    size = stage_estimate(name, n_cells, resolution)
+    if size <= allowance:
+        return resolution
+    return math.ceil(resolution * math.sqrt(size / allowance) * 10) / 10
+
+
+class _Entry:
+    __slots__ = ("value", "size", "owner", "on_evict")
+
+    def __init__(self, value, size, owner, on_evict):
+        self.value = value
+        self.size = size
+        self.owner = owner
+        self.on_evict = on_evict
+
+
+class MemoryManager:
+    def __init__(self, budget=MEMORY_BUDGET, session_budget=SESSION_MEMORY):
+        self.budget = budget
+        self.session_budget = session_budget
+        self._entries = OrderedDict()  # key -> _Entry, älteste zuerst
+        self._cached = 0
+        self._reserved = {}  # owner -> Bytes laufender Stufen
+        self._waiting = deque()
+        self._cond = threading.Condition()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "refused": 0}
+
+    # --- Cache ---
+
+    def get(self, key, default=None):
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry.value
+
+    def __contains__(self, key):
+        with self._cond:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, key, value, owner="default", size=None, on_evict=None):
+        """Legt ``value`` ab und verdrängt LRU-Einträge bis ins Budget.
+
+        ``on_evict()`` wird aufgerufen, wenn der Eintrag verdrängt wird (z.B. um
+        eine zweite Referenz freizugeben). Zu große Werte werden nicht gecacht
+        (Rückgabe False).
+        """
+        size = nbytes(value) if size is None else size
+        evicted = []
+        with self._cond:
+            self._drop(key)
+            limit = min(self.budget - self._reserved_total(), self.session_budget)
+            if size > limit:
+                return False
+            self._entries[key] = _Entry(value, size, owner, on_evict)
+            self._cached += size
+            evicted += self._evict_owner(owner, self.session_budget - self._reserved.get(owner, 0))
+            evicted += self._evict(self.budget - self._reserved_total())
+        self._notify_evicted(evicted)
+        return key in self._entries
+
+    def discard(self, key):
+        with self._cond:
+            self._drop(key)
+            self._cond.notify_all()
+
+    def usage(self, owner=None):
+        """Gecachte plus reservierte Bytes (gesamt oder für einen Client)."""
+        with self._cond:
+            if owner is None:
+                return self._cached + self._reserved_total()
+            return (sum(e.size for e in self._entries.values() if e.owner == owner)
+                    + self._reserved.get(owner, 0))
+
+    # --- Reservierungen für schwere Stufen ---
+
+    @contextlib.contextmanager
+    def reserve(self, owner, size, timeout=RESERVE_TIMEOUT, on_wait=None):
+        """Reserviert ``size`` Bytes für die Dauer des Blocks.
+
+        Lehnt sofort ab, wenn der Client damit über seinem Anteil läge; wartet
+        sonst, bis global Platz ist (Cache wird zuerst verdrängt).
+        """
+        size = min(size, self.budget)
+        evicted = []
+        ticket = object()
+        with self._cond:
+            if self._reserved.get(owner, 0) + size > self.session_budget:
+                self.stats["refused"] += 1
+                raise MemoryBudgetExceeded(
+                    f"Area too large: this step needs about {(self._reserved.get(owner, 0) + size) / MB:.0f} MB, "
+                    f"but one analysis may use at most {self.session_budget / MB:.0f} MB. "
+                    "Choose a smaller area or raise FRIGIS_SESSION_MEMORY_MB.")
+            self._waiting.append(ticket)
+            deadline = time.monotonic() + timeout
+            notified = False
+            try:
+                while True:
+                    if self._waiting[0] is ticket:
+                        eigener_anteil = self.session_budget - self._reserved.get(owner, 0) - size
+                        evicted += self._evict_owner(owner, eigener_anteil)
+                        evicted += self._evict(self.budget - self._reserved_total() - size)
+                        if self._reserved_total() + size <= self.budget:
+                            break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["refused"] += 1
+                        raise MemoryBudgetExceeded(
+                            f"Server memory budget exhausted ({self.budget / MB:.0f} MB) - try again later")
+                    if on_wait and not notified:
+                        on_wait()
+                        notified = True
+                    self._cond.wait(min(1.0, remaining))
+            finally:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+            self._reserved[owner] = self._reserved.get(owner, 0) + size
+        self._notify_evicted(evicted)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._reserved[owner] -= size
+                if self._reserved[owner] <= 0:
+                    del self._reserved[owner]
+                self._cond.notify_all()
+
+    # --- intern (Lock gehalten) ---
+
+    def _reserved_total(self):
+        return sum(self._reserved.values())
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._cached -= entry.size
+
+    def _evict(self, limit):
+        evicted = []
+        while self._entries and self._cached > limit:
+            key, entry = self._entries.popitem(last=False)
+            self._cached -= entry.size
+            evicted.append(entry)
+        self.stats["evictions"] += len(evicted)
+        return evicted
+
+    def _evict_owner(self, owner, limit):
+        keys = [k for k, e in self._entries.items() if e.owner == owner]
+        used = sum(self._entries[k].size for k in keys)
+        evicted = []
+        for key in keys:
+            if used <= limit:
+                break
+            entry = self._entries.pop(key)
+            self._cached -= entry.size
+            used -= entry.size
+            evicted.append(entry)
+        self.stats["evictions"] += len(evicted)
+        return evicted
+
+    @staticmethod
+    def _notify_evicted(entries):
+        # Außerhalb des Locks: Callbacks dürfen selbst Locks nehmen (z.B. Single-Flight-Gruppe)
+        for entry in entries:
+            if entry.on_evict is not None:
+                entry.on_evict()
+
+
+memory = MemoryManager()
@@ -0,0 +1,241 @@
+"""Großflächenmodus: Raster-Analysen räumlich partitioniert über mehrere CPU-Kerne.
+
+Das Analyse-Grid wird in rechteckige Kacheln zerlegt. Jede Kachel erzeugt ihre
+Zellen selbst (reguläres Raster, nur Spaltenbereich wird übergeben) und bekommt
+die Gebäude der Kachel bzw. die Grünflächen der Kachel plus Halo (= ``max_dist``).
+Die Geometrien liegen einmal als WKB-Puffer mit Offsets (Arrow-Binary-Layout) in
+``SharedMemory``; an die Worker gehen nur Indexarrays, keine gepickelten Geometrien.
+
+Der Prozesspool wird einmal pro Prozess angelegt (``spawn``: der Aufrufer ist
+ein Job-Thread im mehrfädigen Web-Prozess, ``fork`` könnte dort Locks im
+gesperrten Zustand kopieren) und über Analysen hinweg wiederverwendet.
+``dist_to_green`` ist wie im Normalmodus die echte Distanz; Zellen ohne Grün im
+Halo ihrer Kachel bekommen sie danach aus einer Suche über alle Grünflächen.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from frigis.buildings import METRICS as BUILDING_METRICS, building_heights, building_metrics
+
+N_WORKERS = int(os.getenv("FRIGIS_WORKERS", os.cpu_count() or 1))
+
+
+def make_grid(area, cell_size, crs):
+    """Vektorisierte Grid-Erzeugung (gleiche Zellen und Reihenfolge wie die Listen-Variante)."""
+    minx, miny, maxx, maxy = area.bounds
+    xs = np.arange(minx, maxx, cell_size)
+    ys = np.arange(miny, maxy, cell_size)
+    x, y = np.meshgrid(xs, ys, indexing="ij")
+    cells = shapely.box(x.ravel(), y.ravel(), x.ravel() + cell_size, y.ravel() + cell_size)
+    shapely.prepare(area)
+    cells = cells[shapely.intersects(area, cells)]
+    return gpd.GeoDataFrame({"geometry": cells}, crs=crs)
+
+
+def _pack_wkb(geoms):
+    """Geometrien -> SharedMemory mit ``n + 1`` int64-Offsets, gefolgt von den WKB-Bytes."""
+    wkb = shapely.to_wkb(geoms)
+    lengths = np.fromiter((len(b) for b in wkb), dtype=np.int64, count=len(wkb))
+    offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    kopf = offsets.nbytes
+    shm = SharedMemory(create=True, size=kopf + max(1, int(offsets[-1])))
+    shm.buf[:kopf] = offsets.tobytes()
+    if len(wkb):
+        shm.buf[kopf:kopf + offsets[-1]] = b"".join(wkb)
+    return shm
+
+
+# Im Worker-Prozess: angehängte Puffer der zuletzt bearbeiteten Analyse, name -> (shm, offsets)
+_shared = {}
+
+
+def _attach(name, shm_name, count):
+    """Hängt den Puffer einer Analyse an; der einer früheren Analyse wird dabei geschlossen."""
+    alt = _shared.get(name)
+    if alt is not None and alt[0].name == shm_name:
+        return
+    if alt is not None:
+        alt[0].close()
+    shm = SharedMemory(name=shm_name)
+    offsets = np.frombuffer(shm.buf, dtype=np.int64, count=count + 1).copy()
+    _shared[name] = (shm, offsets)
+
+
+def _detach():
+    for shm, _ in _shared.values():
+        shm.close()
+    _shared.clear()
+
+
+def _unpack(name, idx):
+    shm, offsets = _shared[name]
+    buf = shm.buf
+    kopf = offsets.nbytes
+    return shapely.from_wkb([bytes(buf[kopf + offsets[i]:kopf + offsets[i + 1]]) for i in idx])
+
+
+def _compute_partition(task):
+    """Gebäudemetriken und Distanz zum Grün für alle Zellen einer Kachel.
+
+    Zellen ohne Grünfläche innerhalb des Halos bekommen NaN; die echte Distanz
+    ergänzt ``large_area_analysis`` danach.
+    """
+    (ix0, ix1, iy0, iy1, b_idx, b_heights, g_idx, origin, cell_size, area_wkb, max_dist, layers) = task
+    for name, (shm_name, count) in layers.items():
+        _attach(name, shm_name, count)
+    ix, iy = np.meshgrid(np.arange(ix0, ix1), np.arange(iy0, iy1), indexing="ij")
+    ix, iy = ix.ravel(), iy.ravel()
+    x = origin[0] + ix * cell_size
+    y = origin[1] + iy * cell_size
+    cells = shapely.box(x, y, x + cell_size, y + cell_size)
+    area = shapely.from_wkb(area_wkb)
+    shapely.prepare(area)
+    keep = shapely.intersects(area, cells)
+    ix, iy, cells = ix[keep], iy[keep], cells[keep]
+
+    buildings = _unpack("buildings", b_idx) if len(b_idx) else np.array([], dtype=object)
+    metrics = building_metrics(cells, buildings, b_heights)
+
+    dist = np.full(len(cells), np.nan)
+    if len(g_idx):
+        greens = _unpack("greens", g_idx)
+        (hit, _), d = shapely.STRtree(greens).query_nearest(
+            shapely.centroid(cells), max_distance=max_dist, return_distance=True, all_matches=False)
+        dist[hit] = d
+    return ix, iy, metrics, dist
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(n_workers):
+    """Prozessweiter Spawn-Pool, wiederverwendet; neu nur bei anderer Größe oder nach Absturz."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != n_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=n_workers, mp_context=get_context("spawn"))
+            _pool_workers = n_workers
+        return _pool
+
+
+def _drop_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _partitions(nx, ny, n_parts):
+    """Zerlegt nx × ny Zellen in etwa n_parts annähernd quadratische Kacheln."""
+    px = max(1, int(round(np.sqrt(n_parts * nx / max(ny, 1)))))
+    py = max(1, int(np.ceil(n_parts / px)))
+    bx = np.linspace(0, nx, min(px, nx) + 1).astype(int)
+    by = np.linspace(0, ny, min(py, ny) + 1).astype(int)
+    return [(bx[i], bx[i + 1], by[j], by[j + 1])
+            for i in range(len(bx) - 1) for j in range(len(by) - 1)]
+
+
+def _area_partitions(area, cell_size, n_workers):
+    minx, miny, maxx, maxy = area.bounds
+    nx = len(np.arange(minx, maxx, cell_size))
+    ny = len(np.arange(miny, maxy, cell_size))
+    return _partitions(nx, ny, n_workers * 4)
+
+
+def partition_count(area, cell_size, n_workers=N_WORKERS):
+    """Anzahl Kacheln, in die ``large_area_analysis`` das Gebiet zerlegt."""
+    return len(_area_partitions(area, cell_size, n_workers))
+
+
+def large_area_analysis(area, buildings, greens, cell_size, crs, max_dist=500,
+                        n_workers=N_WORKERS, on_progress=None):
+    """Grid mit Gebäudemetriken, ``dist_to_green`` und ``score_distance_norm`` für große Polygone."""
+    minx, miny, maxx, maxy = area.bounds
+    parts = _area_partitions(area, cell_size, n_workers)
+
+    b_geoms = buildings.geometry.values if not buildings.empty else np.array([], dtype=object)
+    g_geoms = greens.geometry.values if not greens.empty else np.array([], dtype=object)
+    b_geoms, g_geoms = np.asarray(b_geoms, dtype=object), np.asarray(g_geoms, dtype=object)
+    b_heights = building_heights(buildings)[0] if not buildings.empty else np.array([])
+
+    # Zuordnung Geometrie -> Kachel einmalig im Hauptprozess (Grün mit Halo)
+    boxes = shapely.box(
+        [minx + p[0] * cell_size for p in parts], [miny + p[2] * cell_size for p in parts],
+        [minx + p[1] * cell_size for p in parts], [miny + p[3] * cell_size for p in parts])
+    b_pairs = shapely.STRtree(b_geoms).query(boxes) if len(b_geoms) else np.empty((2, 0), int)
+    g_pairs = (shapely.STRtree(g_geoms).query(boxes, predicate="dwithin", distance=max_dist)
+               if len(g_geoms) else np.empty((2, 0), int))
+
+    shms = {"buildings": _pack_wkb(b_geoms), "greens": _pack_wkb(g_geoms)}
+    layers = {"buildings": (shms["buildings"].name, len(b_geoms)), "greens": (shms["greens"].name, len(g_geoms))}
+    area_wkb = shapely.to_wkb(area)
+    tasks = [
+        (*p, b_idx, b_heights[b_idx], g_pairs[1][g_pairs[0] == k],
+         (minx, miny), cell_size, area_wkb, max_dist, layers)
+        for k, p in enumerate(parts)
+        for b_idx in [b_pairs[1][b_pairs[0] == k]]
+    ]
+
+    results = []
+    try:
+        if n_workers <= 1:
+            try:
+                for k, task in enumerate(tasks):
+                    results.append(_compute_partition(task))
+                    if on_progress:
+                        on_progress(k + 1, len(tasks))
+            finally:
+                _detach()
+        else:
+            pool = _get_pool(n_workers)
+            try:
+                futures = [pool.submit(_compute_partition, t) for t in tasks]
+                for k, future in enumerate(as_completed(futures)):
+                    results.append(future.result())
+                    if on_progress:
+                        on_progress(k + 1, len(tasks))
+            except BrokenProcessPool:
+                _drop_pool(pool)  # nächster Aufruf startet einen frischen Pool
+                raise
+    finally:
+        for shm in shms.values():
+            shm.close()
+            shm.unlink()
+
+    ix = np.concatenate([r[0] for r in results])
+    iy = np.concatenate([r[1] for r in results])
+    order = np.lexsort((iy, ix))
+    ix, iy = ix[order], iy[order]
+    x, y = minx + ix * cell_size, miny + iy * cell_size
+    grid = gpd.GeoDataFrame(
+        {
+            **{name: np.concatenate([r[2][name] for r in results])[order] for name in BUILDING_METRICS},
+            "dist_to_green": np.concatenate([r[3] for r in results])[order],
+        },
+        geometry=shapely.box(x, y, x + cell_size, y + cell_size),
+        crs=crs,
+    )
+    # Ohne Grün im Halo: echte Distanz über alle Grünflächen (wie im Normalmodus)
+    fehlend = np.flatnonzero(grid["dist_to_green"].isna().to_numpy())
+    if len(fehlend) and len(g_geoms):
+        (hit, _), d = shapely.STRtree(g_geoms).query_nearest(
+            shapely.centroid(grid.geometry.values[fehlend]), return_distance=True, all_matches=False)
+        grid.iloc[fehlend[hit], grid.columns.get_loc("dist_to_green")] = d
+    elif len(fehlend):
+        grid["dist_to_green"] = float(max_dist)  # keine Grünflächen: Standardwert wie im Normalmodus
+    grid["score_distance_norm"] = np.clip(grid["dist_to_green"] / max_dist, 0, 1)
+    return grid
@@ -0,0 +1,1265 @@
+"""Analyse-Pipeline von friGIS ohne Streamlit-Abhängigkeit.
+
+Alle Stufen melden Status und Fortschritt über ein ``ui``-Objekt mit derselben
+kleinen Schnittstelle wie ``streamlit`` (``info``, ``warning``, ``error``,
+``success``, ``progress(value, text=...)`` mit ``.progress()``/``.empty()``).
+In der App wird direkt ``st`` übergeben, im Hintergrund-Job ein Job-Reporter.
+Abbildungen werden als ``matplotlib.figure.Figure`` ohne pyplot erzeugt, damit
+mehrere Analysen parallel in Threads laufen können.
+"""
+import contextvars
+import os
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeout
+from urllib.parse import urlparse
+
+import dask.array as da
+import folium
+import geopandas as gpd
+import matplotlib.colors as mcolors
+import numpy as np
+import osmnx as ox
+import pandas as pd
+import planetary_computer
+import requests
+import shapely
+from dotenv import load_dotenv
+from folium.plugins import HeatMap
+from matplotlib import cm
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+from opencage.geocoder import OpenCageGeocode
+from pystac_client import Client
+from shapely.geometry import Polygon
+from sklearn.cluster import KMeans
+
+from frigis.buildings import METRICS as BUILDING_METRICS, building_heights, building_metrics
+from frigis.climate import STATISTICS, TemperatureSeries
+from frigis.blockcache import get_block_cache
+from frigis.cog_archive import get_cog_archive, lazy_read
+from frigis.composite import COMPOSITE_SCENES, get_composite_cache, in_season, median_composite
+from frigis.deadlines import (DeadlineExceeded, call_with_deadline, current_deadline, hedged, report_partial,
+                              scale_budget_to_area)
+from frigis.endpoints import NOMINATIM_URL, OPEN_METEO_URL, OPENCAGE_URL, OVERPASS_URL, STAC_URL
+from frigis.gazetteer import get_gazetteer, normalize
+from frigis.interpolation import initial_samples, interpolate, refinement_samples, to_km
+from frigis.memory import fitting_resolution, memory, stage_estimate
+from frigis.partitioning import N_WORKERS, make_grid, large_area_analysis, partition_count
+from frigis.priority import heat_priority, priority_layers, select_sites
+from frigis.ratelimit import RateLimitedAdapter, STAGE_COST, admission, current_client, limiter
+from frigis.shade import (SVF_RADIUS, aggregate, cell_index_raster, rasterize_heights,
+                          shadow_mask, sky_view_factor, sun_positions)
+from frigis.singleflight import (geocode_flight, osm_flight, temperature_flight,
+                                 stac_flight, stage_flight, geometry_key)
+from frigis.species import TRAITS, get_species_index, recommend, site_conditions
+from frigis.spectral import INDICES, SPECTRAL_BANDS, aggregate_to_grid, boa_offset, compute_spectral
+from frigis.streettrees import street_edges, street_tree_candidates
+
+# .env-Datei laden
+load_dotenv()
+
+# API-Key aus Umgebungsvariable lesen
+OPENCAGE_API_KEY = os.getenv("OPENCAGE_API_KEY")
+
+warnings.filterwarnings("ignore", category=UserWarning)
+
+# OSMnx spricht Overpass/Nominatim selbst an - Basis-URLs aus frigis.endpoints
+ox.settings.overpass_url = OVERPASS_URL
+ox.settings.nominatim_url = NOMINATIM_URL
+
+# Globale Session für effiziente Requests; jeder Versuch geht durch den Host-Limiter
+session = requests.Session()
+_adapter = RateLimitedAdapter(limiter, total=3, backoff_factor=1,
+                              status_forcelist=[429, 500, 502, 503, 504])
+session.mount('https://', _adapter)
+session.mount('http://', _adapter)  # lokale Stand-ins
+
+TAGS_BUILDINGS = {"building": True}
+TAGS_GREEN = {
+    "leisure": ["park", "garden"],
+    "landuse": ["grass", "meadow", "forest"],
+    "natural": ["wood", "tree_row", "scrub"]
+}
+# Hauptstraßen mit Winterdienst (Salz) für die Baumartenwahl
+TAGS_ROADS = {"highway": ["motorway", "trunk", "primary", "secondary", "tertiary"]}
+SALT_DISTANCE = 15  # m: Zelle näher an einer Hauptstraße -> salzexponiert
+TAGS_TREES = {"natural": ["tree", "tree_row"]}
+# Straßenbäume: Netztyp für OSMnx ("drive", "walk", "all", ...) und Pflanzabstand in m
+STREET_NETWORK = os.getenv("FRIGIS_STREET_NETWORK", "drive")
+STREET_TREE_SPACING = float(os.getenv("FRIGIS_STREET_TREE_SPACING", "12"))
+# Auflösung (m) des Höhenrasters für Schatten/Himmelssichtfaktor
+SHADE_RESOLUTION = float(os.getenv("FRIGIS_SHADE_RESOLUTION", "2"))
+BUILDING_BLOCK = 20000  # Zellen pro Block der Gebäudemetriken
+CELL_SIZE = 40  # Reduced from 50 to 40 for higher resolution
+
+# Temperaturstufe: "lattice" (jeder Gitterpunkt, Standard) oder "interpolated" (adaptive Stichprobe + Interpolation)
+TEMPERATURE_MODE = os.getenv("FRIGIS_TEMPERATURE_MODE", "lattice")
+TEMPERATURE_REFINE = int(os.getenv("FRIGIS_TEMPERATURE_REFINE", "6"))  # Nachverdichtungspunkte
+# Jahresspanne der Tagesreihen pro Punkt, z.B. "2015-2024"; leer (Standard) = nur der Sommer des gewählten Jahres
+TEMPERATURE_SERIES = os.getenv("FRIGIS_TEMPERATURE_SERIES", "")
+
+# Satellitenstufe: "composite" (wolkenmaskierter Median mehrerer Szenen) oder "scene" (beste Einzelszene)
+SATELLITE_MODE = os.getenv("FRIGIS_SATELLITE_MODE", "composite")
+SATELLITE_SEASON = os.getenv("FRIGIS_SATELLITE_SEASON", "summer")
+
+# Label maskierter Pixel im k-Means-Labelbild (Export: nodata)
+LABEL_NODATA = 255
+
+# Index -> (Titel, Colormap, vmin, vmax)
+INDEX_STYLE = {
+    "ndvi": ("NDVI (vegetation)", "RdYlGn", -0.2, 0.8),
+    "ndbi": ("NDBI (built-up)", "RdBu_r", -0.5, 0.5),
+    "albedo": ("Broadband albedo", "gray", 0.0, 0.4),
+}
+
+
+def _opencage():
+    basis = urlparse(OPENCAGE_URL)
+    return OpenCageGeocode(OPENCAGE_API_KEY, protocol=basis.scheme, domain=basis.netloc)
+
+
+class _NullProgress:
+    def progress(self, value, text=None):
+        pass
+
+    def empty(self):
+        pass
+
+
+class NullUI:
+    """``ui``-Objekt, das alle Meldungen verwirft (z.B. für Pre-Warming)."""
+
+    def info(self, body):
+        pass
+
+    warning = error = success = info
+
+    def progress(self, value, text=None):
+        return _NullProgress()
+
+
+NULL_UI = NullUI()
+
+
+def geocode_to_gdf_with_fallback(location_name, large_area=False, ui=NULL_UI):
+    """Geocodierung mit lokalem Gazetteer, dann OpenCageData, Fallback auf OSMnx wenn nötig"""
+    # Gleiche Anfragen mehrerer Sessions teilen sich einen Aufruf
+    return geocode_flight.do(("geocode", normalize(location_name), large_area),
+                             _geocode_to_gdf, location_name, large_area, ui)
+
+
+def _geocode_to_gdf(location_name, large_area, ui):
+    # Großflächenmodus: echtes Stadtteil-/Stadtpolygon statt der ±0.008°-Box
+    if large_area:
+        try:
+            gdf = limiter.call("nominatim.openstreetmap.org", ox.geocode_to_gdf, location_name)
+            if gdf.geometry.iloc[0].geom_type in ("Polygon", "MultiPolygon"):
+                ui.info("OSMnx-Polygon verwendet (Großflächenmodus)")
+                return gpd.GeoDataFrame({'geometry': [gdf.geometry.iloc[0]], 'name': [location_name]},
+                                        crs=gdf.crs)
+        except Exception as e:
+            ui.warning(f"Kein Polygon für den Großflächenmodus gefunden: {e}")
+
+    # Versuch 0: Lokaler Gazetteer (kein Netzwerk)
+    gazetteer = get_gazetteer()
+    if gazetteer is not None:
+        eintrag = gazetteer.lookup(location_name)
+        if eintrag:
+            offset = 0.008  # Gleicher Radius wie bei OpenCageData
+            lat, lon = eintrag['lat'], eintrag['lon']
+            if eintrag['bbox']:
+                minx, miny, maxx, maxy = eintrag['bbox']
+                lon, lat = (minx + maxx) / 2, (miny + maxy) / 2
+            polygon = Polygon([(lon - offset, lat - offset), (lon + offset, lat - offset),
+                               (lon + offset, lat + offset), (lon - offset, lat + offset)])
+            ui.info("Lokaler Gazetteer verwendet")
+            return gpd.GeoDataFrame({'geometry': [polygon], 'name': [location_name]}, crs='EPSG:4326')
+
+    # Versuch 1: OpenCageData
+    try:
+        geocoder = _opencage()
+        results = limiter.call("api.opencagedata.com", geocoder.geocode, location_name, no_annotations=1)
+        if results:
+            result = results[0]
+            
+            if 'bounds' in result:
+                bounds = result['bounds']
+                minx, miny = bounds['southwest']['lng'], bounds['southwest']['lat']
+                maxx, maxy = bounds['northeast']['lng'], bounds['northeast']['lat']
+                # GRÖSSERER Radius für erste zwei Analysen
+                center_lon = (minx + maxx) / 2
+                center_lat = (miny + maxy) / 2
+                offset = 0.008  # Erhöht von 0.006 auf 0.008 = ca. 800m Radius
+                minx, miny, maxx, maxy = center_lon - offset, center_lat - offset, center_lon + offset, center_lat + offset
+            else:
+                lat, lon = result['geometry']['lat'], result['geometry']['lng']
+                offset = 0.008  # Erhöht von 0.006 auf 0.008 = ca. 800m Radius
+                minx, miny, maxx, maxy = lon - offset, lat - offset, lon + offset, lat + offset
+            
+            polygon = Polygon([(minx, miny), (maxx, miny), (maxx, maxy), (minx, maxy)])
+            gdf = gpd.GeoDataFrame(
+                {'geometry': [polygon], 'name': [location_name]}, 
+                crs='EPSG:4326'
+            )
+            ui.info("OpenCageData verwendet")
+            return gdf
+    except Exception as e:
+        ui.warning(f"OpenCageData failed: {e}")
+    
+    # Versuch 2: OSMnx Fallback
+    try:
+        ui.info("Fallback auf OSMnx...")
+        gdf = limiter.call("nominatim.openstreetmap.org", ox.geocode_to_gdf, location_name)
+        # Auch hier kleineres Gebiet für erste zwei Analysen
+        bounds = gdf.total_bounds
+        center_lon = (bounds[0] + bounds[2]) / 2
+        center_lat = (bounds[1] + bounds[3]) / 2
+        offset = 0.008  # Gleicher Radius wie bei OpenCageData
+        polygon = Polygon([(center_lon - offset, center_lat - offset), 
+                         (center_lon + offset, center_lat - offset), 
+                         (center_lon + offset, center_lat + offset), 
+                         (center_lon - offset, center_lat + offset)])
+        gdf = gpd.GeoDataFrame({'geometry': [polygon], 'name': [location_name]}, crs='EPSG:4326')
+        ui.info("OSMnx Fallback erfolgreich (800m Radius)")
+        return gdf
+    except Exception as e:
+        ui.error(f"Beide Geocoding-Services fehlgeschlagen: {e}")
+        return None
+
+
+def load_osm_data_with_retry(polygon, tags, max_retries=3, ui=NULL_UI):
+    """Load OSM data with retry logic (shared between sessions requesting the same area)"""
+    return osm_flight.do((geometry_key(polygon), repr(sorted(tags.items()))),
+                         _load_osm_data, polygon, tags, max_retries, ui)
+
+
+def _load_osm_data(polygon, tags, max_retries, ui):
+    for attempt in range(max_retries):
+        try:
+            data = limiter.call("overpass-api.de", ox.features_from_polygon, polygon, tags=tags)
+            return data
+        except Exception as e:
+            if attempt < max_retries - 1:
+                ui.warning(f"OSM attempt {attempt + 1} failed, retrying...")
+                time.sleep(2 ** attempt)  # Exponential backoff
+            else:
+                ui.error(f"OSM data could not be loaded after {max_retries} attempts: {e}")
+                return gpd.GeoDataFrame()  # Return empty GeoDataFrame
+
+
+def _grid_raster(ax, grid, column, cmap, fig):
+    """Spalte eines regulären Grids als Rasterbild (viel schneller als ein Polygon pro Zelle)."""
+    bounds = shapely.bounds(np.asarray(grid.geometry.values))
+    size = bounds[0, 2] - bounds[0, 0]
+    minx, miny = bounds[:, 0].min(), bounds[:, 1].min()
+    ix = np.rint((bounds[:, 0] - minx) / size).astype(int)
+    iy = np.rint((bounds[:, 1] - miny) / size).astype(int)
+    raster = np.full((iy.max() + 1, ix.max() + 1), np.nan)
+    raster[iy, ix] = grid[column].to_numpy(dtype=float)
+    image = ax.imshow(raster, origin="lower", cmap=cmap, interpolation="nearest",
+                      extent=(minx, minx + raster.shape[1] * size, miny, miny + raster.shape[0] * size))
+    fig.colorbar(image, ax=ax, shrink=0.7)
+
+
+def gebaeudedichte_analysieren_und_plotten(grid, buildings, gebiet, ui=NULL_UI):
+    """Gebäudemetriken pro Zelle (``frigis.buildings.METRICS``) aus einem Zell-Gebäude-Join."""
+    if "building_ratio" in grid.columns:
+        pass  # Bereits im Großflächenmodus parallel berechnet
+    elif buildings.empty:
+        ui.warning("No building data available - using default values")
+        grid["building_ratio"] = 0.1  # Standardwert
+    else:
+        deadline = current_deadline.get()
+
+        def _berechne_gebaeudemetriken():
+            progress = ui.progress(0, text="Calculating building density...")
+            hoehen, imputiert = building_heights(buildings)
+            geoms = np.asarray(buildings.geometry.values)
+            zellen = np.asarray(grid.geometry.values)
+            total = len(zellen)
+            metriken = {name: np.full(total, np.nan) for name in BUILDING_METRICS}
+            # Blockweise, damit das Zeitbudget zwischen den Blöcken greifen kann
+            block = max(1, min(BUILDING_BLOCK, total))
+            for start in range(0, total, block):
+                if deadline is not None and deadline.expired():
+                    break  # Zeitbudget aufgebraucht: Rest bleibt leer (partiell)
+                teil = building_metrics(zellen[start:start + block], geoms, hoehen)
+                for name, werte in teil.items():
+                    metriken[name][start:start + block] = werte
+                progress.progress(min(start + block, total) / total, text="Calculating building density...")
+            progress.empty()
+            if imputiert.any():
+                ui.info(f"Building heights imputed for {int(imputiert.sum())} of {len(hoehen)} buildings "
+                        "(no height/building:levels tag).")
+            return metriken
+
+        # Gleiches Gebiet in mehreren Sessions -> nur einmal rechnen
+        key = ("building_metrics", geometry_key(gebiet.geometry.iloc[0]))
+        for name, werte in stage_flight.do(key, _berechne_gebaeudemetriken).items():
+            grid[name] = werte
+        fehlend = int(grid["building_ratio"].isna().sum())
+        if fehlend:
+            stage_flight.forget(key)  # partielles Ergebnis nicht teilen
+            report_partial()
+            ui.warning(f"Partial result: time budget exhausted, {fehlend} of {len(grid)} cells not computed (grey).")
+
+    fig = Figure(figsize=(12, 12))
+    axes = fig.subplots(2, 2).ravel()
+    ax = axes[0]
+    grid.plot(ax=ax, column="building_ratio", cmap="Reds", legend=True,
+              edgecolor="grey", linewidth=0.2, missing_kwds={"color": "lightgrey"})
+    if not buildings.empty:
+        buildings.plot(ax=ax, color="lightgrey", edgecolor="black", alpha=0.5)
+    gebiet.boundary.plot(ax=ax, color="blue", linewidth=1.5)
+    ax.set_title("1 Building Density (Red = dense)")
+
+    for ax, name in zip(axes[1:], ("height_mean", "volume_density", "frontal_area_index")):
+        _, titel, cmap = BUILDING_METRICS[name]
+        if name in grid.columns:
+            _grid_raster(ax, grid, name, cmap, fig)
+        gebiet.boundary.plot(ax=ax, color="blue", linewidth=1.0)
+        ax.set_title(titel)
+
+    # SEHR ENGER Fokus - nur das tatsächlich analysierte Grid anzeigen
+    grid_bounds = grid.total_bounds
+    margin = 15  # Sehr kleiner Rand: nur 15m um das Grid
+    for ax in axes:
+        ax.set_xlim(grid_bounds[0] - margin, grid_bounds[2] + margin)
+        ax.set_ylim(grid_bounds[1] - margin, grid_bounds[3] + margin)
+        ax.axis("equal")
+    fig.tight_layout()
+    return fig
+
+
+def shade_resolution(n_cells):
+    """``SHADE_RESOLUTION`` oder gröber, falls das Höhenraster sonst nicht in den Speicheranteil passt."""
+    return fitting_resolution("shade", n_cells, SHADE_RESOLUTION)
+
+
+def schatten_analysieren_und_plotten(grid, buildings, gebiet, resolution=SHADE_RESOLUTION, ui=NULL_UI):
+    """Verschattung (Sommer-Sonnenstände) und Himmelssichtfaktor pro Zelle aus Gebäudehöhen.
+
+    Schreibt ``shade_fraction`` (Anteil beschatteter Bodenpixel, gemittelt über die
+    Sonnenstände) und ``sky_view_factor`` (Mittel über die Bodenpixel) ins Grid.
+    """
+    if buildings.empty:
+        ui.warning("No building data available - shade analysis skipped.")
+        return None
+    if resolution > SHADE_RESOLUTION:
+        ui.info(f"Large area: shade computed at {resolution:g} m instead of {SHADE_RESOLUTION:g} m "
+                "to stay within the memory allowance.")
+    progress = ui.progress(0, text="Rasterizing building heights...")
+    polygone = buildings[buildings.geom_type.isin(["Polygon", "MultiPolygon"])]
+    hoehen, _ = building_heights(polygone)
+    # Rand um das Grid: Schatten und Horizont von Gebäuden knapp außerhalb zählen mit
+    minx, miny, maxx, maxy = grid.total_bounds
+    bounds = (minx - SVF_RADIUS, miny - SVF_RADIUS, maxx + SVF_RADIUS, maxy + SVF_RADIUS)
+    dsm, transform = rasterize_heights(np.asarray(polygone.geometry.values), hoehen, bounds, resolution)
+    boden = dsm == 0
+
+    mitte = gpd.GeoSeries([gebiet.geometry.iloc[0].centroid], crs=gebiet.crs).to_crs("EPSG:4326").iloc[0]
+    sonnenstaende = sun_positions(mitte.y)
+    deadline = current_deadline.get()
+    schatten = np.zeros(dsm.shape, dtype=np.float32)
+    berechnet = 0
+    for i, (hoehe, azimut) in enumerate(sonnenstaende):
+        if berechnet and deadline is not None and deadline.expired():
+            # Zeitbudget aufgebraucht: Mittel über die bisher berechneten Sonnenstände
+            report_partial()
+            ui.warning(f"Partial result: time budget exhausted, shade from {berechnet} of "
+                       f"{len(sonnenstaende)} sun positions.")
+            break
+        progress.progress(0.1 + 0.4 * i / len(sonnenstaende), text="Computing shadows...")
+        schatten += shadow_mask(dsm, resolution, hoehe, azimut)
+        berechnet += 1
+    schatten /= max(1, berechnet)
+    progress.progress(0.5, text="Computing sky view factor...")
+    svf = sky_view_factor(dsm, resolution)
+
+    index = cell_index_raster(np.asarray(grid.geometry.values), transform, dsm.shape)
+    grid["shade_fraction"] = aggregate(schatten, index, boden, len(grid))
+    grid["sky_view_factor"] = aggregate(svf, index, boden, len(grid))
+    progress.empty()
+
+    fig = Figure(figsize=(14, 7))
+    axes = fig.subplots(1, 2)
+    for ax, name, cmap, titel in ((axes[0], "shade_fraction", "Blues", "Summer shade (share of ground)"),
+                                  (axes[1], "sky_view_factor", "YlOrRd", "Sky view factor (1 = open sky)")):
+        _grid_raster(ax, grid, name, cmap, fig)
+        gebiet.boundary.plot(ax=ax, color="blue", linewidth=1.0)
+        ax.set_title(titel)
+        ax.axis("equal")
+    fig.tight_layout()
+
+    zeiten = ", ".join(f"{h:.0f}°/{a:.0f}°" for h, a in sonnenstaende)
+    ui.success(f"Shade and sky view factor at {resolution:g} m resolution "
+               f"({dsm.shape[1]} x {dsm.shape[0]} px; sun altitude/azimuth {zeiten}).")
+    return fig
+
+
+def distanz_zu_gruenflaechen_analysieren_und_plotten(grid, greens, gebiet, max_dist=500, ui=NULL_UI):
+    if "score_distance_norm" in grid.columns:
+        pass  # Bereits im Großflächenmodus parallel berechnet
+    elif greens.empty:
+        ui.warning("No green space data available - using default values")
+        grid["dist_to_green"] = max_dist
+        grid["score_distance_norm"] = 1.0
+    else:
+        deadline = current_deadline.get()
+
+        def _berechne_distanzen():
+            progress = ui.progress(0, text="Calculating distance to green areas...")
+            greens_union = greens.geometry.union_all()
+            total = len(grid)
+            dists = np.full(total, np.nan)
+            for i, geom in enumerate(grid.geometry):
+                if deadline is not None and deadline.expired():
+                    break  # Zeitbudget aufgebraucht: Rest bleibt leer (partiell)
+                try:
+                    dists[i] = greens_union.distance(geom.centroid)
+                except:
+                    dists[i] = max_dist
+                if i % max(1, total // 10) == 0:
+                    progress.progress(i / total, text="Calculating distance to green areas...")
+            progress.progress(1.0, text="Distance to green calculated.")
+            progress.empty()
+            return dists
+
+        try:
+            key = ("dist_to_green", geometry_key(gebiet.geometry.iloc[0]), max_dist)
+            grid["dist_to_green"] = stage_flight.do(key, _berechne_distanzen)
+            grid["score_distance_norm"] = np.clip(grid["dist_to_green"] / max_dist, 0, 1)
+            fehlend = int(grid["dist_to_green"].isna().sum())
+            if fehlend:
+                stage_flight.forget(key)  # partielles Ergebnis nicht teilen
+                report_partial()
+                ui.warning(f"Partial result: time budget exhausted, {fehlend} of {len(grid)} cells not computed (grey).")
+        except Exception as e:
+            ui.warning(f"Error in green space analysis: {e}")
+            grid["dist_to_green"] = max_dist
+            grid["score_distance_norm"] = 1.0
+
+    cmap = cm.Reds
+    norm = mcolors.Normalize(vmin=0, vmax=1)
+    fig = Figure(figsize=(8, 8))
+    ax = fig.subplots()
+    grid.plot(ax=ax, column="score_distance_norm", cmap=cmap, norm=norm,
+              edgecolor="grey", linewidth=0.2, legend=True,
+              legend_kwds={"label": "Distance to green (Red = far)"},
+              missing_kwds={"color": "lightgrey"})
+    if not greens.empty:
+        greens.plot(ax=ax, color="green", alpha=0.5, edgecolor="darkgreen")
+    gebiet.boundary.plot(ax=ax, color="blue", linewidth=1.5)
+    ax.set_title("2 Distance to Green Areas")
+
+    # SEHR ENGER Fokus - nur das tatsächlich analysierte Grid anzeigen  
+    grid_bounds = grid.total_bounds
+    margin = 15  # Sehr kleiner Rand: nur 15m um das Grid
+    ax.set_xlim(grid_bounds[0] - margin, grid_bounds[2] + margin)
+    ax.set_ylim(grid_bounds[1] - margin, grid_bounds[3] + margin)
+    ax.axis("equal")
+    fig.tight_layout()
+    return fig
+
+
+def heatmap_mit_temperaturdifferenzen(ort_name, jahr=2022, radius_km=2.0, resolution_km=0.7,
+                                     mode=TEMPERATURE_MODE, grid=None, statistik="mean_max", ui=NULL_UI):
+    """EXTENDED Temperature data - MORE points
+
+    ``mode="lattice"`` fragt jeden Punkt des ``resolution_km``-Gitters ab,
+    ``mode="interpolated"`` nur eine adaptive Stichprobe und interpoliert auf
+    die Zellen von ``grid`` (bzw. ein feines Gitter, wenn kein Grid übergeben wird).
+    """
+    reihen = lade_temperaturreihen(ort_name, jahr, radius_km, resolution_km, mode, grid, ui=ui)
+    if reihen is None:
+        return None
+    return temperatur_karte(reihen, jahr, statistik, ui=ui)
+
+
+def lade_temperaturreihen(ort_name, jahr=2022, radius_km=2.0, resolution_km=0.7,
+                          mode=TEMPERATURE_MODE, grid=None, ui=NULL_UI):
+    """Tagesreihen der Messpunkte als ``TemperatureSeries`` (None, wenn keine Daten).
+
+    Mit ``FRIGIS_TEMPERATURE_SERIES`` wird pro Punkt die ganze Jahresspanne in
+    einem Request geladen, sonst nur der Sommer von ``jahr``. Die Zielpunkte der
+    Interpolation werden mitgespeichert, damit ``temperatur_karte`` die Karte für
+    andere Jahre/Statistiken ohne Grid und ohne Netzwerk neu zeichnen kann.
+    """
+    gazetteer = get_gazetteer()
+    eintrag = gazetteer.lookup(ort_name) if gazetteer is not None else None
+    if eintrag:
+        lat0, lon0 = eintrag['lat'], eintrag['lon']
+    else:
+        geocoder = _opencage()
+        try:
+            results = geocode_flight.do(("opencage", normalize(ort_name)),
+                                        limiter.call, "api.opencagedata.com",
+                                        geocoder.geocode, ort_name, no_annotations=1)
+        except Exception as e:
+            ui.error(f"Geocoding failed: {e}")
+            return None
+
+        if not results:
+            ui.warning("Location could not be found.")
+            return None
+
+        lat0, lon0 = results[0]['geometry']['lat'], results[0]['geometry']['lng']
+    lats = np.arange(lat0 - radius_km / 111, lat0 + radius_km / 111 + 1e-6, resolution_km / 111)
+    lons = np.arange(lon0 - radius_km / 85, lon0 + radius_km / 85 + 1e-6, resolution_km / 85)
+    coords = [(lat, lon) for lat in lats for lon in lons]
+    start, end = _temperature_range(jahr)
+
+    if mode == "interpolated":
+        # Grobes Gitter, dann Nachverdichtung dort, wo die Werte am unsichersten sind
+        stichprobe = initial_samples(lat0, lon0, radius_km)
+        total_points = len(stichprobe) + TEMPERATURE_REFINE
+        punkt_daten = _fetch_temperatures(stichprobe, start, end, total_points, ui)
+        if punkt_daten:
+            sommer = TemperatureSeries.from_points(punkt_daten).points("mean_max", jahr)
+            nachverdichtung = refinement_samples(sommer, coords, TEMPERATURE_REFINE, lat0, lon0)
+            if nachverdichtung:
+                punkt_daten += _fetch_temperatures(nachverdichtung, start, end, total_points, ui,
+                                                   done=len(stichprobe))
+    else:
+        total_points = len(coords)
+        punkt_daten = _fetch_temperatures(coords, start, end, total_points, ui)
+
+    if not punkt_daten:
+        ui.warning("Not enough temperature data available.")
+        return None
+
+    meta = {"lat0": lat0, "lon0": lon0, "radius_km": radius_km, "resolution_km": resolution_km,
+            "mode": mode, "jahr": jahr}
+    if mode == "interpolated":
+        meta["ziel"] = _interpolation_targets(grid, lat0, lon0, radius_km, resolution_km)
+    return TemperatureSeries.from_points(punkt_daten, meta)
+
+
+def temperatur_karte(reihen, jahr=None, statistik="mean_max", ui=NULL_UI):
+    """Folium-Karte der Differenzen zum Zentrum, rein lokal aus den geladenen Reihen."""
+    meta = reihen.meta
+    lat0, lon0, resolution_km, mode = meta["lat0"], meta["lon0"], meta["resolution_km"], meta["mode"]
+    einheit = STATISTICS[statistik][1]
+    differenzpunkte = _differenzpunkte(reihen, jahr, statistik, ui)
+    if differenzpunkte is None:
+        return None
+    punkt_daten = differenzpunkte
+
+    # Enhanced Heatmap with MORE data points
+    m = folium.Map(location=[lat0, lon0], zoom_start=13, tiles="CartoDB positron")
+    if mode == "interpolated":
+        ziel = meta.get("ziel")
+        if ziel is None:
+            ziel = _interpolation_targets(None, lat0, lon0, meta["radius_km"], resolution_km)
+        bekannt = np.asarray(differenzpunkte)
+        werte, verfahren, rmse = interpolate(
+            to_km(bekannt[:, 0], bekannt[:, 1], lat0, lon0), bekannt[:, 2],
+            to_km(ziel[:, 0], ziel[:, 1], lat0, lon0))
+        heat_data = [[lat, lon, abs(diff)] for (lat, lon), diff in zip(ziel.tolist(), werte)]
+        ui.info(f"Surface interpolated with {verfahren} from {len(punkt_daten)} measured points "
+                f"onto {len(ziel)} cells; leave-one-out RMSE {rmse:.2f}{einheit}.")
+    else:
+        heat_data = [[lat, lon, abs(diff)] for lat, lon, diff in differenzpunkte]
+    # Dichte Fläche braucht kleinere Kerne als die wenigen Gitterpunkte
+    radius, blur = (12, 10) if mode == "interpolated" else (22, 20)
+    HeatMap(
+        heat_data,
+        radius=radius,  # Größerer Radius für bessere Sichtbarkeit
+        blur=blur,      # Optimierter Blur
+        max_zoom=13,
+        gradient={0.0: "green", 0.3: "lightyellow", 0.6: "orange", 1.0: "red"}
+    ).add_to(m)
+
+    # Beschriftet werden nur gemessene Punkte
+    for lat, lon, diff in differenzpunkte:
+        sign = "+" if diff > 0 else ("−" if diff < 0 else "±")
+        folium.Marker(
+            [lat, lon],
+            icon=folium.DivIcon(html=f"<div style='font-size:10pt; color:black'><b>{sign}{abs(diff):.2f}{einheit}</b></div>")
+        ).add_to(m)
+
+    ui.success(f"{len(punkt_daten)} temperature points loaded (OPTIMIZED: {meta['radius_km']}km radius, {resolution_km}km resolution = ~{len(punkt_daten)} measurement points)!")
+    return m
+
+
+def temperatur_pro_zelle(reihen, grid, jahr=None, statistik="mean_max"):
+    """Interpolierte Differenz zum Zentrum für jede Grid-Zelle (NaN außerhalb des Messgebiets)."""
+    werte = np.full(len(grid), np.nan)
+    differenzpunkte = _differenzpunkte(reihen, jahr, statistik)
+    if differenzpunkte is None or len(grid) == 0:
+        return werte
+    meta = reihen.meta
+    lat0, lon0, radius_km = meta["lat0"], meta["lon0"], meta["radius_km"]
+    c = grid.geometry.centroid.to_crs("EPSG:4326")
+    lat, lon = c.y.values, c.x.values
+    inside = (np.abs(lat - lat0) <= radius_km / 111) & (np.abs(lon - lon0) <= radius_km / 85)
+    if inside.any():
+        bekannt = np.asarray(differenzpunkte)
+        werte[inside], _, _ = interpolate(
+            to_km(bekannt[:, 0], bekannt[:, 1], lat0, lon0), bekannt[:, 2],
+            to_km(lat[inside], lon[inside], lat0, lon0))
+    return werte
+
+
+def _differenzpunkte(reihen, jahr, statistik, ui=NULL_UI):
+    """[[lat, lon, Differenz zum Referenzpunkt im Zentrum], ...] oder None ohne Daten."""
+    meta = reihen.meta
+    lat0, lon0, resolution_km = meta["lat0"], meta["lon0"], meta["resolution_km"]
+    punkt_daten = reihen.points(statistik, jahr or meta["jahr"])
+    if not punkt_daten:
+        ui.warning("Not enough temperature data available.")
+        return None
+
+    ref_temp = None
+    for lat, lon, temp in punkt_daten:
+        if abs(lat - lat0) < resolution_km / 222 and abs(lon - lon0) < resolution_km / 170:
+            ref_temp = temp
+    if ref_temp is None:
+        ref_temp = np.mean([temp for _, _, temp in punkt_daten])
+        ui.info("Reference temperature estimated")
+
+    return [
+        [lat, lon, round(temp - ref_temp, 2)]
+        for lat, lon, temp in punkt_daten
+    ]
+
+
+def _temperature_range(jahr):
+    """Abfragezeitraum: ganze Jahresspanne (Serienmodus) bzw. nur der Sommer von ``jahr``."""
+    if TEMPERATURE_SERIES:
+        first, _, last = TEMPERATURE_SERIES.partition("-")
+        first, last = min(int(first), jahr), max(int(last or first), jahr)
+        return f"{first}-01-01", f"{last}-12-31"
+    return f"{jahr}-06-01", f"{jahr}-08-31"
+
+
+def _fetch_temperature(lat, lon, start, end, deadline):
+    for _ in range(2):  # Reduziert auf 2 Versuche
+        if deadline is not None and deadline.expired():
+            break  # Stufe bereits abgeschlossen - keine weiteren Versuche
+        try:
+            url = (
+                f"{OPEN_METEO_URL}?"
+                f"latitude={lat}&longitude={lon}"
+                f"&start_date={start}&end_date={end}"
+                f"&daily=temperature_2m_max&timezone=auto"
+            )
+            timeout = deadline.timeout(8) if deadline is not None else 8  # Reduziert auf 8s
+            # Nachzügler: nach HEDGE_AFTER s ohne Antwort läuft ein zweiter Request parallel
+            r = hedged(session.get, url, timeout=timeout)
+            if r is None or r.status_code != 200:
+                time.sleep(0.5)
+                continue
+            daily = r.json().get("daily", {})
+            temps = daily.get("temperature_2m_max", [])
+            if not temps:
+                break
+            # None (fehlende Tage) -> NaN, kompakt als float32
+            return lat, lon, (daily["time"], np.array(temps, dtype=float).astype(np.float32))
+        except Exception:
+            time.sleep(0.5)
+    return lat, lon, None
+
+
+def fetch_temperature(lat, lon, start, end):
+    # Gleicher Punkt + Zeitraum aus mehreren Sessions -> ein Request
+    return temperature_flight.do((round(lat, 5), round(lon, 5), start, end),
+                                 _fetch_temperature, lat, lon, start, end, current_deadline.get())
+
+
+def _fetch_temperatures(coords, start, end, total_points, ui, done=0):
+    """Tagesreihen für ``coords`` parallel laden -> [[lat, lon, (zeiten, werte)], ...]."""
+    punkt_daten = []
+    progress = ui.progress(done / total_points, text=f"Loading temperature data... ({total_points} points)")
+    count = done
+    deadline = current_deadline.get()
+
+    # Optimized number of parallel temperature requests
+    executor = ThreadPoolExecutor(max_workers=6)  # Reduziert von 8 auf 6
+    # Kontext (Client für faire Ratenbegrenzung, Deadline) an die Threads weitergeben
+    futures = [executor.submit(contextvars.copy_context().run, fetch_temperature, lat, lon, start, end)
+               for lat, lon in coords]
+    try:
+        for future in as_completed(futures, timeout=deadline.remaining() if deadline is not None else None):
+            lat, lon, reihe = future.result()
+            if reihe is not None:
+                punkt_daten.append([lat, lon, reihe])
+
+            count += 1
+            progress.progress(min(count / total_points, 1.0), 
+                           text=f"Loading temperature data... ({count}/{total_points})")
+    except FutureTimeout:
+        # Budget abgelaufen: ausstehende Punkte abbrechen, mit vorhandenen Daten rendern
+        report_partial()
+        ui.warning(f"Partial result: time budget exhausted, {count} of {total_points} points answered.")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    progress.empty()
+    return punkt_daten
+
+
+def _interpolation_targets(grid, lat0, lon0, radius_km, resolution_km, max_points=5000):
+    """Zielpunkte (lat, lon) der Interpolation: Grid-Zellen im Messgebiet oder feines Gitter."""
+    if grid is not None and len(grid):
+        c = grid.geometry.centroid.to_crs("EPSG:4326")
+        ziel = np.column_stack([c.y.values, c.x.values])
+        # Nicht über das gemessene Gebiet hinaus extrapolieren
+        inside = (np.abs(ziel[:, 0] - lat0) <= radius_km / 111) & (np.abs(ziel[:, 1] - lon0) <= radius_km / 85)
+        ziel = ziel[inside]
+    else:
+        ziel = np.empty((0, 2))
+    if not len(ziel):
+        step = resolution_km / 4
+        lats = np.arange(lat0 - radius_km / 111, lat0 + radius_km / 111 + 1e-6, step / 111)
+        lons = np.arange(lon0 - radius_km / 85, lon0 + radius_km / 85 + 1e-6, step / 85)
+        la, lo = np.meshgrid(lats, lons, indexing="ij")
+        ziel = np.column_stack([la.ravel(), lo.ravel()])
+    if len(ziel) > max_points:
+        ziel = ziel[::int(np.ceil(len(ziel) / max_points))]
+    return ziel
+
+
+def _sentinel_items(bbox, bbox_key, year_range):
+    def _stac_items():
+        limiter.acquire("planetarycomputer.microsoft.com")
+        catalog = Client.open(STAC_URL)
+        search = catalog.search(
+            collections=["sentinel-2-l2a"],
+            bbox=bbox.tolist(),
+            datetime=year_range,
+            query={"eo:cloud_cover": {"lt": 20}}
+        )
+        return list(search.get_items())
+
+    return stac_flight.do(("sentinel-2-l2a", bbox_key, year_range), _stac_items)
+
+
+def _lade_einzelszene(archive, bbox, bbox_key, year_range, utm_crs, progress, ui):
+    """Beste Einzelszene -> (scene_id, layers) bzw. (None, None), wenn keine gefunden."""
+    if archive is not None:
+        # Lokales COG-Archiv: kein Netzwerk, nur Fensterlesen der benötigten Blöcke
+        # Nur vollständig abdeckende Ausschnitte; fehlt einer, wird ggf. nachgeladen
+        progress.progress(0.2, text="Szene im lokalen Archiv wird gesucht...")
+        scenes = archive.covering(bbox.tolist(), year_range, max_cloud=20)
+        if not scenes:
+            ui.warning("Keine Szene im lokalen COG-Archiv deckt das Gebiet vollständig ab.")
+            return None, None
+        progress.progress(0.4, text="Bilddaten werden aus dem lokalen Archiv geladen...")
+        scene = scenes[0]
+        scene_id = scene["id"]
+        # Ältere Archiv-Szenen haben evtl. nur RGB - dann ohne Indizes
+        baender = [b for b in SPECTRAL_BANDS if b in scene["assets"]]
+
+        def _lade_spektral():
+            bands, x, y = archive.lazy_bands(scene, baender, bbox.tolist(), utm_crs, resolution=5)
+            layers = compute_spectral(bands, boa_offset(scene["datetime"]), baender)
+            return {**layers, "x": x, "y": y}
+    else:
+        items = call_with_deadline(_sentinel_items, bbox, bbox_key, year_range)
+        if not items:
+            ui.warning("Kein geeignetes Sentinel-2 Bild gefunden.")
+            return None, None
+
+        item = planetary_computer.sign(items[0])
+        scene_id = item.id
+        progress.progress(0.4, text="Bilddaten werden geladen...")
+
+        def _lade_spektral():
+            # VIEL bessere Auflösung für k-Means; alle Bänder in einem lazy Stapel
+            bands, x, y = _remote_bands(item, SPECTRAL_BANDS, bbox, utm_crs)
+            layers = compute_spectral(bands, boa_offset(item.properties.get("datetime")))
+            return {**layers, "x": x, "y": y}
+
+    # Läuft bei Ablauf im Hintergrund weiter; der nächste Aufruf bekommt das Ergebnis aus dem Cache
+    layers = call_with_deadline(
+        stage_flight.do, ("s2_spectral", scene_id, bbox_key, utm_crs), _lade_spektral)
+    return scene_id, layers
+
+
+def _remote_bands(item, assets, bbox, utm_crs):
+    """Bänder einer signierten STAC-Szene als lazy Stapel ``(band, y, x)`` mit Pixelmitten.
+
+    Die Range-Zugriffe auf die COGs laufen über den lokalen Block-Cache
+    (``frigis.blockcache``); überlappende bboxen lesen bereits geholte Kacheln von Platte.
+    """
+    cache = get_block_cache()
+    return lazy_read([item.assets[asset].href for asset in assets], bbox.tolist(), utm_crs, resolution=5,
+                     opener=cache.opener(session) if cache else None)
+
+
+def _lade_komposit(archive, bbox, bbox_key, year_range, utm_crs):
+    """Median-Komposit der Saison -> (komposit_id, layers) oder None, wenn keine Szene SCL hat.
+
+    Bei einem Cache-Treffer wird weder gesucht noch eine Szene gelesen.
+    """
+    cache = get_composite_cache()
+    key = {"bbox": bbox_key, "season": SATELLITE_SEASON, "datetime": year_range, "epsg": utm_crs,
+           "resolution": 5, "bands": SPECTRAL_BANDS, "source": "archive" if archive else "stac"}
+    assets = SPECTRAL_BANDS + ["SCL"]
+
+    def build():
+        if archive is not None:
+            scenes = [sc for sc in archive.covering(bbox.tolist(), year_range, max_cloud=20, assets=assets)
+                      if in_season(sc["datetime"], SATELLITE_SEASON)][:COMPOSITE_SCENES]
+            if not scenes:
+                return None
+            stacks = [archive.lazy_bands(sc, assets, bbox.tolist(), utm_crs, resolution=5) for sc in scenes]
+            _, x, y = stacks[0]
+            stack = da.stack([bands for bands, _, _ in stacks])
+            dates = [sc["datetime"] for sc in scenes]
+        else:
+            items = [it for it in _sentinel_items(bbox, bbox_key, year_range)
+                     if in_season(it.properties.get("datetime"), SATELLITE_SEASON)]
+            items = sorted(items, key=lambda it: it.properties.get("eo:cloud_cover", 100))[:COMPOSITE_SCENES]
+            if not items:
+                return None
+            stacks = [_remote_bands(planetary_computer.sign(it), assets, bbox, utm_crs) for it in items]
+            _, x, y = stacks[0]
+            stack = da.stack([bands for bands, _, _ in stacks])
+            dates = [it.properties.get("datetime") for it in items]
+        n = len(SPECTRAL_BANDS)
+        return median_composite(stack[:, :n], stack[:, n], [boa_offset(d) for d in dates]), x, y
+
+    komposit = cache.get_or_build(key, build, utm_crs)
+    if komposit is None:
+        return None
+    bands, x, y = komposit
+    # Offsets sind im Komposit bereits angeglichen
+    layers = compute_spectral(bands, 0)
+    return "composite:" + os.path.basename(cache.path(key)), {**layers, "x": x, "y": y}
+
+
+def analysiere_reflektivitaet_graustufen(stadtteil_name, n_clusters=5, year_range="2020-01-01/2024-12-31",
+                                         grid=None, raster=None, ui=NULL_UI):
+    """k-Means auf RGB plus NDVI/NDBI/Albedo aus demselben lazy Bandstapel.
+
+    Mit ``grid`` werden die Indizes auf dessen Zellen gemittelt und als Spalten
+    ``brightness``, ``ndvi``, ``ndbi``, ``albedo`` ins Grid geschrieben. Ist
+    ``raster`` ein dict, landen dort das Labelbild (``labels``, uint8, h × w),
+    ``transform`` (GDAL-Reihenfolge) und ``crs`` für den Export.
+    """
+    try:
+        progress = ui.progress(0, text="Satellitendaten werden gesucht...")
+
+        gebiet = geocode_to_gdf_with_fallback(stadtteil_name, ui=ui)
+        if gebiet is None:
+            ui.warning("Gebiet konnte nicht gefunden werden.")
+            progress.empty()
+            return None
+
+        # VIEL größerer Radius für k-Means Satellitendaten
+        bounds = gebiet.total_bounds
+        center_lon = (bounds[0] + bounds[2]) / 2
+        center_lat = (bounds[1] + bounds[3]) / 2
+        large_offset = 0.015  # Viel größerer Radius: ca. 1.5km statt 350m
+        large_polygon = Polygon([
+            (center_lon - large_offset, center_lat - large_offset),
+            (center_lon + large_offset, center_lat - large_offset), 
+            (center_lon + large_offset, center_lat + large_offset),
+            (center_lon - large_offset, center_lat + large_offset)
+        ])
+        large_gebiet = gpd.GeoDataFrame({'geometry': [large_polygon]}, crs='EPSG:4326')
+        bbox = large_gebiet.total_bounds
+        progress.progress(0.1, text="Suche nach Sentinel-2 Daten...")
+        utm_crs = gebiet.estimate_utm_crs().to_epsg()
+        bbox_key = tuple(np.round(bbox, 5))
+
+        archive = get_cog_archive()
+        if SATELLITE_MODE == "composite":
+            progress.progress(0.2, text="Wolkenfreies Median-Komposit wird erstellt...")
+            komposit = call_with_deadline(
+                stage_flight.do, ("s2_composite", bbox_key, SATELLITE_SEASON, year_range, utm_crs),
+                _lade_komposit, archive, bbox, bbox_key, year_range, utm_crs)
+            if komposit is None:
+                ui.info("Kein Komposit möglich (zu wenige Szenen mit SCL) - verwende Einzelszene.")
+            else:
+                scene_id, layers = komposit
+        if SATELLITE_MODE != "composite" or komposit is None:
+            scene_id, layers = _lade_einzelszene(archive, bbox, bbox_key, year_range, utm_crs, progress, ui)
+            if layers is None:
+                progress.empty()
+                return None
+        # Maskierte Pixel (Wolken, keine Szene) bleiben außerhalb des Clusterings
+        gueltig = np.isfinite(layers["rgb"]).all(axis=2)
+        if not gueltig.any():
+            ui.warning("Keine gültigen Satellitenpixel im Gebiet (vollständig maskiert).")
+            progress.empty()
+            return None
+        rgb = np.nan_to_num(layers["rgb"])
+        rgb_scaled = np.clip((rgb / 3000) * 255, 0, 255).astype(np.uint8)
+
+        h, w, _ = rgb_scaled.shape
+        pixels = rgb_scaled.reshape(-1, 3)
+        maske = gueltig.ravel()
+        progress.progress(0.7, text="k-Means Clustering wird durchgeführt...")
+        labels = np.full(h * w, -1)
+        labels[maske] = stage_flight.do(
+            ("kmeans", scene_id, bbox_key, n_clusters),
+            lambda: KMeans(n_clusters=n_clusters, random_state=42).fit(pixels[maske]).labels_)
+
+        cluster_info = []
+        for i in range(n_clusters):
+            cluster_pixels = pixels[labels == i]
+            if len(cluster_pixels) == 0:
+                cluster_info.append((i, 0, "Keine Daten"))
+                continue
+            helligkeit = cluster_pixels.mean(axis=1).mean() / 255
+            beschreibung = (
+                "Sehr hell (hohe Reflektivität)" if helligkeit > 0.75 else
+                "Hell (moderat reflektierend)" if helligkeit > 0.5 else
+                "Mittel (neutral)" if helligkeit > 0.35 else
+                "Dunkel (hohes Aufheizungspotenzial)"
+            )
+            cluster_info.append((i, round(helligkeit, 2), beschreibung))
+
+        gray_values = np.linspace(0, 255, n_clusters).astype(int)
+        gray_colors = np.stack([gray_values]*3, axis=1)
+        cluster_image = gray_colors[labels].reshape(h, w, 3).astype(np.uint8)
+        cluster_image[~gueltig] = (173, 216, 230)  # maskiert: hellblau, nicht mit Clustern verwechselbar
+        if raster is not None:
+            x, y = layers["x"], layers["y"]
+            aufloesung = float(x[1] - x[0])
+            raster.update(labels=np.where(maske, labels, LABEL_NODATA).astype(np.uint8).reshape(h, w),
+                          crs=f"EPSG:{utm_crs}",
+                          transform=(float(x[0]) - aufloesung / 2, aufloesung, 0.0,
+                                     float(y[0]) + aufloesung / 2, 0.0, -aufloesung))
+
+        indizes = [name for name in INDICES if name in layers]
+        if grid is not None:
+            if grid.crs.to_epsg() == utm_crs:
+                # Helligkeit (0-1) wie beim Clustering plus alle verfügbaren Indizes
+                pixel = {"brightness": np.where(gueltig, rgb_scaled.mean(axis=2) / 255, np.nan)}
+                pixel.update({name: layers[name] for name in indizes})
+                gemittelt = aggregate_to_grid(pixel, layers["x"], layers["y"], grid, CELL_SIZE)
+                for name, werte in gemittelt.items():
+                    grid[name] = werte
+            else:
+                grid = None
+
+        if indizes:
+            fig = Figure(figsize=(12, 12))
+            axes = fig.subplots(2, 2).ravel()
+            ax = axes[0]
+        else:
+            fig = Figure(figsize=(6,6))
+            ax = fig.subplots()
+        ax.imshow(cluster_image)
+        ax.axis("off")
+        ax.set_title("k-Means (RGB)")
+
+        # Index-Karten: auf dem Analyse-Grid (40 m) oder, ohne Grid, pixelweise
+        for ax_i, name in zip(axes[1:] if indizes else [], indizes):
+            titel, cmap, vmin, vmax = INDEX_STYLE[name]
+            if grid is not None:
+                grid.plot(ax=ax_i, column=name, cmap=cmap, vmin=vmin, vmax=vmax, legend=True,
+                          edgecolor="none", missing_kwds={"color": "lightgrey"})
+            else:
+                bild = ax_i.imshow(layers[name], cmap=cmap, vmin=vmin, vmax=vmax)
+                fig.colorbar(bild, ax=ax_i, shrink=0.8)
+            ax_i.set_title(titel)
+            ax_i.axis("off")
+
+        legend_elements = [
+            Patch(facecolor=gray_colors[i]/255, edgecolor='black',
+                  label=f"Cluster {i}: {cluster_info[i][2]} ({cluster_info[i][1]*100:.0f}%)")
+            for i in range(n_clusters)
+        ]
+        ax.legend(handles=legend_elements, loc="lower center", bbox_to_anchor=(0.5, -0.12),
+                  ncol=1, frameon=True, fontsize="small")
+        fig.tight_layout()
+        progress.empty()
+        return fig
+    except DeadlineExceeded:
+        report_partial()
+        ui.warning("Satellitendaten nicht innerhalb des Zeitbudgets verfügbar - werden im Hintergrund weiter geladen.")
+        return None
+    except Exception as e:
+        ui.error(f"Satellitendatenanalyse fehlgeschlagen: {e}")
+        return None
+
+
+def prioritaet_analysieren_und_plotten(grid_store, k=10, weights=None, min_spacing=200.0,
+                                       coverage_radius=100.0, ui=NULL_UI):
+    """Hitze-Prioritätsindex und Top-``k``-Pflanzstandorte aus dem Grid-Speicher.
+
+    Gibt ``(fig, standorte, prioritaet)`` zurück; ``standorte`` ist ein GeoDataFrame
+    (Rang, Priorität, Gewinn, lat/lon), ``prioritaet`` das Array pro Zelle.
+    """
+    prioritaet = heat_priority(grid_store, weights)
+    if not np.isfinite(prioritaet).any():
+        ui.warning("No analysis layers available for the heat priority index.")
+        return None, None, prioritaet
+
+    punkte = shapely.centroid(np.asarray(grid_store.geometry.values))
+    idx, gewinne, abdeckung = select_sites(punkte, prioritaet, k, min_spacing, coverage_radius)
+    standorte = gpd.GeoDataFrame(
+        {"rank": np.arange(1, len(idx) + 1), "priority": prioritaet[idx], "gain": gewinne},
+        geometry=punkte[idx], crs=grid_store.crs)
+    wgs84 = standorte.geometry.to_crs("EPSG:4326")
+    standorte["lat"], standorte["lon"] = wgs84.y.round(6), wgs84.x.round(6)
+
+    grid = grid_store.to_geodataframe([])
+    grid["heat_priority"] = prioritaet
+    fig = Figure(figsize=(8, 8))
+    ax = fig.subplots()
+    grid.plot(ax=ax, column="heat_priority", cmap="YlOrRd", vmin=0, vmax=1, legend=True,
+              edgecolor="none", missing_kwds={"color": "lightgrey"},
+              legend_kwds={"label": "Heat priority (0 = low, 1 = high)"})
+    if len(standorte):
+        standorte.plot(ax=ax, color="darkgreen", markersize=60, marker="^", edgecolor="white")
+        for rank, geom in zip(standorte["rank"], standorte.geometry):
+            ax.annotate(str(rank), (geom.x, geom.y), xytext=(4, 4), textcoords="offset points",
+                        fontsize=8, fontweight="bold")
+    ax.set_title(f"Top {len(standorte)} planting sites")
+    ax.axis("off")
+    fig.tight_layout()
+
+    ui.success(f"{len(standorte)} candidate sites cover {abdeckung:.0%} of the total heat priority "
+               f"within {coverage_radius:.0f} m (min. spacing {min_spacing:.0f} m).")
+    return fig, standorte, prioritaet
+
+
+def szenario_plotten(szenario, grid_store, ui=NULL_UI):
+    """Karte ``score_distance_norm`` eines ``GreenScenario`` mit den neuen Grünflächen."""
+    grid = grid_store.to_geodataframe([])
+    grid["score_distance_norm"] = szenario.score
+    fig = Figure(figsize=(8, 8))
+    ax = fig.subplots()
+    grid.plot(ax=ax, column="score_distance_norm", cmap=cm.Reds, vmin=0, vmax=1,
+              edgecolor="grey", linewidth=0.2, legend=True,
+              legend_kwds={"label": "Distance to green (Red = far)"},
+              missing_kwds={"color": "lightgrey"})
+    neu = gpd.GeoSeries(szenario.geometries, crs=grid_store.crs)
+    if len(neu):
+        # Punkte (Einzelbäume) als Marker, Flächen als Polygone
+        flaechen = neu[neu.geom_type != "Point"]
+        if len(flaechen):
+            flaechen.plot(ax=ax, color="limegreen", alpha=0.7, edgecolor="darkgreen")
+        punkte = neu[neu.geom_type == "Point"]
+        if len(punkte):
+            punkte.plot(ax=ax, color="darkgreen", markersize=30, marker="^", edgecolor="white")
+    ax.set_title(f"What-if: {len(neu)} new green areas")
+    ax.axis("off")
+    fig.tight_layout()
+
+    kennzahlen = szenario.summary()
+    ui.success(f"{kennzahlen['cells_improved']} cells closer to green; mean distance score "
+               f"{kennzahlen['mean_score_before']:.2f} -> {kennzahlen['mean_score_after']:.2f}, "
+               f"cells beyond {szenario.max_dist:.0f} m {kennzahlen['far_cells_before']} -> "
+               f"{kennzahlen['far_cells_after']}.")
+    return fig
+
+
+def lade_hauptstrassen(gebiet, ui=NULL_UI):
+    """Hauptstraßen im Gebiet als Linien in dessen (metrischer) CRS."""
+    strassen = _load_osm_within_budget(gebiet.to_crs("EPSG:4326").geometry.iloc[0], TAGS_ROADS, "roads", ui)
+    if strassen.empty:
+        return strassen
+    strassen = strassen[strassen.geom_type.isin(["LineString", "MultiLineString"])]
+    return strassen.to_crs(gebiet.crs)
+
+
+def baumarten_empfehlen(grid_store, strassen, k=10, top=3, ui=NULL_UI):
+    """Geeignete Baumarten pro Zelle aus der Baumliste.
+
+    Gibt ``(fig, tabelle, spalten)`` zurück: Karte der Anzahl geeigneter Arten,
+    Empfehlungen für die Top-``k``-Pflanzstandorte (falls ``heat_priority``
+    vorliegt) und die Spalten ``species_count``/``near_road`` für den Grid-Speicher.
+    """
+    if "building_ratio" not in grid_store:
+        ui.warning("Building density is required for the species recommendation.")
+        return None, None, {}
+    index = get_species_index()
+    punkte = shapely.centroid(np.asarray(grid_store.geometry.values))
+    naehe = np.zeros(len(grid_store), dtype=bool)
+    if not strassen.empty:
+        zellen, _ = shapely.STRtree(strassen.geometry.values).query(
+            np.asarray(grid_store.geometry.values), predicate="dwithin", distance=SALT_DISTANCE)
+        naehe[zellen] = True
+    hitze = priority_layers(grid_store).get("temperature_diff", np.full(len(grid_store), np.nan))
+    anforderungen, max_hoehe, eng = site_conditions(grid_store.column("building_ratio"), hitze, naehe)
+    anzahl, _, codes, listen = recommend(index, anforderungen, max_hoehe, eng, top=top)
+
+    tabelle = None
+    if "heat_priority" in grid_store:
+        # Dieselben Standorte wie in der Prioritätsstufe (gleiche Standardparameter)
+        idx, _, _ = select_sites(punkte, grid_store.column("heat_priority"), k)
+        wgs84 = gpd.GeoSeries(punkte[idx], crs=grid_store.crs).to_crs("EPSG:4326")
+        tabelle = pd.DataFrame({
+            "rank": np.arange(1, len(idx) + 1),
+            "lat": wgs84.y.round(6).to_numpy(), "lon": wgs84.x.round(6).to_numpy(),
+            "max_height_m": max_hoehe[idx].astype(int),
+            "road_salt": naehe[idx],
+            "heat_stress": (anforderungen[idx] & TRAITS["trockenheitsverträglich"]).astype(bool),
+            "species": [", ".join(listen[c]) or "-" for c in codes[idx]],
+        })
+
+    grid = grid_store.to_geodataframe([])
+    grid["species_count"] = anzahl
+    fig = Figure(figsize=(8, 8))
+    ax = fig.subplots()
+    grid.plot(ax=ax, column="species_count", cmap="Greens", vmin=0, vmax=len(index), legend=True,
+              edgecolor="none", legend_kwds={"label": "Suitable species from the tree list"})
+    if not strassen.empty:
+        strassen.plot(ax=ax, color="dimgrey", linewidth=0.8)
+    ax.set_title("Suitable tree species per cell")
+    ax.axis("off")
+    fig.tight_layout()
+
+    ohne = int((anzahl == 0).sum())
+    if ohne:
+        ui.warning(f"{ohne} cells have no suitable species in the tree list.")
+    return fig, tabelle, {"species_count": anzahl, "near_road": naehe}
+
+
+def lade_strassennetz(polygon, network_type=STREET_NETWORK, ui=NULL_UI):
+    """Kanten des OSMnx-Straßengraphen im Polygon (WGS84), geteilt zwischen Sessions."""
+    return osm_flight.do((geometry_key(polygon), "graph", network_type),
+                         _lade_strassennetz, polygon, network_type, ui)
+
+
+def _lade_strassennetz(polygon, network_type, ui):
+    try:
+        graph = limiter.call("overpass-api.de", ox.graph_from_polygon, polygon,
+                             network_type=network_type, retain_all=True)
+    except Exception as e:
+        ui.warning(f"Street network could not be loaded: {e}")
+        return gpd.GeoDataFrame()
+    return ox.graph_to_gdfs(graph, nodes=False)
+
+
+def strassenbaeume_analysieren_und_plotten(gebiet, buildings, grid_store, spacing=STREET_TREE_SPACING,
+                                           top=20, ui=NULL_UI):
+    """Straßenbaum-Standorte entlang des Straßennetzes, bewertet mit dem Hitze-Grid.
+
+    Gibt ``(fig, kandidaten, spalten)`` zurück; ``kandidaten`` ist ein GeoDataFrame
+    (Straße, Bewertung, lat/lon) nach Bewertung absteigend, ``spalten`` enthält
+    ``street_tree_sites`` (Kandidaten pro Zelle) für den Grid-Speicher.
+    """
+    bewertung_spalte = next((c for c in ("heat_priority", "temperature_diff", "building_ratio")
+                             if c in grid_store), None)
+    if bewertung_spalte is None:
+        ui.warning("No heat layer available to score street-tree candidates.")
+        return None, None, {}
+
+    polygon = gebiet.to_crs("EPSG:4326").geometry.iloc[0]
+    try:
+        kanten = call_with_deadline(lade_strassennetz, polygon, ui=ui)
+    except DeadlineExceeded:
+        report_partial()
+        ui.warning("Street network not loaded within the time budget.")
+        return None, None, {}
+    if kanten.empty:
+        ui.warning("No streets found in the analysis area.")
+        return None, None, {}
+    kanten = street_edges(kanten).to_crs(gebiet.crs)
+    baeume = _load_osm_within_budget(polygon, TAGS_TREES, "trees", ui)
+    baeume = baeume.to_crs(gebiet.crs).geometry.values if not baeume.empty else []
+    gebaeude = buildings.geometry.values if not buildings.empty else []
+
+    zellen = np.asarray(grid_store.geometry.values)
+    punkte, kante, bewertung = street_tree_candidates(
+        kanten.geometry.values, gebaeude, baeume, zellen, grid_store.column(bewertung_spalte),
+        spacing=spacing, min_spacing=spacing * 0.8)
+    namen = kanten["name"].to_numpy() if "name" in kanten else np.full(len(kanten), None)
+    strassen = [", ".join(n) if isinstance(n, list) else (n if isinstance(n, str) else "")
+                for n in namen[kante]]
+    kandidaten = gpd.GeoDataFrame({"street": strassen, "score": bewertung},
+                                  geometry=punkte, crs=gebiet.crs)
+    if len(kandidaten):
+        wgs84 = kandidaten.geometry.to_crs("EPSG:4326")
+        kandidaten["lat"], kandidaten["lon"] = wgs84.y.round(6), wgs84.x.round(6)
+    zelle, _ = shapely.STRtree(punkte).query(zellen, predicate="intersects") if len(punkte) else ([], [])
+    pro_zelle = np.bincount(np.asarray(zelle, dtype=np.int64), minlength=len(zellen)).astype(float)
+
+    fig = Figure(figsize=(8, 8))
+    ax = fig.subplots()
+    grid = grid_store.to_geodataframe([bewertung_spalte])
+    grid.plot(ax=ax, column=bewertung_spalte, cmap="YlOrRd", alpha=0.6, edgecolor="none",
+              missing_kwds={"color": "lightgrey"})
+    kanten.plot(ax=ax, color="dimgrey", linewidth=0.6)
+    if len(kandidaten):
+        kandidaten.plot(ax=ax, column="score", cmap="Greens", markersize=4)
+        kandidaten.head(top).plot(ax=ax, color="darkgreen", markersize=40, marker="^", edgecolor="white")
+    ax.set_title(f"Street-tree candidates ({len(kandidaten)}, every {spacing:.0f} m)")
+    ax.axis("off")
+    fig.tight_layout()
+
+    ui.success(f"{len(kandidaten)} street-tree sites on {len(kanten)} street segments "
+               f"(scored by {bewertung_spalte}).")
+    return fig, kandidaten, {"street_tree_sites": pro_zelle}
+
+
+def _load_osm_within_budget(polygon, tags, label, ui, required=False):
+    """OSM-Layer innerhalb der Deadline; ``required``-Layer brechen die Stufe ab, statt leer weiterzurechnen."""
+    try:
+        return call_with_deadline(load_osm_data_with_retry, polygon, tags, ui=ui)
+    except DeadlineExceeded:
+        if required:
+            # Abfrage läuft im Hintergrund weiter und landet im OSM-Cache (osm_flight)
+            raise DeadlineExceeded(f"OSM {label} not loaded within the time budget for this area - "
+                                   "they keep loading in the background, please try again in a few minutes.")
+        report_partial()
+        ui.warning(f"OSM {label} not loaded within the time budget - continuing without them.")
+        return gpd.GeoDataFrame()
+
+
+def prepare_area(stadtteil, large_area=False, ui=NULL_UI):
+    """Geocodierung, OSM-Daten und Analyse-Grid für einen Stadtteil (None, wenn nicht gefunden)."""
+    gebiet = call_with_deadline(geocode_to_gdf_with_fallback, stadtteil, large_area=large_area, ui=ui)
+    if gebiet is None:
+        return None
+
+    polygon = gebiet.geometry.iloc[0]
+    utm_crs = gebiet.estimate_utm_crs()
+    gebiet = gebiet.to_crs(utm_crs)
+    area = gebiet.geometry.iloc[0].buffer(0)
+    # Großes Gebiet -> längere OSM-Abfragen: Budget wächst mit der Fläche
+    scale_budget_to_area(area.area)
+
+    ui.info("Loading OSM data...")
+    # Ohne Gebäude/Grün würde jede Zelle Standardwerte bekommen: dann lieber abbrechen
+    buildings = _load_osm_within_budget(polygon, TAGS_BUILDINGS, "buildings", ui, required=True)
+    greens = _load_osm_within_budget(polygon, TAGS_GREEN, "green areas", ui, required=True)
+
+    # Data cleaning
+    if not buildings.empty:
+        buildings = buildings.to_crs(utm_crs)
+        buildings = buildings[buildings.geometry.is_valid & ~buildings.geometry.is_empty]
+    if not greens.empty:
+        greens = greens.to_crs(utm_crs)
+        greens = greens[greens.geometry.is_valid & ~greens.geometry.is_empty]
+
+    # Create grid - HIGHER resolution
+    if large_area:
+        # Kacheln mit Halo über einen Prozesspool, Ergebnisse werden zusammengeführt
+        progress = ui.progress(0, text="Large-area analysis (parallel partitions)...")
+        minx, miny, maxx, maxy = area.bounds
+        zellen = int(np.ceil((maxx - minx) / CELL_SIZE) * np.ceil((maxy - miny) / CELL_SIZE))
+        with admission.admit(STAGE_COST["large_area"],
+                             on_wait=lambda: progress.progress(0, text="Waiting for free capacity...")), \
+                memory.reserve(current_client.get(),
+                               stage_estimate("large_area", zellen, partitions=partition_count(area, CELL_SIZE),
+                                              workers=N_WORKERS),
+                               on_wait=lambda: progress.progress(0, text="Waiting for free memory...")):
+            grid = stage_flight.do(
+                ("large_area", geometry_key(area), CELL_SIZE), large_area_analysis,
+                area, buildings, greens, CELL_SIZE, utm_crs,
+                on_progress=lambda done, total: progress.progress(
+                    done / total, text=f"Large-area analysis... ({done}/{total} partitions)"))
+        progress.empty()
+    else:
+        grid = make_grid(area, CELL_SIZE, utm_crs)
+
+    return {
+        "stadtteil": stadtteil,
+        "gebiet": gebiet,
+        "utm_crs": utm_crs,
+        "area": area,
+        "buildings": buildings,
+        "greens": greens,
+        "grid": grid,
+    }
@@ -0,0 +1,149 @@
+"""Hitze-Prioritätsindex pro Grid-Zelle und Auswahl der besten Pflanzstandorte.
+
+Der Index ist ein gewichtetes Mittel normierter Schichten aus dem Grid-Speicher
+(Gebäudeanteil, Distanz zum Grün, Temperaturdifferenz, Oberflächendunkelheit),
+in einem vektorisierten Durchlauf. Fehlt einer Zelle eine Schicht, werden die
+übrigen Gewichte für diese Zelle neu normiert.
+
+Die Standortwahl ist ein gieriges Max-Coverage mit Lazy-Evaluation (Heap): jeder
+Kandidat "versorgt" die Zellen im ``coverage_radius``; gewählt wird jeweils der
+Kandidat mit dem größten noch unversorgten Prioritätsgewinn, der mindestens
+``min_spacing`` von allen bisherigen Standorten entfernt liegt (Hash-Gitter als
+räumlicher Index).
+
+Gewichte lassen sich über ``FRIGIS_PRIORITY_WEIGHTS`` überschreiben, z.B.
+``building_ratio=0.4,dist_to_green=0.2,temperature_diff=0.3,darkness=0.1``.
+"""
+import heapq
+import os
+
+import numpy as np
+import shapely
+
+DEFAULT_WEIGHTS = {
+    "building_ratio": 0.3,
+    "dist_to_green": 0.3,
+    "temperature_diff": 0.25,
+    "darkness": 0.15,
+}
+
+
+def _parse_weights(spec):
+    weights = dict(DEFAULT_WEIGHTS)
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        name, value = part.split("=")
+        weights[name.strip()] = float(value)
+    return weights
+
+
+WEIGHTS = _parse_weights(os.getenv("FRIGIS_PRIORITY_WEIGHTS"))
+
+
+def _robust_scale(values):
+    """Auf 0-1 über das 5.-95. Perzentil (Ausreißer dominieren nicht)."""
+    finite = values[np.isfinite(values)]
+    if not len(finite):
+        return values
+    lo, hi = np.percentile(finite, [5, 95])
+    if hi - lo < 1e-9:
+        return np.where(np.isfinite(values), 0.5, np.nan)
+    return np.clip((values - lo) / (hi - lo), 0, 1)
+
+
+def priority_layers(store):
+    """Normierte Schichten (0 = unkritisch, 1 = kritisch) aus einem ``GridStore``."""
+    layers = {}
+    if "building_ratio" in store:
+        layers["building_ratio"] = np.clip(store.column("building_ratio"), 0, 1)
+    if "score_distance_norm" in store:
+        layers["dist_to_green"] = store.column("score_distance_norm")
+    if "temperature_diff" in store:
+        layers["temperature_diff"] = _robust_scale(store.column("temperature_diff"))
+    if "brightness" in store:
+        layers["darkness"] = 1 - np.clip(store.column("brightness"), 0, 1)
+    elif "albedo" in store:
+        layers["darkness"] = 1 - np.clip(store.column("albedo") / 0.4, 0, 1)
+    return layers
+
+
+def heat_priority(store, weights=None):
+    """Prioritätsindex 0-1 pro Zelle; NaN nur, wenn einer Zelle alle Schichten fehlen."""
+    weights = WEIGHTS if weights is None else weights
+    num = np.zeros(len(store))
+    den = np.zeros(len(store))
+    for name, values in priority_layers(store).items():
+        w = weights.get(name, 0.0)
+        if w <= 0:
+            continue
+        ok = np.isfinite(values)
+        num += np.where(ok, w * values, 0.0)
+        den += np.where(ok, w, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def select_sites(points, priority, k=10, min_spacing=200.0, coverage_radius=100.0, pool=None):
+    """Top-``k`` Standorte (Zellindizes) nach gieriger Max-Coverage mit Mindestabstand.
+
+    ``points`` sind die Zellmittelpunkte (Shapely-Array in metrischer CRS).
+    Gibt ``(indizes, gewinne, abdeckung)`` zurück; ``abdeckung`` ist der Anteil
+    der Gesamtpriorität, der von den gewählten Standorten versorgt wird.
+    Kandidaten sind die ``pool`` Zellen mit der höchsten Priorität (Standard
+    ``max(250 * k, 5000)``); versorgt werden können alle Zellen.
+    """
+    priority = np.nan_to_num(np.asarray(priority, dtype=float), nan=0.0)
+    xy = shapely.get_coordinates(points)
+    if not len(xy) or k <= 0:
+        return np.array([], dtype=int), np.array([]), 0.0
+
+    pool = max(250 * k, 5000) if pool is None else pool
+    kandidaten = np.argsort(-priority, kind="stable")[:pool]
+
+    # Wer versorgt wen: alle Paare innerhalb des Radius, CSR-artig nach Kandidat sortiert
+    cand, cell = shapely.STRtree(points).query(points[kandidaten], predicate="dwithin",
+                                               distance=coverage_radius)
+    cand = kandidaten[cand]
+    order = np.argsort(cand, kind="stable")
+    cand, cell = cand[order], cell[order]
+    starts = np.zeros(len(xy) + 1, dtype=np.int64)
+    np.add.at(starts, cand + 1, 1)
+    np.cumsum(starts, out=starts)
+    gain = np.bincount(cand, weights=priority[cell], minlength=len(xy))
+
+    covered = np.zeros(len(xy), dtype=bool)
+    heap = [(-gain[i], i) for i in kandidaten if gain[i] > 0]
+    heapq.heapify(heap)
+    buckets = {}  # Hash-Gitter mit Kantenlänge min_spacing -> gewählte Standorte
+    chosen, gains = [], []
+
+    def too_close(i):
+        bx, by = (xy[i] // min_spacing).astype(int) if min_spacing > 0 else (0, 0)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in buckets.get((bx + dx, by + dy), ()):
+                    if np.hypot(*(xy[i] - xy[j])) < min_spacing:
+                        return True
+        return False
+
+    while heap and len(chosen) < k:
+        neg, i = heapq.heappop(heap)
+        if min_spacing > 0 and too_close(i):
+            continue
+        members = cell[starts[i]:starts[i + 1]]
+        current = priority[members[~covered[members]]].sum()
+        # Lazy: veralteter Gewinn -> mit aktuellem Wert zurück in den Heap
+        if heap and current < -heap[0][0] - 1e-12:
+            if current > 0:
+                heapq.heappush(heap, (-current, i))
+            continue
+        if current <= 0:
+            break
+        chosen.append(i)
+        gains.append(current)
+        covered[members] = True
+        if min_spacing > 0:
+            buckets.setdefault(tuple((xy[i] // min_spacing).astype(int)), []).append(i)
+
+    total = priority.sum()
+    coverage = float(priority[covered].sum() / total) if total > 0 else 0.0
+    return np.array(chosen, dtype=int), np.array(gains), coverage
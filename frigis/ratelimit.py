@@ -0,0 +1,218 @@
+"""Prozessweite Ratenbegrenzung pro Upstream-Host und Admission Control für schwere Stufen.
+
+Jeder Upstream (Open-Meteo, Overpass, OpenCage, Planetary Computer, ...) hat
+einen Token-Bucket. Wartende Anfragen werden pro Client (Job bzw. Session)
+eingereiht und reihum bedient, damit eine Analyse mit 50 Temperaturpunkten
+andere Nutzer nicht aushungert. Antwortet ein Host mit 429/503 und
+``Retry-After``, pausiert der Bucket für alle - statt dass jede Session
+einzeln in Retries läuft.
+
+Limits lassen sich über ``FRIGIS_RATE_LIMITS`` überschreiben, z.B.
+``archive-api.open-meteo.com=5:10,api.opencagedata.com=1:1`` (Rate/s:Burst).
+"""
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+
+from frigis.endpoints import LIMITER_HOSTS
+
+# Requests pro Sekunde, Burst
+DEFAULT_LIMITS = {
+    "archive-api.open-meteo.com": (8.0, 8),
+    "overpass-api.de": (1.0, 2),
+    "api.opencagedata.com": (1.0, 1),
+    "nominatim.openstreetmap.org": (1.0, 1),
+    "planetarycomputer.microsoft.com": (5.0, 5),
+}
+FALLBACK_LIMIT = (10.0, 10)
+
+# Gewichte schwerer Stufen und Gesamtbudget gleichzeitig laufender Stufen
+STAGE_COST = {"large_area": 2, "temperature": 1, "satellite": 2, "shade": 1, "street_trees": 1}
+HEAVY_BUDGET = int(os.getenv("FRIGIS_HEAVY_BUDGET", "4"))
+
+# Aktueller Client (Job-ID oder Session), für faire Warteschlangen
+current_client = contextvars.ContextVar("frigis_client", default="default")
+
+
+def _parse_limits(spec):
+    limits = dict(DEFAULT_LIMITS)
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        host, value = part.split("=")
+        rate, _, burst = value.partition(":")
+        limits[host.strip()] = (float(rate), int(burst or max(1, float(rate))))
+    return limits
+
+
+class FairTokenBucket:
+    """Token-Bucket mit Round-Robin über Clients; ``pause()`` sperrt den Host für alle."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # client -> deque(Tickets)
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, client=None, timeout=None):
+        """Blockiert bis ein Token frei ist und dieser Client an der Reihe ist."""
+        client = client or current_client.get()
+        ticket = object()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._queues.setdefault(client, deque()).append(ticket)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                head_client, head_queue = next(iter(self._queues.items()))
+                my_turn = head_queue[0] is ticket
+                if my_turn and now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    head_queue.popleft()
+                    # Round-Robin: bedienter Client wandert ans Ende
+                    if head_queue:
+                        self._queues.move_to_end(head_client)
+                    else:
+                        del self._queues[head_client]
+                    self._cond.notify_all()
+                    return True
+                if deadline is not None and now >= deadline:
+                    self._queues[client].remove(ticket)
+                    if not self._queues[client]:
+                        del self._queues[client]
+                    self._cond.notify_all()
+                    return False
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate, 0.005)
+                if deadline is not None:
+                    wait = min(wait, deadline - now)
+                self._cond.wait(wait if my_turn else max(wait, 0.05))
+
+    def pause(self, seconds):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class RateLimiter:
+    def __init__(self, limits, aliases=None):
+        self.limits = limits
+        self.aliases = aliases or {}  # umgelenkter Host -> Bucket des Originals
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = FairTokenBucket(*self.limits.get(host, FALLBACK_LIMIT))
+            return self._buckets[host]
+
+    def host_for(self, url):
+        """Bucket-Name für eine URL (Stand-ins teilen sich den Bucket des Originals)."""
+        parsed = urlparse(url)
+        return self.aliases.get(parsed.netloc, parsed.hostname)
+
+    def acquire(self, host, client=None, timeout=None):
+        return self.bucket(host).acquire(client, timeout)
+
+    def pause(self, host, seconds):
+        self.bucket(host).pause(seconds)
+
+    def call(self, host, fn, *args, **kwargs):
+        """Für Bibliotheken mit eigenem HTTP-Client (OpenCage, OSMnx): ein Token pro Aufruf."""
+        self.acquire(host)
+        return fn(*args, **kwargs)
+
+
+def _retry_after(response, default):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return default
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter, bei dem jeder Versuch (auch Retries) ein Token des Hosts verbraucht.
+
+    Retries laufen hier statt in urllib3, damit sie durch den Limiter gehen;
+    ``Retry-After`` pausiert den Host-Bucket für alle Sessions.
+    """
+
+    def __init__(self, limiter, total=3, backoff_factor=1,
+                 status_forcelist=(429, 500, 502, 503, 504), **kwargs):
+        super().__init__(max_retries=0, **kwargs)
+        self.limiter = limiter
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.status_forcelist = set(status_forcelist)
+
+    def send(self, request, **kwargs):
+        host = self.limiter.host_for(request.url)
+        for attempt in range(self.total + 1):
+            self.limiter.acquire(host)
+            response = super().send(request, **kwargs)
+            if response.status_code not in self.status_forcelist or attempt == self.total:
+                return response
+            delay = self.backoff_factor * (2 ** attempt)
+            if response.status_code in (429, 503):
+                self.limiter.pause(host, _retry_after(response, delay))
+            else:
+                time.sleep(delay)
+            response.close()
+        return response
+
+
+class AdmissionController:
+    """Gewichtetes FIFO-Budget für gleichzeitig laufende schwere Stufen."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self._used = 0
+        self._cond = threading.Condition()
+        self._waiting = deque()
+
+    @contextlib.contextmanager
+    def admit(self, cost, on_wait=None):
+        cost = min(cost, self.budget)
+        if cost <= 0:
+            yield
+            return
+        ticket = object()
+        with self._cond:
+            self._waiting.append(ticket)
+            must_wait = self._waiting[0] is not ticket or self._used + cost > self.budget
+        if must_wait and on_wait:
+            on_wait()  # außerhalb des Locks: schreibt z.B. Job-Zustand auf Platte
+        with self._cond:
+            while self._waiting[0] is not ticket or self._used + cost > self.budget:
+                self._cond.wait(1.0)
+            self._waiting.popleft()
+            self._used += cost
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._used -= cost
+                self._cond.notify_all()
+
+
+limiter = RateLimiter(_parse_limits(os.getenv("FRIGIS_RATE_LIMITS")), LIMITER_HOSTS)
+admission = AdmissionController(HEAVY_BUDGET)
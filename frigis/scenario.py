@@ -0,0 +1,87 @@
+"""Was-wäre-wenn-Szenarien: neue Bäume/Pocket-Parks und ihre Wirkung auf ``dist_to_green``.
+
+Statt die Distanz aller Zellen gegen ``union_all()`` neu zu rechnen, hält das
+Szenario das bestehende Distanzfeld und aktualisiert pro neuer Grünfläche nur
+die Zellen, deren Mittelpunkt höchstens ``max_dist`` entfernt liegt (STRtree
+über die Zellmittelpunkte). Eine neue Fläche kann Distanzen nur verkleinern,
+also genügt ``min(alt, neu)``. Zellen weiter weg behalten ihren Wert; ihr
+``score_distance_norm`` ist ohnehin gesättigt (1.0).
+
+Jede Bearbeitung (einzeln oder als Stapel) ist ein Schritt, der sich mit
+``undo`` exakt zurücknehmen lässt.
+"""
+import numpy as np
+import shapely
+
+
+class GreenScenario:
+    def __init__(self, points, dist, crs=None, max_dist=500):
+        self.points = np.asarray(points)  # Zellmittelpunkte (metrische CRS)
+        self.crs = crs
+        self.max_dist = max_dist
+        self.base = np.asarray(dist, dtype="float64").copy()
+        self.dist = self.base.copy()
+        self._tree = shapely.STRtree(self.points)
+        self._steps = []  # [(geometrien, [(indizes, alte Distanzen), ...])]
+
+    @classmethod
+    def from_store(cls, store, max_dist=500):
+        """Szenario auf dem ``dist_to_green`` eines ``GridStore``."""
+        points = shapely.centroid(np.asarray(store.geometry.values))
+        return cls(points, store.column("dist_to_green"), store.crs, max_dist)
+
+    @property
+    def score(self):
+        return np.clip(self.dist / self.max_dist, 0, 1)
+
+    @property
+    def geometries(self):
+        """Alle bisher hinzugefügten Grünflächen in Reihenfolge."""
+        return [geom for geoms, _ in self._steps for geom in geoms]
+
+    def __len__(self):
+        return len(self._steps)
+
+    def add(self, geometries):
+        """Fügt eine Grünfläche oder einen Stapel davon als einen Schritt hinzu.
+
+        Gibt die Indizes der Zellen zurück, deren Distanz kleiner wurde.
+        """
+        geoms = [geometries] if isinstance(geometries, shapely.Geometry) else list(geometries)
+        changes = []
+        for geom in geoms:
+            idx = self._tree.query(geom, predicate="dwithin", distance=self.max_dist)
+            d = shapely.distance(geom, self.points[idx])
+            better = d < self.dist[idx]  # NaN (nicht berechnet) bleibt NaN
+            idx, d = idx[better], d[better]
+            changes.append((idx, self.dist[idx].copy()))
+            self.dist[idx] = d
+        self._steps.append((geoms, changes))
+        return np.unique(np.concatenate([idx for idx, _ in changes])) if changes else np.array([], dtype=int)
+
+    def undo(self):
+        """Nimmt den letzten Schritt zurück; False, wenn es nichts zurückzunehmen gibt."""
+        if not self._steps:
+            return False
+        _, changes = self._steps.pop()
+        for idx, old in reversed(changes):
+            self.dist[idx] = old
+        return True
+
+    def reset(self):
+        self.dist = self.base.copy()
+        self._steps.clear()
+
+    def summary(self):
+        """Kennzahlen gegenüber dem Ausgangszustand."""
+        base_score = np.clip(self.base / self.max_dist, 0, 1)
+        delta = base_score - self.score
+        improved = np.nan_to_num(delta) > 0
+        return {
+            "greens_added": len(self.geometries),
+            "cells_improved": int(improved.sum()),
+            "mean_score_before": float(np.nanmean(base_score)),
+            "mean_score_after": float(np.nanmean(self.score)),
+            "far_cells_before": int((base_score >= 1).sum()),
+            "far_cells_after": int((self.score >= 1).sum()),
+        }
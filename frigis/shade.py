@@ -0,0 +1,115 @@
+"""Verschattung und Himmelssichtfaktor (SVF) aus einem Gebäudehöhen-Raster.
+
+Die OSM-Gebäude werden mit ihrer Höhe auf ein feines Raster gebracht (Norden
+oben). Beide Größen entstehen aus Horizont-Scans über das ganze Raster auf
+einmal: pro Schritt entlang einer Richtung wird das Raster um ganze Pixel
+verschoben verglichen (Slices, keine Kopie pro Schritt), nie pro Pixel.
+
+- Schatten: für repräsentative Sommer-Sonnenstände; ein Pixel liegt im
+  Schatten, wenn ein Hindernis in Sonnenrichtung über den Sonnenstrahl ragt.
+- SVF: ``1 - mittleres sin²(Horizontwinkel)`` über ``SVF_DIRECTIONS``
+  Richtungen, Schrittweiten geometrisch wachsend bis ``SVF_RADIUS``.
+"""
+import numpy as np
+from rasterio import features
+from rasterio.transform import from_origin
+
+SUMMER_DAY = 196  # 15. Juli
+SUN_HOURS = (10, 13, 16)  # wahre Sonnenzeit
+SVF_DIRECTIONS = 16
+SVF_RADIUS = 100.0  # m
+
+
+def sun_positions(lat, day=SUMMER_DAY, hours=SUN_HOURS):
+    """``[(höhe, azimut)]`` in Grad (Azimut ab Norden im Uhrzeigersinn), nur Sonne über dem Horizont."""
+    phi = np.radians(lat)
+    delta = np.radians(23.44) * np.sin(2 * np.pi * (284 + day) / 365)
+    positions = []
+    for hour in hours:
+        h = np.radians(15.0 * (hour - 12))
+        altitude = np.arcsin(np.sin(phi) * np.sin(delta) + np.cos(phi) * np.cos(delta) * np.cos(h))
+        azimuth = np.arctan2(-np.sin(h), np.tan(delta) * np.cos(phi) - np.sin(phi) * np.cos(h))
+        if altitude > 0:
+            positions.append((float(np.degrees(altitude)), float(np.degrees(azimuth) % 360)))
+    return positions
+
+
+def rasterize_heights(geoms, heights, bounds, resolution):
+    """Gebäudehöhen als float32-Raster (Zeile 0 = Norden) -> ``(raster, transform)``."""
+    minx, miny, maxx, maxy = bounds
+    width = int(np.ceil((maxx - minx) / resolution))
+    height = int(np.ceil((maxy - miny) / resolution))
+    transform = from_origin(minx, maxy, resolution, resolution)
+    order = np.argsort(heights, kind="stable")  # höhere Gebäude überschreiben niedrigere
+    shapes = ((geoms[i], float(heights[i])) for i in order if heights[i] > 0)
+    raster = features.rasterize(shapes, out_shape=(height, width), transform=transform,
+                                fill=0.0, dtype="float32")
+    return raster, transform
+
+
+def _slices(dy, dx):
+    """(Ziel, Quelle): Quelle ist das um (dy, dx) Pixel versetzte Nachbarpixel."""
+    def axis(d):
+        return (slice(0, -d or None), slice(d, None)) if d >= 0 else (slice(-d, None), slice(0, d))
+    (ty, sy), (tx, sx) = axis(dy), axis(dx)
+    return (ty, tx), (sy, sx)
+
+
+def _steps(max_distance, resolution, geometric=False):
+    n = max(1, int(np.ceil(max_distance / resolution)))
+    if not geometric:
+        return np.arange(1, n + 1)
+    return np.unique(np.round(np.geomspace(1, n, num=max(2, int(np.log2(n) * 3)))).astype(int))
+
+
+def shadow_mask(dsm, resolution, altitude, azimuth):
+    """True für Pixel im Schatten bei Sonnenstand (Höhe, Azimut) in Grad."""
+    tan_alt = np.tan(np.radians(altitude))
+    reichweite = float(dsm.max()) / tan_alt if tan_alt > 0 else 0.0
+    # Schrittrichtung zur Sonne: Osten = +Spalte, Norden = -Zeile
+    richtung = np.array([-np.cos(np.radians(azimuth)), np.sin(np.radians(azimuth))])
+    horizont = np.zeros_like(dsm)
+    gesehen = set()
+    for k in _steps(reichweite, resolution):
+        dy, dx = np.rint(k * richtung).astype(int)
+        if (dy, dx) in gesehen or (dy, dx) == (0, 0):
+            continue
+        gesehen.add((dy, dx))
+        abfall = np.float32(np.hypot(dy, dx) * resolution * tan_alt)
+        ziel, quelle = _slices(dy, dx)
+        np.maximum(horizont[ziel], dsm[quelle] - abfall, out=horizont[ziel])
+    return horizont > dsm + 0.01
+
+
+def sky_view_factor(dsm, resolution, radius=SVF_RADIUS, directions=SVF_DIRECTIONS):
+    """Näherung des Himmelssichtfaktors (0 = Schlucht, 1 = freier Himmel) pro Pixel."""
+    summe = np.zeros_like(dsm)
+    steps = _steps(radius, resolution, geometric=True)
+    for winkel in np.linspace(0, 2 * np.pi, directions, endpoint=False):
+        richtung = np.array([-np.cos(winkel), np.sin(winkel)])
+        steigung = np.zeros_like(dsm)  # max. tan(Horizontwinkel) in dieser Richtung
+        for k in steps:
+            dy, dx = np.rint(k * richtung).astype(int)
+            if (dy, dx) == (0, 0):
+                continue
+            ziel, quelle = _slices(dy, dx)
+            distanz = np.float32(np.hypot(dy, dx) * resolution)
+            np.maximum(steigung[ziel], (dsm[quelle] - dsm[ziel]) / distanz, out=steigung[ziel])
+        # sin²(atan(t)) = t² / (1 + t²)
+        summe += steigung * steigung / (1 + steigung * steigung)
+    return 1 - summe / directions
+
+
+def cell_index_raster(cells, transform, shape):
+    """Zellindex pro Pixel (-1 außerhalb des Grids)."""
+    return features.rasterize(((geom, i) for i, geom in enumerate(cells)), out_shape=shape,
+                              transform=transform, fill=-1, dtype="int32")
+
+
+def aggregate(values, index, valid, n_cells):
+    """Mittelwert von ``values`` pro Zelle über die gültigen Pixel (NaN ohne Pixel)."""
+    ok = valid & (index >= 0)
+    summe = np.bincount(index[ok], weights=values[ok], minlength=n_cells)
+    anzahl = np.bincount(index[ok], minlength=n_cells)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(anzahl > 0, summe / anzahl, np.nan)
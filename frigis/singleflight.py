@@ -0,0 +1,114 @@
+"""Prozessweites Single-Flight: gleiche laufende Anfragen werden zusammengelegt.
+
+Streamlit führt jede Session in einem eigenen Thread desselben Prozesses aus.
+Klicken viele Teilnehmer gleichzeitig auf "Start Analysis" für denselben
+Stadtteil, rechnet nur der erste Aufrufer ("Leader"); alle anderen warten auf
+dessen Ergebnis. Optional bleibt das Ergebnis ``ttl`` Sekunden liegen, damit
+auch wenige Sekunden später eintreffende Sessions nichts neu anfragen.
+
+Ergebnisse werden geteilt, nicht kopiert - Aufrufer dürfen sie nicht in-place ändern.
+Liegengebliebene Ergebnisse zählen gegen das Speicherbudget (``frigis.memory``)
+und werden bei Bedarf vor Ablauf der ``ttl`` verdrängt.
+"""
+import hashlib
+import threading
+import time
+
+from frigis.memory import memory
+from frigis.ratelimit import current_client
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "done_at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.done_at = None
+
+
+class Group:
+    def __init__(self, name, ttl=0.0):
+        self.name = name
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"leader": 0, "shared": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Führt ``fn`` pro ``key`` nur einmal gleichzeitig aus und teilt das Ergebnis."""
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None and call.done_at is not None \
+                        and time.monotonic() - call.done_at > self.ttl:
+                    del self._calls[key]
+                    call = None
+                leader = call is None
+                if leader:
+                    self._prune()
+                    call = self._calls[key] = _Call()
+                    self.stats["leader"] += 1
+                else:
+                    self.stats["shared"] += 1
+
+            if leader:
+                return self._run(key, call, fn, args, kwargs)
+
+            call.event.wait()
+            if call.error is None:
+                return call.result
+            if isinstance(call.error, Exception):
+                raise call.error
+            # Leader wurde abgebrochen (z.B. Streamlit-Rerun/Stop seiner Session):
+            # nicht dessen Kontrollfluss übernehmen, sondern selbst neu versuchen.
+
+    def _run(self, key, call, fn, args, kwargs):
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if call.error is not None or self.ttl <= 0:
+                    self._calls.pop(key, None)
+                else:
+                    call.done_at = time.monotonic()
+            call.event.set()
+            if call.error is None and self.ttl > 0:
+                memory.put((self.name, key), call.result, owner=current_client.get(),
+                           on_evict=lambda: self._evict(key, call))
+
+    def _evict(self, key, call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def _prune(self):
+        now = time.monotonic()
+        for k in [k for k, c in self._calls.items()
+                  if c.done_at is not None and now - c.done_at > self.ttl]:
+            del self._calls[k]
+            memory.discard((self.name, k))
+
+    def forget(self, key):
+        with self._lock:
+            self._calls.pop(key, None)
+        memory.discard((self.name, key))
+
+
+def geometry_key(geom):
+    """Stabiler Schlüssel für eine Shapely-Geometrie (z.B. Analysegebiet)."""
+    return hashlib.sha1(geom.wkb).hexdigest()
+
+
+# Gruppen pro Upstream bzw. Rechenschritt
+geocode_flight = Group("geocode", ttl=60)
+# OSM: länger, damit eine über das Budget gelaufene Abfrage beim erneuten Versuch noch da ist
+osm_flight = Group("osm", ttl=600)
+temperature_flight = Group("temperature", ttl=60)
+stac_flight = Group("stac", ttl=60)
+stage_flight = Group("stage", ttl=60)
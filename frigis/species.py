@@ -0,0 +1,132 @@
+"""Baumarten-Empfehlung pro Grid-Zelle aus der Baumliste (``Baumliste_neu (2).csv``).
+
+Die Liste wird einmal in einen kompakten Merkmalsindex übersetzt: boolesche
+Eigenschaften als Bitmaske pro Art, Endhöhe und pH-Toleranz als Arrays (nach
+Höhe sortiert). Pro Zelle werden Standortbedingungen abgeleitet:
+
+- Platz: maximale Endhöhe aus dem Gebäudeanteil
+- Hitzestress: Temperaturdifferenz (robust skaliert) bzw. Gebäudeanteil
+- Salz: Nähe zu Hauptstraßen (Winterdienst)
+- versiegelter Boden: hoher Gebäudeanteil -> Wurzeldruck
+
+Zellen mit gleichen Bedingungen teilen sich ein Ergebnis; gematcht wird nur
+pro eindeutiger Kombination, damit auch stadtweite Grids in Millisekunden
+durchlaufen.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Standard: Baumliste im Repo-Root, unabhängig vom Arbeitsverzeichnis
+SPECIES_CSV = os.getenv("FRIGIS_SPECIES_CSV",
+                        os.path.join(os.path.dirname(__file__), os.pardir, "Baumliste_neu (2).csv"))
+SITE_PH = float(os.getenv("FRIGIS_SITE_PH", "7.5"))  # Münchner Schotterebene: kalkhaltig
+
+# Spalte der Baumliste -> Bit in der Merkmalsmaske
+TRAITS = {
+    "stadtklimafest": 1,
+    "trockenheitsverträglich": 2,
+    "salzverträglich": 4,
+    "wurzeldruckverträglich": 8,
+}
+NARROW_CROWNS = ("säulenförmig", "oval")
+
+# Gebäudeanteil -> maximale Endhöhe (m): je dichter, desto weniger Kronenraum
+SPACE_RATIO = (0.0, 0.2, 0.4, 0.6)
+SPACE_HEIGHT = (35.0, 25.0, 15.0, 10.0)
+HEAT_THRESHOLD = 0.5  # ab hier (0-1) Hitzestress
+SEALED_RATIO = 0.4  # ab diesem Gebäudeanteil versiegelter Boden
+
+
+class SpeciesIndex:
+    def __init__(self, names, masks, height, ph_min, ph_max, narrow):
+        order = np.argsort(height, kind="stable")
+        self.names = np.asarray(names, dtype=object)[order]
+        self.masks = np.asarray(masks, dtype=np.uint8)[order]
+        self.height = np.asarray(height, dtype=float)[order]
+        self.ph_min = np.asarray(ph_min, dtype=float)[order]
+        self.ph_max = np.asarray(ph_max, dtype=float)[order]
+        self.narrow = np.asarray(narrow, dtype=bool)[order]
+
+    @classmethod
+    def from_csv(cls, path=SPECIES_CSV):
+        df = pd.read_csv(path, sep=";", encoding="utf-8")
+        masks = np.zeros(len(df), dtype=np.uint8)
+        for column, bit in TRAITS.items():
+            masks |= np.where(df[column].astype(str).str.lower() == "true", bit, 0).astype(np.uint8)
+        return cls(df["baumart"], masks, df["maximale_endhöhe"], df["ph_toleranz_min"],
+                   df["ph_toleranz_max"], df["kronenform"].isin(NARROW_CROWNS))
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, required, max_height, ph=SITE_PH, narrow_bonus=False):
+        """Arten für eine Bedingung, beste zuerst (Indizes in ``names``).
+
+        Geeignet ist eine Art, wenn sie alle Bits aus ``required`` hat, nicht
+        höher als ``max_height`` wird und ``ph`` toleriert. Gereiht wird nach
+        genutztem Kronenraum (Höhe / max_height) plus 0.1 je zusätzlicher
+        Toleranz; bei engem Platz bekommen schmale Kronen einen Bonus.
+        """
+        n = np.searchsorted(self.height, max_height, side="right")  # Höhen sind sortiert
+        masks = self.masks[:n]
+        ok = ((masks & required) == required) & (self.ph_min[:n] <= ph) & (ph <= self.ph_max[:n])
+        extra = np.unpackbits((masks & ~np.uint8(required))[:, None], axis=1).sum(axis=1)
+        score = self.height[:n] / max_height + 0.1 * extra + np.where(narrow_bonus & self.narrow[:n], 0.3, 0.0)
+        kandidaten = np.flatnonzero(ok)
+        return kandidaten[np.argsort(-score[kandidaten], kind="stable")]
+
+
+def site_conditions(building_ratio, heat, near_road):
+    """Standortbedingungen pro Zelle -> (Bitmaske der Anforderungen, maximale Endhöhe, enger Platz).
+
+    ``heat`` ist Hitzestress 0-1 (NaN = unbekannt), ``near_road`` bool.
+    """
+    building_ratio = np.nan_to_num(np.asarray(building_ratio, dtype=float), nan=0.0)
+    heat = np.asarray(heat, dtype=float)
+    required = np.full(len(building_ratio), TRAITS["stadtklimafest"], dtype=np.uint8)
+    hot = np.where(np.isfinite(heat), heat >= HEAT_THRESHOLD, building_ratio >= SEALED_RATIO)
+    required |= np.where(hot, TRAITS["trockenheitsverträglich"], 0).astype(np.uint8)
+    required |= np.where(near_road, TRAITS["salzverträglich"], 0).astype(np.uint8)
+    required |= np.where(building_ratio >= SEALED_RATIO, TRAITS["wurzeldruckverträglich"], 0).astype(np.uint8)
+    max_height = np.interp(building_ratio, SPACE_RATIO, SPACE_HEIGHT)
+    # Auf ganze Meter abrunden: wenige eindeutige Kombinationen, gleiche Arten
+    return required, np.floor(max_height), building_ratio >= SEALED_RATIO
+
+
+def recommend(index, required, max_height, narrow, top=3, ph=SITE_PH):
+    """Empfehlungen für alle Zellen auf einmal.
+
+    Gibt ``(anzahl, beste, codes, listen)`` zurück: pro Zelle die Anzahl
+    geeigneter Arten, den Index der besten Art (-1 = keine) und den Code der
+    Bedingung; ``listen[codes[i]]`` sind die Top-``top`` Artnamen der Zelle ``i``.
+    """
+    # Bedingung als eine Ganzzahl: Bits 0-3 Anforderungen, Bit 4 eng, ab Bit 5 Höhe
+    schluessel = (np.asarray(required, dtype=np.int64) | (np.asarray(narrow, dtype=np.int64) << 4)
+                  | (np.asarray(max_height, dtype=np.int64) << 5))
+    eindeutig, codes = np.unique(schluessel, return_inverse=True)
+    anzahl = np.zeros(len(eindeutig), dtype=np.int64)
+    beste = np.full(len(eindeutig), -1, dtype=np.int64)
+    listen = []
+    for j, key in enumerate(eindeutig):
+        treffer = index.match(np.uint8(key & 0xF), float(key >> 5), ph, narrow_bonus=bool(key & 0x10))
+        anzahl[j] = len(treffer)
+        if len(treffer):
+            beste[j] = treffer[0]
+        listen.append(list(index.names[treffer[:top]]))
+    return anzahl[codes], beste[codes], codes, listen
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_species_index():
+    """Prozessweiter Merkmalsindex aus ``FRIGIS_SPECIES_CSV`` (einmal geladen)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SpeciesIndex.from_csv(SPECIES_CSV)
+    return _index
@@ -0,0 +1,84 @@
+"""Spektralindizes (NDVI, NDBI, Albedo) aus einem einzigen, lazy gelesenen Bandstapel.
+
+Alle Indizes und das RGB-Bild für das Clustering hängen am selben Dask-Graphen
+über ``(band, y, x)``; ``dask.compute`` liest jeden Chunk jedes Bandes genau
+einmal und rechnet blockweise. Die Pixelwerte werden anschließend auf das
+40-m-Analyse-Grid gemittelt.
+"""
+import dask
+import dask.array as da
+import numpy as np
+
+# Reihenfolge des Bandstapels
+SPECTRAL_BANDS = ["B02", "B03", "B04", "B08", "B11", "B12"]
+INDICES = ["ndvi", "ndbi", "albedo"]
+
+# Ab Processing Baseline 04.00 (25.01.2022) haben L2A-Produkte einen Offset von -1000
+BOA_OFFSET_SINCE = np.datetime64("2022-01-25")
+
+
+def boa_offset(datetime):
+    """Radiometrischer Offset einer L2A-Szene anhand ihres Aufnahmedatums."""
+    if not datetime:
+        return 0
+    return -1000 if np.datetime64(str(datetime)[:10]) >= BOA_OFFSET_SINCE else 0
+
+
+def spectral_graph(bands, offset=0, names=SPECTRAL_BANDS):
+    """Lazy Ausdrücke für RGB und Indizes aus einem ``(band, y, x)``-Dask-Array.
+
+    ``names`` gibt die Bandreihenfolge an; Indizes, deren Bänder fehlen, entfallen.
+    RGB bleibt auf der DN-Skala, wie es das Clustering erwartet, aber wie die
+    Indizes um den Offset korrigiert (DN + Offset) - so liefern Einzelszene und
+    Komposit (dessen Bänder schon korrigiert sind, ``offset=0``) dieselben Werte.
+    Die Indizes rechnen mit Bodenreflexion (DN + Offset) / 10000.
+    """
+    b = {name: bands[i].astype("float32") + offset for i, name in enumerate(names)}
+    graph = {"rgb": da.stack([b["B04"], b["B03"], b["B02"]], axis=-1)}
+    r = {name: da.clip(band / 10000, 0, 1) for name, band in b.items()}
+    if {"B04", "B08"} <= r.keys():
+        graph["ndvi"] = (r["B08"] - r["B04"]) / (r["B08"] + r["B04"])
+    if {"B08", "B11"} <= r.keys():
+        graph["ndbi"] = (r["B11"] - r["B08"]) / (r["B11"] + r["B08"])
+    if set(SPECTRAL_BANDS) - {"B03"} <= r.keys():
+        # Breitband-Albedo nach Liang (2001), übliche Übertragung auf Sentinel-2-Bänder
+        graph["albedo"] = (0.356 * r["B02"] + 0.130 * r["B04"] + 0.373 * r["B08"]
+                           + 0.085 * r["B11"] + 0.072 * r["B12"] - 0.0018)
+    return graph
+
+
+def compute_spectral(bands, offset=0, names=SPECTRAL_BANDS):
+    """Berechnet RGB und alle Indizes in einem Durchlauf über die Chunks -> dict von NumPy-Arrays."""
+    graph = spectral_graph(bands, offset, names)
+    values = dask.compute(*graph.values())
+    return dict(zip(graph, values))
+
+
+def aggregate_to_grid(layers, x, y, grid, cell_size):
+    """Mittelt Pixel-Layer (``y, x``) auf die Zellen eines regulären Grids gleicher CRS.
+
+    ``x``/``y`` sind die Pixelmitten; Zellen ohne gültiges Pixel bekommen NaN.
+    """
+    bounds = grid.geometry.bounds
+    gx0, gy0 = bounds["minx"].min(), bounds["miny"].min()
+    cx = np.rint((bounds["minx"].values - gx0) / cell_size).astype(int)
+    cy = np.rint((bounds["miny"].values - gy0) / cell_size).astype(int)
+    lookup = np.full((cx.max() + 1, cy.max() + 1), -1, dtype=np.int64)
+    lookup[cx, cy] = np.arange(len(grid))
+
+    px = np.floor((np.asarray(x) - gx0) / cell_size).astype(int)
+    py = np.floor((np.asarray(y) - gy0) / cell_size).astype(int)
+    px_ok = (px >= 0) & (px < lookup.shape[0])
+    py_ok = (py >= 0) & (py < lookup.shape[1])
+    cell = np.full((len(py), len(px)), -1, dtype=np.int64)
+    cell[np.ix_(py_ok, px_ok)] = lookup[np.ix_(px[px_ok], py[py_ok])].T
+
+    out = {}
+    for name, values in layers.items():
+        valid = (cell >= 0) & np.isfinite(values)
+        idx = cell[valid]
+        sums = np.bincount(idx, weights=values[valid], minlength=len(grid))
+        counts = np.bincount(idx, minlength=len(grid))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[name] = np.where(counts > 0, sums / counts, np.nan)
+    return out
@@ -0,0 +1,513 @@
+"""Lokale Stand-ins für OpenCage, Overpass, Open-Meteo und STAC samt COGs.
+
+Für Lasttests (``frigis.loadtest``) und Entwicklung ohne Netzwerk. Jeder Dienst
+läuft als eigener ``ThreadingHTTPServer`` auf localhost (eigener Port, damit
+der Ratenlimiter ihn dem Original zuordnen kann) und antwortet synthetisch,
+aber deterministisch: gleiche Anfrage, gleiche Antwort.
+
+Alle Dienste beschreiben dieselbe künstliche Stadt: ein Raster aus Blöcken
+(``BLOCK_LAT`` × ``BLOCK_LON`` Grad) mit Straßen auf den Blockrändern, vier
+Gebäuden pro Block, vereinzelten Parkblöcken und Straßenbäumen. Die
+Sentinel-2-Szenen werden daraus beim ersten Zugriff als COG gerendert und mit
+HTTP-Range-Anfragen ausgeliefert (wie Blob-Storage).
+
+Pro Dienst sind Latenz (Mittelwert in s, exponentiell verteilt um
+``jitter``) und Fehlerquote einstellbar. Injizierte Fehler sind abwechselnd
+503 mit ``Retry-After`` und 500. ``StandIns.env()`` liefert die
+``FRIGIS_*_URL``-Variablen (``frigis.endpoints``), die die App umlenken.
+"""
+import datetime as dt
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+SERVICES = ("opencage", "overpass", "open_meteo", "stac", "cog")
+
+# Künstliche Stadt: Blockraster in Grad (~100 m) und Lage der geocodierten Orte
+BLOCK_LAT = 0.0009
+BLOCK_LON = 0.0013
+CITY_BOUNDS = (11.45, 48.08, 11.70, 48.20)  # lon/lat, Raum München (UTM 32N)
+SCENES = 3  # Szenen pro STAC-Suche
+COG_RESOLUTION = 10.0  # m
+
+
+def _hash(*parts):
+    return int.from_bytes(hashlib.sha1(repr(parts).encode()).digest()[:8], "big")
+
+
+def _is_park(i, j):
+    return _hash("park", i, j) % 9 == 0
+
+
+def _is_primary(index):
+    return index % 4 == 0
+
+
+class Upstream:
+    """Latenz und Fehlerinjektion eines Dienstes, plus Zähler."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, jitter=0.5, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "bytes": 0}
+
+    def delay(self):
+        if self.latency <= 0:
+            return 0.0
+        with self._lock:
+            streuung = self._random.expovariate(1.0) if self.jitter else 1.0
+        return self.latency * ((1 - self.jitter) + self.jitter * streuung)
+
+    def inject_error(self):
+        """``None`` oder Statuscode eines injizierten Fehlers."""
+        with self._lock:
+            self.stats["requests"] += 1
+            if self._random.random() >= self.error_rate:
+                return None
+            self.stats["errors"] += 1
+            return 503 if self.stats["errors"] % 2 else 500
+
+    def count_bytes(self, n):
+        with self._lock:
+            self.stats["bytes"] += n
+
+
+# --- synthetische Antworten ---
+
+def geocode(query):
+    """Deterministischer Ort innerhalb von ``CITY_BOUNDS`` für einen Suchtext."""
+    h = _hash("geocode", query.strip().lower())
+    minx, miny, maxx, maxy = CITY_BOUNDS
+    lon = minx + (h % 10_000) / 10_000 * (maxx - minx)
+    lat = miny + (h // 10_000 % 10_000) / 10_000 * (maxy - miny)
+    return {
+        "geometry": {"lat": lat, "lng": lon},
+        "bounds": {"southwest": {"lat": lat - 0.005, "lng": lon - 0.007},
+                   "northeast": {"lat": lat + 0.005, "lng": lon + 0.007}},
+        "formatted": query,
+        "confidence": 7,
+    }
+
+
+def _block_range(bbox):
+    minx, miny, maxx, maxy = bbox
+    return (range(int(np.floor(miny / BLOCK_LAT)), int(np.ceil(maxy / BLOCK_LAT))),
+            range(int(np.floor(minx / BLOCK_LON)), int(np.ceil(maxx / BLOCK_LON))))
+
+
+def _id(kind, block, k=0):
+    """OSM-ID: Art (Knoten/Weg-Typ), Block ``i * 10**5 + j`` und laufende Nummer im Block."""
+    return kind * 10**13 + block * 100 + k
+
+
+def _node(nodes, node_id, lat, lon, tags=None):
+    if node_id not in nodes:
+        nodes[node_id] = {"type": "node", "id": node_id, "lat": round(lat, 7), "lon": round(lon, 7)}
+        if tags:
+            nodes[node_id]["tags"] = tags
+    return node_id
+
+
+def _corner(nodes, i, j):
+    return _node(nodes, _id(1, i * 10**5 + j), i * BLOCK_LAT, j * BLOCK_LON)
+
+
+def _rectangle(nodes, base, south, west, north, east):
+    ids = [_node(nodes, base + k, lat, lon)
+           for k, (lat, lon) in enumerate([(south, west), (south, east), (north, east), (north, west)])]
+    return ids + ids[:1]
+
+
+def city_features(bbox, wanted):
+    """Overpass-``elements`` der künstlichen Stadt in ``bbox`` für die gewünschten Tags.
+
+    ``wanted`` ist eine Menge von ``(key, value)``, ``value`` None für "beliebig".
+    """
+    keys = {k for k, _ in wanted}
+
+    def will(key, value):
+        return (key, None) in wanted or (key, value) in wanted
+
+    nodes, ways = {}, []
+    rows, cols = _block_range(bbox)
+    for i in rows:
+        for j in cols:
+            block = i * 10**5 + j
+            park = _is_park(i, j)
+            if "highway" in keys:
+                # Blockränder Süd und West als Straßenkanten, Kreuzungen als gemeinsame Knoten
+                for k, end, index in ((0, (i, j + 1), i), (1, (i + 1, j), j)):
+                    typ = "primary" if _is_primary(index) else "residential"
+                    if will("highway", typ):
+                        ways.append({"type": "way", "id": _id(1, block, k),
+                                     "nodes": [_corner(nodes, i, j), _corner(nodes, *end)],
+                                     "tags": {"highway": typ, "name": f"Straße {index}", "oneway": "no"}})
+            south, west = i * BLOCK_LAT, j * BLOCK_LON
+            if park:
+                if will("leisure", "park"):
+                    ways.append({"type": "way", "id": _id(3, block),
+                                 "nodes": _rectangle(nodes, _id(3, block),
+                                                     south + 0.0001, west + 0.00015,
+                                                     south + 0.0008, west + 0.00115),
+                                 "tags": {"leisure": "park", "name": f"Park {block}"}})
+                continue
+            if will("building", None) or will("building", "yes"):
+                for b in range(4):
+                    bi, bj = divmod(b, 2)
+                    s = south + 0.00012 + bi * 0.00036
+                    w = west + 0.00018 + bj * 0.00052
+                    levels = 2 + _hash("levels", i, j, b) % 6
+                    tags = {"building": "residential" if b % 3 else "yes", "building:levels": str(levels)}
+                    if b == 0:
+                        tags["height"] = f"{levels * 3.2:.1f}"
+                    ways.append({"type": "way", "id": _id(2, block, b),
+                                 "nodes": _rectangle(nodes, _id(2, block, b * 10),
+                                                     s, w, s + 0.0003, w + 0.00042),
+                                 "tags": tags})
+            if will("natural", "tree") and _hash("trees", i, j) % 3 == 0:
+                for t in range(4):
+                    _node(nodes, _id(4, block, t), south + 0.00003, west + (t + 0.5) * BLOCK_LON / 4,
+                          {"natural": "tree"})
+    return list(nodes.values()) + ways
+
+
+_TAG = re.compile(r"""\[['"]([\w:]+)['"](?:=['"]([^'"]+)['"])?\]""")
+_POLY = re.compile(r"""poly:['"]([-\d. ]+)['"]""")
+
+
+def parse_overpass_query(query):
+    """``(bbox, wanted)`` aus einer OSMnx-Overpass-Abfrage (Polygon als ``poly:'lat lon ...'``)."""
+    coords = [float(v) for m in _POLY.findall(query) for v in m.split()]
+    lats, lons = coords[0::2], coords[1::2]
+    bbox = (min(lons), min(lats), max(lons), max(lats)) if coords else (0, 0, 0, 0)
+    wanted = set()
+    for key, value in _TAG.findall(query):
+        if key in ("building", "leisure", "landuse", "natural", "highway"):
+            # Netzwerkfilter (highway mit Ausschlüssen) -> alle Straßen
+            wanted.add((key, value or None))
+    if "highway" in {k for k, _ in wanted} and '"highway"]' in query:
+        wanted.add(("highway", None))
+    return bbox, wanted
+
+
+def daily_temperatures(lat, lon, start, end):
+    """Tageshöchstwerte (°C) mit Jahresgang, leichtem Stadtgefälle und Rauschen."""
+    tage = np.arange(np.datetime64(start), np.datetime64(end) + 1)
+    doy = (tage - tage.astype("datetime64[Y]")).astype(int) + 1
+    zentrum = np.hypot(lat - 48.14, (lon - 11.57) * 0.67)
+    rng = np.random.default_rng(_hash("temp", round(lat, 3), round(lon, 3), start) % 2**32)
+    werte = 14 + 12 * np.sin(2 * np.pi * (doy - 110) / 365) + 2.5 * np.exp(-zentrum * 40)
+    werte += rng.normal(0, 2.0, len(tage))
+    return [str(t) for t in tage], np.round(werte, 1).tolist()
+
+
+def stac_items(base_url, cog_url, bbox, datetime_range, limit):
+    """Sentinel-2-ähnliche Items für ``bbox``; Assets zeigen auf den COG-Stand-in."""
+    from pyproj import Transformer
+
+    _, _, ende = (datetime_range or "2024-01-01/2024-12-31").partition("/")
+    jahr = int((ende or datetime_range)[:4])
+    minx, miny, maxx, maxy = bbox
+    to_utm = Transformer.from_crs(4326, 32632, always_xy=True)
+    xs, ys = to_utm.transform([minx, maxx, minx, maxx], [miny, miny, maxy, maxy])
+    # Szenenausschnitt auf das 10-m-Raster ausgerichtet, mit Rand
+    west = np.floor((min(xs) - 200) / 1000) * 1000
+    north = np.ceil((max(ys) + 200) / 1000) * 1000
+    width = int(np.ceil((max(xs) + 200 - west) / COG_RESOLUTION))
+    height = int(np.ceil((north - (min(ys) - 200)) / COG_RESOLUTION))
+    transform = [COG_RESOLUTION, 0.0, west, 0.0, -COG_RESOLUTION, north]
+    features = []
+    for k in range(min(limit, SCENES)):
+        datum = dt.datetime(jahr, 6, 15, 10, 30) + dt.timedelta(days=12 * k)
+        item_id = f"S2X_MSIL2A_{datum:%Y%m%dT%H%M%S}_{int(west)}_{int(north)}_{width}x{height}"
+        assets = {
+            band: {"href": f"{cog_url}/{item_id}/{band}.tif",
+                   "type": "image/tiff; application=geotiff; profile=cloud-optimized",
+                   "roles": ["data"], "proj:shape": [height, width], "proj:transform": transform}
+            for band in ("B02", "B03", "B04", "B08", "B11", "B12", "SCL")
+        }
+        features.append({
+            "type": "Feature", "stac_version": "1.0.0", "id": item_id, "collection": "sentinel-2-l2a",
+            "bbox": [minx, miny, maxx, maxy],
+            "geometry": {"type": "Polygon", "coordinates": [[[minx, miny], [maxx, miny], [maxx, maxy],
+                                                             [minx, maxy], [minx, miny]]]},
+            "properties": {"datetime": datum.strftime("%Y-%m-%dT%H:%M:%SZ"), "eo:cloud_cover": 2.0 + 4 * k,
+                           "proj:epsg": 32632, "s2:processing_baseline": "05.00"},
+            "assets": assets,
+            "links": [{"rel": "self", "href": f"{base_url}/collections/sentinel-2-l2a/items/{item_id}"}],
+            "stac_extensions": ["https://stac-extensions.github.io/projection/v1.1.0/schema.json"],
+        })
+    return features
+
+
+def _parse_item_id(item_id):
+    *_, west, north, size = item_id.split("_")
+    width, height = size.split("x")
+    return float(west), float(north), int(width), int(height)
+
+
+# Reflektanz (0..1) pro Band: Vegetation, Gebäude, Straße
+_REFLECTANCE = {
+    "B02": (0.03, 0.12, 0.08), "B03": (0.06, 0.13, 0.09), "B04": (0.04, 0.15, 0.10),
+    "B08": (0.40, 0.20, 0.14), "B11": (0.20, 0.28, 0.22), "B12": (0.10, 0.25, 0.20),
+}
+
+
+def render_band(item_id, band):
+    """Band einer Szene als uint16-Raster (DN = Reflektanz × 10000 + 1000) samt Transform."""
+    from pyproj import Transformer
+    from rasterio.transform import from_origin
+
+    west, north, width, height = _parse_item_id(item_id)
+    x = west + (np.arange(width) + 0.5) * COG_RESOLUTION
+    y = north - (np.arange(height) + 0.5) * COG_RESOLUTION
+    xx, yy = np.meshgrid(x, y)
+    lon, lat = Transformer.from_crs(32632, 4326, always_xy=True).transform(xx, yy)
+    i, j = np.floor(lat / BLOCK_LAT).astype(np.int64), np.floor(lon / BLOCK_LON).astype(np.int64)
+    fy, fx = lat / BLOCK_LAT - i, lon / BLOCK_LON - j
+    park = np.vectorize(_is_park)(i, j)
+    strasse = (fy < 0.1) | (fx < 0.1)
+    klasse = np.where(strasse, 2, np.where(park, 0, 1))  # 0 Vegetation, 1 Gebäude/Hof, 2 Straße
+    if band == "SCL":
+        data = np.where(klasse == 0, 4, 5).astype(np.uint16)
+        # Eine Wolke pro Szene an wechselnder Stelle
+        cy, cx = _hash("cloud", item_id) % height, _hash("cloudx", item_id) % width
+        wolke = (np.arange(height)[:, None] - cy) ** 2 + (np.arange(width)[None, :] - cx) ** 2 < 15 ** 2
+        data[wolke] = 9
+    else:
+        rng = np.random.default_rng(_hash(item_id, band) % 2**32)
+        werte = np.take(np.array(_REFLECTANCE[band]), klasse)
+        data = np.clip((werte + rng.normal(0, 0.01, klasse.shape)) * 10000 + 1000, 1, 65535).astype(np.uint16)
+    return data, from_origin(west, north, COG_RESOLUTION, COG_RESOLUTION)
+
+
+# --- HTTP ---
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_HEAD(self):
+        self._dispatch("HEAD")
+
+    def _dispatch(self, method):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(server.upstream.delay())
+        fehler = server.upstream.inject_error()
+        if fehler is not None:
+            self._send(fehler, b'{"error": "injected"}', "application/json",
+                       {"Retry-After": "1"} if fehler == 503 else None)
+            return
+        parsed = urlparse(self.path)
+        try:
+            status, payload, content_type, headers = server.app(method, parsed.path, parse_qs(parsed.query),
+                                                                body, self.headers)
+        except Exception as e:  # Fehler im Stand-in selbst als 500 melden, Server läuft weiter
+            status, payload, content_type, headers = 500, str(e).encode(), "text/plain", None
+        self._send(status, payload, content_type, headers, head=method == "HEAD")
+
+    def _send(self, status, payload, content_type, headers=None, head=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if "Content-Length" not in (headers or {}):
+            self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(payload)
+            self.server.upstream.count_bytes(len(payload))
+
+
+def _json(obj, status=200):
+    return status, json.dumps(obj).encode(), "application/json", None
+
+
+class StandIns:
+    """Startet alle Stand-ins; als Context-Manager oder mit ``start()``/``stop()``.
+
+    ``config``: ``{dienst: Upstream}``; fehlende Dienste laufen ohne Latenz und Fehler.
+    """
+
+    def __init__(self, config=None, host="localhost", cog_dir=None):
+        self.config = {name: (config or {}).get(name) or Upstream() for name in SERVICES}
+        self.host = host
+        self.cog_dir = cog_dir or tempfile.mkdtemp(prefix="frigis-cogs-")
+        self._servers = {}
+        self._cog_locks = {}
+        self._lock = threading.Lock()
+
+    def url(self, service):
+        server = self._servers[service]
+        return f"http://{self.host}:{server.server_address[1]}"
+
+    def start(self):
+        apps = {"opencage": self._opencage, "overpass": self._overpass, "open_meteo": self._open_meteo,
+                "stac": self._stac, "cog": self._cog}
+        for name in SERVICES:
+            server = ThreadingHTTPServer((self.host, 0), _Handler)
+            server.daemon_threads = True
+            server.upstream = self.config[name]
+            server.app = apps[name]
+            threading.Thread(target=server.serve_forever, name=f"standin-{name}", daemon=True).start()
+            self._servers[name] = server
+        return self
+
+    def stop(self):
+        for server in self._servers.values():
+            server.shutdown()
+            server.server_close()
+        self._servers.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def env(self):
+        """Umgebungsvariablen, die ``frigis.endpoints`` auf die Stand-ins umlenken."""
+        return {
+            "FRIGIS_OPENCAGE_URL": self.url("opencage"),
+            "FRIGIS_OVERPASS_URL": f"{self.url('overpass')}/api",
+            "FRIGIS_NOMINATIM_URL": f"{self.url('overpass')}/nominatim/",
+            "FRIGIS_OPEN_METEO_URL": f"{self.url('open_meteo')}/v1/archive",
+            "FRIGIS_STAC_URL": f"{self.url('stac')}/api/stac/v1",
+        }
+
+    def stats(self):
+        return {name: dict(upstream.stats) for name, upstream in self.config.items()}
+
+    # --- Dienste: (status, payload, content_type, headers) ---
+
+    def _opencage(self, method, path, query, body, headers):
+        if path != "/geocode/v1/json":
+            return _json({"error": "not found"}, 404)
+        q = query.get("q", [""])[0]
+        return _json({"results": [geocode(q)], "total_results": 1,
+                      "status": {"code": 200, "message": "OK"}})
+
+    def _overpass(self, method, path, query, body, headers):
+        if path.endswith("/status"):
+            text = ("Connected as: 1\nCurrent time: {}\nAnnounced endpoint: none\nRate limit: 0\n"
+                    "4 slots available now.\nCurrently running queries (pid, space limit, time limit, start time):\n"
+                    ).format(dt.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"))
+            return 200, text.encode(), "text/plain", None
+        if path.endswith("/interpreter"):
+            daten = parse_qs(body.decode()).get("data", [""])[0] or query.get("data", [""])[0]
+            bbox, wanted = parse_overpass_query(daten)
+            return _json({"version": 0.6, "generator": "frigis stand-in",
+                          "elements": city_features(bbox, wanted)})
+        if "/nominatim/" in path:
+            ort = geocode(query.get("q", [""])[0])
+            sw, ne = ort["bounds"]["southwest"], ort["bounds"]["northeast"]
+            return _json([{
+                "place_id": _hash(query.get("q")) % 10**8, "osm_type": "relation", "osm_id": 1,
+                "lat": str(ort["geometry"]["lat"]), "lon": str(ort["geometry"]["lng"]),
+                "boundingbox": [str(sw["lat"]), str(ne["lat"]), str(sw["lng"]), str(ne["lng"])],
+                "display_name": ort["formatted"], "class": "boundary", "type": "administrative",
+                "importance": 0.5,
+                "geojson": {"type": "Polygon", "coordinates": [[
+                    [sw["lng"], sw["lat"]], [ne["lng"], sw["lat"]], [ne["lng"], ne["lat"]],
+                    [sw["lng"], ne["lat"]], [sw["lng"], sw["lat"]]]]},
+            }])
+        return _json({"error": "not found"}, 404)
+
+    def _open_meteo(self, method, path, query, body, headers):
+        try:
+            lat, lon = float(query["latitude"][0]), float(query["longitude"][0])
+            start, end = query["start_date"][0], query["end_date"][0]
+        except (KeyError, ValueError):
+            return _json({"error": True, "reason": "latitude, longitude, start_date and end_date required"}, 400)
+        zeiten, werte = daily_temperatures(lat, lon, start, end)
+        return _json({"latitude": lat, "longitude": lon, "timezone": "Europe/Berlin",
+                      "daily_units": {"time": "iso8601", "temperature_2m_max": "°C"},
+                      "daily": {"time": zeiten, "temperature_2m_max": werte}})
+
+    def _stac(self, method, path, query, body, headers):
+        base = f"{self.url('stac')}/api/stac/v1"
+        if path.rstrip("/") == "/api/stac/v1":
+            return _json({
+                "type": "Catalog", "id": "frigis-standin", "stac_version": "1.0.0",
+                "description": "friGIS STAC stand-in",
+                "conformsTo": ["https://api.stacspec.org/v1.0.0/core",
+                               "https://api.stacspec.org/v1.0.0/item-search",
+                               "https://api.stacspec.org/v1.0.0/item-search#query"],
+                "links": [{"rel": "self", "href": base, "type": "application/json"},
+                          {"rel": "root", "href": base, "type": "application/json"},
+                          {"rel": "search", "href": f"{base}/search", "type": "application/geo+json",
+                           "method": "GET"},
+                          {"rel": "search", "href": f"{base}/search", "type": "application/geo+json",
+                           "method": "POST"}],
+            })
+        if path.rstrip("/") == "/api/stac/v1/search":
+            params = json.loads(body or b"{}") if method == "POST" else {
+                "bbox": [float(v) for v in query.get("bbox", ["0,0,0,0"])[0].split(",")],
+                "datetime": query.get("datetime", [None])[0],
+                "limit": int(query.get("limit", ["100"])[0])}
+            features = stac_items(base, self.url("cog"), params["bbox"], params.get("datetime"),
+                                  int(params.get("limit") or 100))
+            return _json({"type": "FeatureCollection", "features": features,
+                          "links": [{"rel": "root", "href": base}]})
+        return _json({"error": "not found"}, 404)
+
+    def _cog(self, method, path, query, body, headers):
+        teile = path.strip("/").split("/")
+        if len(teile) != 2 or not teile[1].endswith(".tif"):
+            return 404, b"", "text/plain", None
+        pfad = self._render_cog(teile[0], teile[1][:-4])
+        groesse = os.path.getsize(pfad)
+        bereich = re.match(r"bytes=(\d+)-(\d*)", headers.get("Range") or "")
+        start, ende = 0, groesse - 1
+        if bereich:
+            start = int(bereich.group(1))
+            ende = min(int(bereich.group(2) or groesse - 1), groesse - 1)
+        with open(pfad, "rb") as f:
+            f.seek(start)
+            payload = f.read(max(0, ende - start + 1)) if method != "HEAD" else b""
+        antwort = {"Accept-Ranges": "bytes"}
+        if method == "HEAD":
+            antwort["Content-Length"] = str(groesse)
+        if bereich:
+            antwort["Content-Range"] = f"bytes {start}-{ende}/{groesse}"
+            return 206, payload, "image/tiff", antwort
+        return 200, payload, "image/tiff", antwort
+
+    def _render_cog(self, item_id, band):
+        import rasterio
+
+        pfad = os.path.join(self.cog_dir, item_id, f"{band}.tif")
+        with self._lock:
+            lock = self._cog_locks.setdefault(pfad, threading.Lock())
+        with lock:
+            if not os.path.exists(pfad):
+                data, transform = render_band(item_id, band)
+                os.makedirs(os.path.dirname(pfad), exist_ok=True)
+                tmp = f"{pfad}.{threading.get_ident()}.tmp"
+                with rasterio.open(tmp, "w", driver="COG", width=data.shape[1], height=data.shape[0],
+                                   count=1, dtype=data.dtype, crs="EPSG:32632", transform=transform,
+                                   nodata=0, blocksize=256, compress="deflate") as dst:
+                    dst.write(data, 1)
+                os.replace(tmp, pfad)
+        return pfad
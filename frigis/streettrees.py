@@ -0,0 +1,101 @@
+"""Kandidaten für Straßenbäume entlang des OSMnx-Straßennetzes.
+
+Pro Straßenkante werden beidseitig (Versatz zur Fahrbahnmitte) Punkte in festem
+Abstand gesetzt, alles als Shapely-Array-Operationen ohne Python-Schleife pro
+Kante. Gefiltert wird über STRtree-Abfragen: kein Punkt auf/zu nah an einem
+Gebäude, keiner neben einem bestehenden Baum bzw. einer Baumreihe
+(``natural=tree``/``tree_row``), und zum Schluss ein Mindestabstand zwischen
+den Kandidaten (z.B. an Kreuzungen). Bewertet wird mit dem Hitze-Grid.
+"""
+import numpy as np
+import pandas as pd
+import shapely
+
+SIDE_OFFSET = 6.0  # m von der Straßenmitte zum Baumstandort
+BUILDING_CLEARANCE = 3.0  # m Mindestabstand zur Fassade
+TREE_CLEARANCE = 8.0  # m Abstand zu bestehenden Bäumen
+
+
+def street_edges(edges):
+    """Kanten eines (gerichteten) OSMnx-Graphen ohne Hin-/Rückrichtungs-Duplikate."""
+    idx = edges.index.to_frame(index=False)
+    ungerichtet = pd.DataFrame({"a": np.minimum(idx["u"], idx["v"]), "b": np.maximum(idx["u"], idx["v"]),
+                                "key": idx["key"]})
+    return edges[~ungerichtet.duplicated().to_numpy()]
+
+
+def sample_along(lines, spacing, side_offset=SIDE_OFFSET):
+    """Punkte im Abstand ``spacing`` auf beiden Seiten jeder Linie.
+
+    Gibt ``(punkte, kante)`` zurück; ``kante`` ist der Index der Ausgangslinie.
+    """
+    lines = np.asarray(lines)
+    if side_offset > 0:
+        seiten = np.concatenate([shapely.offset_curve(lines, side_offset),
+                                 shapely.offset_curve(lines, -side_offset)])
+        herkunft = np.concatenate([np.arange(len(lines))] * 2)
+    else:
+        seiten, herkunft = lines, np.arange(len(lines))
+    laengen = shapely.length(seiten)
+    anzahl = np.floor(laengen / spacing).astype(np.int64)
+    linie = np.repeat(np.arange(len(seiten)), anzahl)
+    # Position innerhalb der Linie: 0.5, 1.5, ... Abstände (nicht direkt an Kreuzungen)
+    erste = np.repeat(np.cumsum(anzahl) - anzahl, anzahl)
+    position = (np.arange(len(linie)) - erste + 0.5) * spacing
+    punkte = shapely.line_interpolate_point(seiten[linie], position)
+    return punkte, herkunft[linie]
+
+
+def remove_near(points, geometries, distance):
+    """Maske: True für Punkte, die weiter als ``distance`` von allen ``geometries`` liegen."""
+    keep = np.ones(len(points), dtype=bool)
+    if len(geometries) and len(points):
+        treffer, _ = shapely.STRtree(np.asarray(geometries)).query(points, predicate="dwithin",
+                                                                   distance=distance)
+        keep[treffer] = False
+    return keep
+
+
+def thin(points, scores, min_spacing):
+    """Gierig nach Bewertung: Indizes der Punkte mit paarweise ``>= min_spacing`` Abstand."""
+    if not len(points):
+        return np.array([], dtype=int)
+    a, b = shapely.STRtree(points).query(points, predicate="dwithin", distance=min_spacing - 1e-9)
+    paar = a != b
+    a, b = a[paar], b[paar]
+    order = np.argsort(a, kind="stable")
+    a, b = a[order], b[order]
+    starts = np.searchsorted(a, np.arange(len(points) + 1))
+    blocked = np.zeros(len(points), dtype=bool)
+    chosen = []
+    for i in np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind="stable"):
+        if blocked[i]:
+            continue
+        chosen.append(i)
+        blocked[b[starts[i]:starts[i + 1]]] = True
+    return np.array(chosen, dtype=int)
+
+
+def score_by_grid(points, cells, values):
+    """Wert der Grid-Zelle, in der jeder Punkt liegt (NaN außerhalb des Grids)."""
+    scores = np.full(len(points), np.nan)
+    if len(points):
+        punkt, zelle = shapely.STRtree(np.asarray(cells)).query(points, predicate="intersects")
+        scores[punkt] = np.asarray(values)[zelle]
+    return scores
+
+
+def street_tree_candidates(lines, buildings, trees, cells, values, spacing=12.0,
+                           min_spacing=10.0, side_offset=SIDE_OFFSET):
+    """Bewertete Baumstandorte entlang ``lines``.
+
+    Gibt ``(punkte, kante, bewertung)`` zurück, nach Bewertung absteigend.
+    """
+    punkte, kante = sample_along(lines, spacing, side_offset)
+    keep = remove_near(punkte, buildings, BUILDING_CLEARANCE) & remove_near(punkte, trees, TREE_CLEARANCE)
+    punkte, kante = punkte[keep], kante[keep]
+    bewertung = score_by_grid(punkte, cells, values)
+    im_grid = np.isfinite(bewertung)
+    punkte, kante, bewertung = punkte[im_grid], kante[im_grid], bewertung[im_grid]
+    idx = thin(punkte, bewertung, min_spacing)
+    return punkte[idx], kante[idx], bewertung[idx]